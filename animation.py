@@ -0,0 +1,304 @@
+import config
+from loader import*
+from plotloader import *
+import sirplot as sp
+
+class AnimationCanvas(Toplevel):
+
+    def __init__(self, parent, selection, size, dpi, title="Cycles"):
+
+        Toplevel.__init__(self, parent)
+        self.__parent = parent
+        self.title(title)
+        self.geometry("+%d+%d" % (parent.winfo_rootx()+250,
+                                  parent.winfo_rooty()+70))
+        body = Frame(self)
+        self.__body = body
+        self.initial_focus = self.__body
+        body.pack(padx = 5, pady= 5)
+        self.protocol("WM_DELETE_WINDOW", self.__close)
+
+        # Animation of the cycles of the runs of a plot window (selection,
+        # as VisualizationCanvas). The frames are rendered ahead in a
+        # loading thread (sirplot.CycleAnimation) and shown as images.
+        self.__selection = selection
+        self.__animation = None
+        self.__frame = 0        # frame shown, or wanted if not rendered
+        self.__shown = None     # frame of the image shown
+        self.__photo = None     # PhotoImage of the frame shown
+        self.__playing = False
+        self.__cancel = threading.Event()
+
+        self.__buttonbox(body)
+        self.__image = Label(self)
+        self.__image.pack(side=BOTTOM, fill=BOTH, expand=True)
+
+        self.__nframes = [0, 0] # frames rendered, total frames
+        self.__error = None
+        self.__exporter = None  # export thread
+        self.__exported = [0, 0] # frames written, total frames
+        self.__export_cancel = threading.Event()
+        self.__export_error = None
+        self.__worker = threading.Thread(target=self.__load, \
+                                         args=(size, dpi))
+        self.__worker.daemon = True
+        self.__worker.start()
+        self.after(50, self.__poll)
+
+
+    # -------------------------------------------------------------------
+    def __buttonbox(self, body):
+        ''' Add the Close, Play and Export buttons, cycle slider and
+        progress bar to the canvas.
+        '''
+
+        w = Button(body, text="Close", width=10, \
+                   command=self.__close)
+        w.pack(side=LEFT, padx=5, pady=5)
+
+        self.__playtext = StringVar()
+        self.__playtext.set('Play')
+        self.__playbutton = Button(body, textvariable=self.__playtext, \
+                                   width=8, command=self.__play, \
+                                   state=DISABLED)
+        self.__playbutton.pack(side=LEFT, padx=5, pady=5)
+        self.__slider = Scale(body, orient=HORIZONTAL, length=250, \
+                              from_=0, to=1, command=self.__select_frame, \
+                              state=DISABLED)
+        self.__slider.pack(side=LEFT, padx=5, pady=5)
+        self.__cyclelabel = Label(body, text='')
+        self.__cyclelabel.pack(side=LEFT, padx=5, pady=5)
+        self.__exportbutton = Button(body, text="Export...", width=10, \
+                                     command=self.__export, state=DISABLED)
+        self.__exportbutton.pack(side=LEFT, padx=5, pady=5)
+
+        self.__progressbar = Progressbar(body, orient=HORIZONTAL, \
+                                         length=150, mode='determinate')
+        self.__progressbar.pack(side=LEFT, padx=5, pady=5)
+
+        # progress bar and Cancel button of an export, shown while writing
+        self.__exportbar = Progressbar(body, orient=HORIZONTAL, \
+                                       length=150, mode='determinate')
+        self.__cancelbutton = Button(body, text="Cancel", width=10, \
+                                     command=self.__cancel_export)
+
+    # -------------------------------------------------------------------
+    def __progress(self, ndone, ntotal):
+        ''' Called from the loading thread after each file read or frame
+        rendered.
+        '''
+
+        self.__nframes = [ndone, ntotal]
+
+    # -------------------------------------------------------------------
+    def __load(self, size, dpi):
+        ''' Runs in the loading thread: reads the files of all the cycles,
+        then renders the frames, from the one shown on.
+        '''
+
+        selection = self.__selection
+        try:
+            animation = sp.CycleAnimation(selection['file_path'], \
+                                          selection['legend_names'], \
+                                          selection['stokes_chks'], \
+                                          selection['model_chks'], \
+                                          read_err=selection['read_err'], \
+                                          zscale=selection['zscale'], \
+                                          split_lines=selection['split_lines'],\
+                                          dtype=selection['dtype'], \
+                                          size=size, dpi=dpi)
+            if animation.load(workers=config.load_workers, \
+                              processes=config.load_processes, \
+                              progress=self.__progress, \
+                              cancel=self.__cancel) is None:
+                return
+            self.__animation = animation
+            animation.render(start=self.__frame, progress=self.__progress, \
+                             cancel=self.__cancel)
+        except Exception as exception:
+            self.__error = exception
+
+    # -------------------------------------------------------------------
+    def __poll(self):
+        ''' Runs in the Tk main thread: updates the progress bar and shows
+        the wanted frame once it is rendered, until the loading thread is
+        done.
+        '''
+
+        if not self.winfo_exists():
+            return
+        ndone, ntotal = self.__nframes
+        if ntotal > 0:
+            self.__progressbar.config(maximum=ntotal, value=ndone)
+        animation = self.__animation
+        if animation is not None and self.__shown is None:
+            self.__slider.config(to=len(animation.frames)-1, state=NORMAL)
+            self.__playbutton.config(state=NORMAL)
+            self.__exportbutton.config(state=NORMAL)
+        if animation is not None:
+            self.__show_frame()
+        if self.__worker.is_alive():
+            self.after(50, self.__poll)
+            return
+
+        self.__progressbar.pack_forget()
+        if self.__error is not None:
+            tkMessageBox.showerror("Animation failed", str(self.__error), \
+                                   parent=self)
+        if animation is None:
+            self.__close()
+
+    # -------------------------------------------------------------------
+    def __show_frame(self):
+        ''' Show the wanted frame, if rendered. Frames dropped from the
+        cache are rendered again in the Tk main thread.
+        '''
+
+        from PIL import Image, ImageTk
+
+        animation = self.__animation
+        k = self.__frame
+        if k == self.__shown:
+            return
+        image = animation.cached(k)
+        if image is None:
+            if self.__worker.is_alive():
+                return # shown by __poll once rendered
+            if self.__exporter is not None and self.__exporter.is_alive():
+                return # shown by __poll_export once written
+            image = animation.frame(k)
+        self.__photo = ImageTk.PhotoImage(Image.fromarray(image), master=self)
+        self.__image.config(image=self.__photo)
+        self.__cyclelabel.config(text='Cycle {0}'.format(animation.cycles[k]))
+        self.__shown = k
+
+    # -------------------------------------------------------------------
+    def __select_frame(self, value):
+        ''' Show the frame of the slider.
+        '''
+
+        self.__frame = int(round(float(value)))
+        if self.__animation is not None:
+            self.__show_frame()
+
+    # -------------------------------------------------------------------
+    def __play(self):
+        ''' Start or stop stepping through the cycles.
+        '''
+
+        self.__playing = not self.__playing
+        self.__playtext.set('Pause' if self.__playing else 'Play')
+        if self.__playing:
+            self.__step()
+
+    # -------------------------------------------------------------------
+    def __step(self):
+        ''' Show the next frame, once the current one is shown, every
+        1/config.animation_fps s while playing.
+        '''
+
+        if not self.winfo_exists() or not self.__playing:
+            return
+        if self.__shown == self.__frame: # not waiting for a frame
+            self.__slider.set((self.__frame+1) % \
+                              len(self.__animation.frames))
+        self.after(int(1000./config.animation_fps), self.__step)
+
+    # -------------------------------------------------------------------
+    def __export(self):
+        ''' Write the animation to a GIF or MP4 file, in an export thread.
+        '''
+
+        filename = tkFileDialog.asksaveasfilename(parent=self, \
+                                    defaultextension='.gif', \
+                                    filetypes=(("GIF", "*.gif"), \
+                                               ("MP4 (ffmpeg)", "*.mp4")))
+        if not filename:
+            return
+        if self.__playing:
+            self.__play()
+        self.__exportbutton.config(state=DISABLED)
+        self.__exportbar.config(value=0)
+        self.__exportbar.pack(side=LEFT, padx=5, pady=5)
+        self.__cancelbutton.config(state=NORMAL)
+        self.__cancelbutton.pack(side=LEFT, padx=5, pady=5)
+
+        self.__exported = [0, 0]
+        self.__export_error = None
+        self.__export_cancel = threading.Event()
+        self.__exporter = threading.Thread(target=self.__write, \
+                                           args=(filename, \
+                                                 config.animation_fps, \
+                                                 self.__export_cancel))
+        self.__exporter.daemon = True
+        self.__exporter.start()
+        self.after(50, self.__poll_export)
+
+    # -------------------------------------------------------------------
+    def __export_progress(self, ndone, ntotal):
+        ''' Called from the export thread after each frame written.
+        '''
+
+        self.__exported = [ndone, ntotal]
+
+    # -------------------------------------------------------------------
+    def __write(self, filename, fps, cancel):
+        ''' Runs in the export thread: writes the frames to filename. The
+        file is removed if the export is cancelled.
+        '''
+
+        try:
+            self.__animation.export(filename, fps=fps, \
+                                    progress=self.__export_progress, \
+                                    cancel=cancel)
+        except Exception as exception:
+            if not cancel.is_set():
+                self.__export_error = exception
+        if cancel.is_set() and os.path.exists(filename):
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
+    # -------------------------------------------------------------------
+    def __poll_export(self):
+        ''' Runs in the Tk main thread: updates the progress bar of the
+        export until the export thread is done.
+        '''
+
+        if not self.winfo_exists():
+            return
+        ndone, ntotal = self.__exported
+        if ntotal > 0:
+            self.__exportbar.config(maximum=ntotal, value=ndone)
+        if self.__exporter.is_alive():
+            self.after(50, self.__poll_export)
+            return
+
+        self.__exportbar.pack_forget()
+        self.__cancelbutton.pack_forget()
+        self.__exportbutton.config(state=NORMAL)
+        if self.__export_error is not None:
+            tkMessageBox.showerror("Export failed", \
+                                   str(self.__export_error), parent=self)
+        self.__show_frame()
+
+    # -------------------------------------------------------------------
+    def __cancel_export(self):
+        ''' Stop the export; the file is not kept.
+        '''
+
+        self.__export_cancel.set()
+        self.__cancelbutton.config(state=DISABLED)
+
+    def __close(self, event=None):
+        ''' Method that handles the window closing.
+        '''
+
+        # stop the loading and export threads, put focus back to the
+        # parent window
+        self.__playing = False
+        self.__cancel.set()
+        self.__export_cancel.set()
+        self.__parent.focus_set()
+        self.destroy()
@@ -0,0 +1,1167 @@
+"""
+Benchmarks for the SIR GUI reading, writing and plotting routines.
+
+Call:
+    python benchmarks.py            # runs every benchmark
+    python benchmarks.py readers    # runs only the named benchmark(s)
+
+Synthetic SIR files are written to a temporary directory that is removed at
+the end of each benchmark. Timings are the best of a few repetitions.
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+import numpy as np
+
+import sirtools2 as st
+
+
+def best_of(func, repeat=3):
+    # Best wall-clock time (s) of several calls to func()
+    times = []
+    for k in range(0, repeat):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    return(min(times))
+
+def synthetic_model(ndepth, zcols=True):
+    # Returns the readmod-style tuple of a synthetic model atmosphere
+    tau = np.linspace(1.4, -4.0, ndepth)
+    temp = 4000. + 3000.*np.exp(tau)
+    Pe = 10.**(tau+1.)
+    vmic = np.full(ndepth, 1.e5)
+    B = 1000.*np.exp(tau/2.)
+    vlos = 2.e5*np.sin(tau)
+    gamma = np.full(ndepth, 45.)
+    phi = np.full(ndepth, 30.)
+    if zcols:
+        z = -100.*tau
+        rho = 1.e-7*np.exp(tau)
+        Pg = 1.e5*np.exp(tau)
+    else:
+        z, rho, Pg = None, None, None
+    return(tau, temp, Pe, vmic, B, vlos, gamma, phi, 1.0, 1.0, 0.0, z, rho, Pg)
+
+def synthetic_profile(nwav, nlines=1):
+    # Returns the readpro-style tuple of a synthetic Stokes profile
+    line_ind = np.repeat(np.arange(1, nlines+1), nwav//nlines).astype(float)
+    wvlen = np.tile(np.linspace(-500., 500., nwav//nlines), nlines)
+    core = np.exp(-(wvlen/100.)**2)
+    StkI = 1. - 0.6*core
+    StkQ = 0.01*core
+    StkU = -0.01*core
+    StkV = 0.1*np.gradient(core)
+    return(line_ind, wvlen, StkI, StkQ, StkU, StkV)
+
+# ---------------------------------------------------------------------------
+
+def _legacy_readpro(filename):
+    # Line by line reader used before the bulk parser, kept as reference
+    cols = [[], [], [], [], [], []]
+    f = open(filename, 'r')
+    for line in f:
+        data = line.split()
+        for k in range(0, 6):
+            cols[k].append(float(data[k]))
+    f.close()
+    return([np.array(c) for c in cols])
+
+def _legacy_readmod(filename):
+    # Line by line reader used before the bulk parser, kept as reference
+    f = open(filename)
+    vmac, ff, stray = [float(x) for x in f.readline().split()]
+    cols = [[] for k in range(0, 11)]
+    for line in f:
+        data = line.split()
+        for k in range(0, len(data)):
+            cols[k].append(float(data[k]))
+    f.close()
+    return([np.array(c) for c in cols])
+
+def bench_readers(sizes=(10**4, 10**5, 10**6)):
+    """ Bulk readpro/readmod against the former line by line parser. """
+
+    tmpdir = tempfile.mkdtemp()
+    print('%10s %12s %12s %12s %8s' % ('rows', 'file', 'legacy (s)',
+                                       'bulk (s)', 'speedup'))
+    try:
+        for n in sizes:
+            modfile = os.path.join(tmpdir, 'bench.mod')
+            perfile = os.path.join(tmpdir, 'bench.per')
+            st.writemod(modfile, *synthetic_model(n)[0:11],
+                        z=-100.*np.linspace(1.4, -4.0, n),
+                        rho=np.ones(n), Pg=np.ones(n))
+            st.writepro(perfile, *synthetic_profile(n))
+            repeat = 3 if n < 10**6 else 1
+            for name, legacy, bulk in \
+              (('.mod', _legacy_readmod, st.readmod),
+               ('.per', _legacy_readpro, st.readpro)):
+                path = modfile if name == '.mod' else perfile
+                t_old = best_of(lambda: legacy(path), repeat)
+                t_new = best_of(lambda: bulk(path), repeat)
+                print('%10d %12s %12.4f %12.4f %8.1f' %
+                      (n, name, t_old, t_new, t_old/t_new))
+    finally:
+        shutil.rmtree(tmpdir)
+
+# ---------------------------------------------------------------------------
+
+def _legacy_writemod(filename, tau, temp, Pe, vmic, B, vlos, gamma, phi,
+                     vmac, ff, stray):
+    # Writer with one str.format and write call per depth point (reference)
+    f = open(filename, "w+")
+    f.write('  {0:> 10.8f}      {1:> 10.8f}      {2:> 10.8f} \n'.format(
+        vmac, ff, stray))
+    for k in range(0, len(tau)):
+        f.write(' {0:> 7.4f}  {1:> 6.1f} {2:> 8.5E} {3:> 5.3E} {4:> 6.4E} '
+                '{5:> 6.4E} {6:> 6.4E} {7:> 6.4E} \n'.format(
+                    tau[k], temp[k], Pe[k], vmic[k], B[k], vlos[k],
+                    gamma[k], phi[k]))
+    f.close()
+
+def bench_writers(nfiles=1000, ndepth=75):
+    """ Writing many initial-guess models: per-row writer, buffered
+    writemod and the multi-file writemods. """
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        model = synthetic_model(ndepth, zcols=False)[0:11]
+        names = [os.path.join(tmpdir, 'guess_%d.mod' % jj)
+                 for jj in range(0, nfiles)]
+        stacked = [np.tile(x, (nfiles, 1)) for x in model[1:8]]
+
+        def legacy():
+            for name in names:
+                _legacy_writemod(name, *model)
+        def single():
+            for name in names:
+                st.writemod(name, *model)
+        def multi():
+            st.writemods(names, model[0], *(stacked + list(model[8:11])))
+
+        t_old = best_of(legacy)
+        print('%d models x %d depths' % (nfiles, ndepth))
+        print('%20s %10.4f s' % ('per-row writer', t_old))
+        for label, func in (('writemod', single), ('writemods', multi)):
+            t_new = best_of(func)
+            print('%20s %10.4f s  (%.1fx)' % (label, t_new, t_old/t_new))
+    finally:
+        shutil.rmtree(tmpdir)
+
+# ---------------------------------------------------------------------------
+
+def bench_cache(sizes=(10**3, 10**4, 10**5), nfiles=20):
+    """ Opening files without cache, with an empty (cold) binary cache and
+    with a populated (warm) cache. """
+
+    tmpdir = tempfile.mkdtemp()
+    cachedir = os.path.join(tmpdir, 'cache')
+    print('%10s %12s %12s %12s %8s' % ('rows', 'no cache', 'cold (s)',
+                                       'warm (s)', 'speedup'))
+    try:
+        for n in sizes:
+            names = []
+            for jj in range(0, nfiles):
+                names.append(os.path.join(tmpdir, 'run%d_%d.mod' % (n, jj)))
+                st.writemod(names[-1], *synthetic_model(n, zcols=False)[0:11])
+
+            def read_all():
+                for name in names:
+                    st.readmod(name)
+
+            st.set_cache(None)
+            t_plain = best_of(read_all)
+            st.set_cache(cachedir)
+            st.clear_cache()
+            t_cold = best_of(read_all, repeat=1)
+            t_warm = best_of(read_all)
+            st.set_cache(None)
+            print('%10d %12.4f %12.4f %12.4f %8.1f' %
+                  (n, t_plain, t_cold, t_warm, t_plain/t_warm))
+    finally:
+        st.set_cache(None)
+        shutil.rmtree(tmpdir)
+
+def bench_memory(nfiles=200, ndepth=10**4):
+    """ Reloading the same selection (as on a second Plot click) with and
+    without the in-memory LRU store. """
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        names = []
+        for jj in range(0, nfiles):
+            names.append(os.path.join(tmpdir, 'run_%d.mod' % jj))
+            st.writemod(names[-1], *synthetic_model(ndepth, zcols=False)[0:11])
+
+        def read_all():
+            for name in names:
+                st.readmod(name)
+
+        st.set_memory_cache(0)
+        t_plain = best_of(read_all)
+        st.set_memory_cache(2**30)
+        st.clear_memory_cache()
+        read_all()
+        t_warm = best_of(read_all)
+        info = st.memory_cache_info()
+        st.set_memory_cache(0)
+        st.clear_memory_cache()
+        print('%d files x %d depths' % (nfiles, ndepth))
+        print('%20s %10.4f s' % ('no store', t_plain))
+        print('%20s %10.4f s  (%.0fx)' % ('warm store', t_warm,
+                                          t_plain/t_warm))
+        print('%20s %d hits, %d misses, %.1f MB' %
+              ('', info['hits'], info['misses'], info['nbytes']/2.**20))
+    finally:
+        shutil.rmtree(tmpdir)
+
+def bench_parallel(nfiles=64, ndepth=10**4, workers=(1, 2, 4, 8)):
+    """ Scaling of readfiles with the number of thread and process
+    workers. """
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        names = []
+        for jj in range(0, nfiles):
+            names.append(os.path.join(tmpdir, 'run_%d.mod' % jj))
+            st.writemod(names[-1], *synthetic_model(ndepth, zcols=False)[0:11])
+
+        t_serial = best_of(lambda: [st.readmod(name) for name in names])
+        print('%d files x %d depths, %d CPUs' % (nfiles, ndepth,
+                                                 os.cpu_count()))
+        print('%10s %8s %10s %8s' % ('pool', 'workers', 'time (s)',
+                                     'speedup'))
+        print('%10s %8d %10.4f %8.2f' % ('serial', 1, t_serial, 1.))
+        for processes in (False, True):
+            for nworkers in workers:
+                t = best_of(lambda: st.readfiles(names, workers=nworkers,
+                                                 processes=processes))
+                print('%10s %8d %10.4f %8.2f' %
+                      ('process' if processes else 'thread', nworkers, t,
+                       t_serial/t))
+    finally:
+        shutil.rmtree(tmpdir)
+
+def _importtime(module):
+    # Runs 'python -X importtime -c "import module"' and returns the total
+    # import time (s) and the set of top level packages imported
+    import subprocess
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                           'import '+module],
+                          cwd=os.path.dirname(os.path.abspath(__file__)),
+                          stderr=subprocess.PIPE, universal_newlines=True)
+    total = 0
+    packages = set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative, name = line[len('import time:'):].split('|')
+        total += int(self_us)
+        packages.add(name.strip().split('.')[0])
+    return(total/1.e6, packages)
+
+def bench_startup():
+    """ Import time of the GUI main window and of sirtools2 (python -X
+    importtime). Fails if the heavy packages are imported too early. """
+
+    forbidden = {'sirtools2': ('numpy', 'matplotlib', 'tkinter'),
+                 'sirgui': ('matplotlib',),
+                 'visualization': ()}
+    failed = False
+    print('%16s %10s  %s' % ('module', 'time (s)', 'heavy packages'))
+    for module in ('sirtools2', 'sirgui', 'visualization'):
+        total, packages = _importtime(module)
+        heavy = sorted(packages & {'numpy', 'matplotlib', 'tkinter'})
+        print('%16s %10.3f  %s' % (module, total, ', '.join(heavy) or '-'))
+        for name in forbidden[module]:
+            if name in packages:
+                print('REGRESSION: importing %s imports %s' % (module, name))
+                failed = True
+    if failed:
+        raise SystemExit(1)
+
+def _write_runs(tmpdir, nruns, ndepth=75, nwav=300, errors=False):
+    # Writes nruns synthetic runs (.per, .mod and optionally .err) and
+    # returns their names
+    names = []
+    for jj in range(0, nruns):
+        names.append('run_%d' % jj)
+        base = os.path.join(tmpdir, names[-1])
+        model = list(synthetic_model(ndepth))
+        model[1] = model[1]*(1.+0.01*jj)
+        st.writemod(base+'.mod', *model[0:11], z=model[11], rho=model[12],
+                    Pg=model[13])
+        if errors:
+            st.writemod(base+'.err', *[0.05*np.abs(x) for x in model[0:8]],
+                        1., 1., 0., z=model[11], rho=model[12], Pg=model[13])
+        st.writepro(base+'.per', *synthetic_profile(nwav))
+    return(names)
+
+def bench_redraw(nruns=10):
+    """ Interactive redraw after a z/tau toggle or a re-plot with the same
+    selection: full figure rebuild against in-place FigureModel updates. """
+
+    import matplotlib
+    matplotlib.use('Agg')
+    import sirplot as sp
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        names = _write_runs(tmpdir, nruns)
+        stokes_chks = [1, 1, 1, 1]
+        model_chks = [1, 0, 0, 1, 1, 1, 1]
+        data = sp.load_runs(names, tmpdir+'/', [1]*nruns, [1]*nruns)
+        state = {'zscale': False}
+
+        def rebuild():
+            state['zscale'] = not state['zscale']
+            fig = sp.build_figure(data, names, stokes_chks, model_chks,
+                                  zscale=state['zscale'])
+            fig.canvas.draw()
+
+        model = sp.FigureModel()
+        model.update(data, names, stokes_chks, model_chks)
+        model.figure.canvas.draw()
+
+        def toggle():
+            state['zscale'] = not state['zscale']
+            # limits change: the whole figure is drawn (draw_idle only
+            # schedules it on interactive canvases)
+            model.set_zscale(state['zscale'])
+            model.figure.canvas.draw()
+
+        def same_selection():
+            # same data: nothing to draw
+            model.redraw(model.update(data, names, stokes_chks, model_chks,
+                                      zscale=state['zscale']))
+
+        def one_run_changed():
+            # new data for one run (e.g. a new inversion cycle): only the
+            # changed axes are drawn again and blitted
+            for k in range(0, 4):
+                data['Stokes'][0][k] = data['Stokes'][0][k] * 1.
+            model.redraw(model.update(data, names, stokes_chks, model_chks,
+                                      zscale=state['zscale']))
+
+        t_full = best_of(rebuild, 5)
+        print('%d runs, 11 panels' % nruns)
+        print('%28s %10.4f s' % ('full rebuild + draw', t_full))
+        for label, func in (('in-place z/tau toggle', toggle),
+                            ('re-plot, same data', same_selection),
+                            ('re-plot, one .per changed', one_run_changed)):
+            t = best_of(func, 5)
+            print('%28s %10.4f s  (%.1fx)' % (label, t, t_full/t))
+    finally:
+        shutil.rmtree(tmpdir)
+
+def bench_lod(sizes=(10**4, 10**5, 10**6)):
+    """ Drawing and zooming a long Stokes profile with every sample against
+    the min/max decimated curve of the figure model. """
+
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    import sirplot as sp
+
+    print('%10s %14s %14s %14s %14s' % ('samples', 'full draw', 'lod draw',
+                                        'full zoom', 'lod zoom'))
+    for n in sizes:
+        x = np.arange(n, dtype=float)
+        y = np.sin(x/50.) + 0.1*np.random.randn(n)
+        data = {'Stokes': [[y, y, y, y]], 'Models': [], 'Errors': [],
+                'ErrorFileMask': [0], 'ErrorIndex': [None],
+                'per_mask': [1], 'mod_mask': [0],
+                'is_z': True, 'failures': [],
+                'lower_limits': [0.]*11, 'upper_limits': [1.]*11}
+
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot(111)
+        ax.plot(x, y, linewidth=0.9)
+        model = sp.FigureModel()
+        model.update(data, ['run'], [1, 0, 0, 0], [0]*7)
+        axlod = model.axes[('stokes', 0)]
+
+        def zoom(canvas, axes):
+            axes.set_xlim(n*0.4, n*0.6)
+            canvas.draw()
+            axes.set_xlim(0, n)
+
+        print('%10d %14.4f %14.4f %14.4f %14.4f' %
+              (n, best_of(fig.canvas.draw), best_of(model.figure.canvas.draw),
+               best_of(lambda: zoom(fig.canvas, ax)),
+               best_of(lambda: zoom(model.figure.canvas, axlod))))
+
+def bench_collection(nruns=(11, 100, 500)):
+    """ Building and drawing a figure with many overlaid runs: one Line2D
+    per run and panel against one LineCollection per panel. """
+
+    import matplotlib
+    matplotlib.use('Agg')
+    import config
+    import sirplot as sp
+
+    stokes_chks = [1, 1, 1, 1]
+    model_chks = [1, 0, 0, 1, 1, 1, 1]
+    print('%8s %16s %16s %16s %16s' % ('runs', 'lines build', 'lines draw',
+                                       'collection build', 'collection draw'))
+    tmpdir = tempfile.mkdtemp()
+    mode = config.plot_mode
+    try:
+        names = _write_runs(tmpdir, max(nruns))
+        for n in nruns:
+            data = sp.load_runs(names[:n], tmpdir+'/', [1]*n, [1]*n)
+            times = []
+            for config.plot_mode in ('lines', 'collection'):
+                state = {}
+
+                def build():
+                    state['model'] = sp.FigureModel()
+                    state['model'].update(data, names[:n], stokes_chks,
+                                          model_chks)
+                times.append(best_of(build))
+                times.append(best_of(state['model'].figure.canvas.draw))
+            print('%8d %16.4f %16.4f %16.4f %16.4f' % tuple([n] + times))
+    finally:
+        config.plot_mode = mode
+        shutil.rmtree(tmpdir)
+
+def bench_errors(nruns=(5, 20, 50), ndepth=1000):
+    """ Building and drawing the model panels with the errors of the .err
+    files: errorbar against shaded error bands. """
+
+    import matplotlib
+    matplotlib.use('Agg')
+    import config
+    import sirplot as sp
+
+    stokes_chks = [0, 0, 0, 0]
+    model_chks = [1, 0, 0, 1, 1, 1, 1]
+    print('%d depth points' % ndepth)
+    print('%8s %14s %14s %14s %14s' % ('runs', 'bars build', 'bars draw',
+                                       'band build', 'band draw'))
+    tmpdir = tempfile.mkdtemp()
+    style = config.error_style
+    try:
+        names = _write_runs(tmpdir, max(nruns), ndepth=ndepth, errors=True)
+        for n in nruns:
+            data = sp.load_runs(names[:n], tmpdir+'/', [0]*n, [1]*n,
+                                read_err=True)
+            times = []
+            for config.error_style in ('bars', 'band'):
+                state = {}
+
+                def build():
+                    state['model'] = sp.FigureModel()
+                    state['model'].update(data, names[:n], stokes_chks,
+                                          model_chks, read_err=True)
+                times.append(best_of(build))
+                times.append(best_of(state['model'].figure.canvas.draw))
+            print('%8d %14.4f %14.4f %14.4f %14.4f' % tuple([n] + times))
+    finally:
+        config.error_style = style
+        shutil.rmtree(tmpdir)
+
+def bench_aggregate(nruns=(100, 1000), chunk=64):
+    """ Showing a large ensemble of runs: overlay of every curve against
+    the streamed percentile summary (time to load + build + draw, and peak
+    memory allocated while loading). """
+
+    import tracemalloc
+    import matplotlib
+    matplotlib.use('Agg')
+    import config
+    import sirplot as sp
+
+    stokes_chks = [1, 1, 1, 1]
+    model_chks = [1, 0, 0, 1, 1, 1, 1]
+    print('%8s %14s %14s %14s %14s' % ('runs', 'overlay (s)', 'overlay (MB)',
+                                       'summary (s)', 'summary (MB)'))
+    tmpdir = tempfile.mkdtemp()
+    memory = config.memory_cache_bytes
+    try:
+        names = _write_runs(tmpdir, max(nruns))
+        st.set_memory_cache(0) # every file is parsed each time
+        for n in nruns:
+            row = [n]
+            for load in (lambda: sp.load_runs(names[:n], tmpdir+'/',
+                                              [1]*n, [1]*n),
+                         lambda: sp.aggregate_runs(names[:n], tmpdir+'/',
+                                                   [1]*n, [1]*n, chunk=chunk)):
+                def plot():
+                    model = sp.FigureModel()
+                    model.update(load(), names[:n], stokes_chks, model_chks)
+                    model.figure.canvas.draw()
+                row.append(best_of(plot, 1))
+                tracemalloc.start()
+                load()
+                row.append(tracemalloc.get_traced_memory()[1]/2.**20)
+                tracemalloc.stop()
+            print('%8d %14.3f %14.1f %14.3f %14.1f' % tuple(row))
+    finally:
+        st.set_memory_cache(memory)
+        shutil.rmtree(tmpdir)
+
+def bench_resample(nfiles=(100, 1000, 10000), nparams=11):
+    """ Models with different depth grids onto a common log(tau) grid:
+    np.interp for every model and parameter against st.resample. """
+
+    print('%8s %14s %14s' % ('models', 'np.interp', 'resample'))
+    for n in nfiles:
+        models = []
+        for jj in range(0, n):
+            ndepth = 50 + jj % 50
+            tau = np.linspace(1.4 - 0.001*(jj % 100), -4., ndepth)
+            models.append([tau] + [np.cos(tau*kk) for kk in
+                                   range(1, nparams)])
+        grid = np.linspace(1.4, -4., 75)
+
+        def loop():
+            cube = np.empty((n, nparams, len(grid)))
+            for jj in range(0, n):
+                for kk in range(0, nparams):
+                    cube[jj, kk] = np.interp(grid, models[jj][0][::-1],
+                                             models[jj][kk][::-1],
+                                             left=np.nan, right=np.nan)
+            return(cube)
+        print('%8d %14.4f %14.4f' % (n, best_of(loop),
+              best_of(lambda: st.resample(models, grid=grid))))
+
+def _legacy_limits(Models):
+    # Default figure limits as computed before per-file stats: one array
+    # with every model, reduced column by column
+    model_array = np.array(Models)
+    return([model_array[:, jj].min()*0.9 for jj in range(0, 11)],
+           [model_array[:, jj].max()*1.1 for jj in range(0, 11)])
+
+def bench_limits(nfiles=200, ndepth=10**4):
+    """ Default axis limits of a set of models already read: a stacked
+    array of all the models against merging the per-file stats. """
+
+    import tracemalloc
+    import sirplot as sp
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        names = []
+        model = list(synthetic_model(ndepth))
+        for jj in range(0, nfiles):
+            names.append('run_%d' % jj)
+            st.writemod(os.path.join(tmpdir, names[-1]+'.mod'), *model[0:11],
+                        z=model[11], rho=model[12], Pg=model[13])
+        data = sp.load_runs(names, tmpdir+'/', [0]*nfiles, [1]*nfiles)
+        models = data['Models']
+        filenames = [os.path.join(tmpdir, name+'.mod') for name in names]
+        columns = [0, 1, 2, 3, 4, 5, 6, 7, 11, 12, 13]
+
+        def merge():
+            lower = np.full(11, np.inf)
+            upper = np.full(11, -np.inf)
+            for filename in filenames:
+                lo, hi = st.filestats(filename)
+                lower = np.fmin(lower, lo[columns])
+                upper = np.fmax(upper, hi[columns])
+            return(lower, upper)
+
+        print('%d models of %d depth points (%.1f MB)' %
+              (nfiles, ndepth, 11*8.*nfiles*ndepth/2.**20))
+        for label, func in (('np.array(Models)', lambda: _legacy_limits(models)),
+                            ('per-file stats', merge)):
+            t = best_of(func)
+            tracemalloc.start()
+            func()
+            peak = tracemalloc.get_traced_memory()[1]/2.**20
+            tracemalloc.stop()
+            print('%20s %10.4f s %10.1f MB peak' % (label, t, peak))
+    finally:
+        shutil.rmtree(tmpdir)
+
+def _legacy_loadmodel(filename):
+    # What the plot window kept of a model before the Model container: the
+    # 14-tuple of readmod, with zero-filled z, rho, Pg for 8 column models,
+    # and scaled copies of T, vmic, B, vlos and z
+    block = st._parseblock(filename, skiprows=1)[1]
+    columns = list(block[0:8])
+    if block.shape[0] == 11:
+        columns += list(block[8:11])
+    else:
+        columns += [np.zeros(block.shape[1]) for k in range(0, 3)]
+    tau, temp, Pe, vmic, B, vlos, gamma, phi, z, rho, Pg = columns
+    return([tau, temp/1e3, Pe, vmic/1e5, B/1e3, vlos/1e5, gamma, phi,
+            z/1e3, rho, Pg])
+
+def _loadmodel(filename):
+    # Model container with its columns in the units of the plots
+    model = st.readmod(filename)
+    model.scaled()
+    return(model)
+
+def bench_containers(nfiles=200, ndepth=75):
+    """ Memory kept per loaded model: the former tuple with scaled
+    copies against the Model container and its scaled block. """
+
+    import tracemalloc
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        model = list(synthetic_model(ndepth))
+        filenames = {}
+        for ncol in (8, 11):
+            filenames[ncol] = []
+            for jj in range(0, nfiles):
+                filenames[ncol].append(os.path.join(tmpdir, '%d_%d.mod' %
+                                                    (ncol, jj)))
+                if ncol == 11:
+                    st.writemod(filenames[ncol][-1], *model[0:11],
+                                z=model[11], rho=model[12], Pg=model[13])
+                else:
+                    st.writemod(filenames[ncol][-1], *model[0:11])
+
+        print('%d depth points, bytes kept per model' % ndepth)
+        print('%10s %14s %14s' % ('columns', 'tuple', 'Model'))
+        for ncol in (8, 11):
+            sizes = []
+            for load in (_legacy_loadmodel, _loadmodel):
+                tracemalloc.start()
+                kept = [load(name) for name in filenames[ncol]]
+                sizes.append(tracemalloc.get_traced_memory()[0]/
+                             float(nfiles))
+                tracemalloc.stop()
+                del kept
+            print('%10d %14.0f %14.0f' % (ncol, sizes[0], sizes[1]))
+    finally:
+        shutil.rmtree(tmpdir)
+
+def _rss_load(tmpdir, nruns, dtype):
+    # Runs in a fresh interpreter: resident memory (MB) added by loading
+    # the runs with load_runs (data kept in the in-memory store)
+    import sirplot as sp
+
+    def rss():
+        f = open('/proc/self/status')
+        kb = [int(line.split()[1]) for line in f if line.startswith('VmRSS')]
+        f.close()
+        return(kb[0]/1024.)
+
+    st.set_memory_cache(2**34)
+    names = ['run_%d' % jj for jj in range(0, nruns)]
+    sp.load_runs(names[0:1], tmpdir+'/', [1], [1], dtype=dtype) # warm up
+    before = rss()
+    t = time.time()
+    data = sp.load_runs(names, tmpdir+'/', [1]*nruns, [1]*nruns, dtype=dtype)
+    t = time.time() - t
+    if len(data['failures']) > 0: # the memory of missing runs is not added
+        print('REGRESSION: %d files not read, as %s: %s' %
+              ((len(data['failures']),) + data['failures'][0]))
+        raise SystemExit(1)
+    return(rss() - before, t)
+
+def bench_precision(nruns=500, ndepth=1000, nwav=1000):
+    """ Resident memory of a loaded selection in float64 and float32
+    (config.load_dtype). """
+
+    import subprocess
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        _write_runs(tmpdir, nruns, ndepth=ndepth, nwav=nwav)
+        print('%d runs, %d depth points, %d wavelengths' %
+              (nruns, ndepth, nwav))
+        print('%10s %14s %10s' % ('dtype', 'RSS added', 'load'))
+        for dtype in ('float64', 'float32'):
+            out = subprocess.check_output([sys.executable, '-c',
+                'import benchmarks; print("%%f %%f" %% '
+                'benchmarks._rss_load(%r, %d, %r))' % (tmpdir, nruns, dtype)],
+                cwd=os.path.dirname(os.path.abspath(__file__)))
+            mb, t = [float(x) for x in out.split()]
+            print('%10s %11.1f MB %8.3f s' % (dtype, mb, t))
+    finally:
+        shutil.rmtree(tmpdir)
+
+def bench_grids(nfiles=500, nwav=(300, 10**4)):
+    """ Profiles of one inversion setup: memory kept per profile with a
+    line_ind and wvlen copy per file against grids shared by
+    st.intern_grid, and the time to find whether all share a grid. """
+
+    import tracemalloc
+
+    print('%8s %16s %16s %14s %14s' % ('nwav', 'per-file grids',
+                                       'shared grids', 'array_equal',
+                                       'identity'))
+    for n in nwav:
+        tmpdir = tempfile.mkdtemp()
+        try:
+            profile = synthetic_profile(n)
+            filenames = [os.path.join(tmpdir, 'run_%d.per' % jj)
+                         for jj in range(0, nfiles)]
+            st.writepros(filenames, *profile)
+            sizes = []
+            shared = lambda name: st.readpro(name, share_grids=True)
+            for load in (lambda name: st._parseblock(name)[1], shared):
+                tracemalloc.start()
+                kept = [load(name) for name in filenames]
+                sizes.append(tracemalloc.get_traced_memory()[0]/
+                             float(nfiles))
+                tracemalloc.stop()
+                if load is shared:
+                    profiles = kept
+                del kept
+            blocks = [st._parseblock(name)[1] for name in filenames]
+            t_equal = best_of(lambda: all([np.array_equal(block[1],
+                              blocks[0][1]) for block in blocks]))
+            t_same = best_of(lambda: all([p.wvlen is profiles[0].wvlen
+                                          for p in profiles]))
+            print('%8d %14.0f B %14.0f B %14.6f %14.6f' %
+                  (n, sizes[0], sizes[1], t_equal, t_same))
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+def bench_lines(nfiles=200, nwav=4000, nlines=(2, 8, 32)):
+    """ Columns of every spectral line of every profile, as needed to draw
+    the per-line Stokes panels: a boolean mask of line_ind per line (as
+    done by hand before) against the views of st.Profile.line. """
+
+    print('%8s %14s %14s %14s' % ('nlines', 'masks', 'index (1st)',
+                                  'index (cached)'))
+    for n in nlines:
+        tmpdir = tempfile.mkdtemp()
+        try:
+            profile = synthetic_profile(nwav, n)
+            filenames = [os.path.join(tmpdir, 'run_%d.per' % jj)
+                         for jj in range(0, nfiles)]
+            st.writepros(filenames, *profile)
+            profiles = [st.readpro(name) for name in filenames]
+            def masks():
+                for p in profiles:
+                    line_ind = p.line_ind
+                    for line in np.unique(line_ind):
+                        mask = (line_ind == line)
+                        [column[mask] for column in p]
+            def index():
+                for p in profiles:
+                    for line in p.lines:
+                        p.line(line)
+            t_masks = best_of(masks)
+            def first():
+                for p in profiles:
+                    p._lines.clear()
+                index()
+            t_first = best_of(first)
+            t_cached = best_of(index)
+            print('%8d %12.4f s %12.4f s %12.4f s' %
+                  (n, t_masks, t_first, t_cached))
+        finally:
+            st.clear_memory_cache()
+            shutil.rmtree(tmpdir)
+
+
+def bench_map(ny=40, nx=40, ndepth=75):
+    """ Raster map of ny*nx pixel models: a loop over readmod into a
+    nested list turned into an array, against st.readmap in memory and
+    memory-mapped, and a readmap resumed from a checkpoint at half the
+    map. """
+
+    import threading
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        names = [os.path.join(tmpdir, 'pix_%04d_%04d.mod' % (y, x))
+                 for y in range(0, ny) for x in range(0, nx)]
+        st.writemods(names, *synthetic_model(ndepth))
+        out = os.path.join(tmpdir, 'cube')
+
+        def loop():
+            rows = []
+            for y in range(0, ny):
+                rows.append([np.array(st.readmod(names[y*nx+x])[0:8]).T
+                             for x in range(0, nx)])
+            return(np.array(rows))
+        def cleanup():
+            for name in os.listdir(tmpdir):
+                if name.startswith('cube'):
+                    os.remove(os.path.join(tmpdir, name))
+        def resumed():
+            cleanup()
+            cancel = threading.Event()
+            def stop(ndone, ntotal):
+                if ndone >= ntotal//2:
+                    cancel.set()
+            st.readmap(tmpdir, out=out, workers=1, progress=stop,
+                       cancel=cancel)
+            t0 = time.perf_counter()
+            st.readmap(tmpdir, out=out)
+            return(time.perf_counter() - t0)
+
+        t_loop = best_of(loop)
+        t_map = best_of(lambda: st.readmap(tmpdir))
+        t_serial = best_of(lambda: st.readmap(tmpdir, workers=1))
+        t_memmap = best_of(lambda: (cleanup(), st.readmap(tmpdir, out=out)))
+        t_resume = min([resumed() for k in range(0, 3)])
+        print('%d x %d pixels, %d depth points' % (ny, nx, ndepth))
+        print('%-28s %8.3f s' % ('readmod loop', t_loop))
+        print('%-28s %8.3f s' % ('readmap', t_map))
+        print('%-28s %8.3f s' % ('readmap, workers=1', t_serial))
+        print('%-28s %8.3f s' % ('readmap, memory-mapped', t_memmap))
+        print('%-28s %8.3f s' % ('readmap, resumed at 50%', t_resume))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def bench_pixel(ny=1000, nx=1000, ndepth=10, nmap=20):
+    """ Map window of a ny*nx map: image of one parameter at one depth
+    point from the memory-mapped cube, and the steps of a click on a pixel
+    of a nmap*nmap map (file lookup, reading its files from the in-memory
+    store where the prefetch left them, update of the figure and drawing
+    it with the limits of the map). The Agg canvas stands for the Tk one:
+    blitting copies the drawn region to the screen, which is not timed. """
+
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from numpy.lib.format import open_memmap
+    import sirplot as sp
+
+    class BlitCanvas(FigureCanvasAgg):
+        supports_blit = True
+        def blit(self, bbox=None):
+            pass
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        # ---- Image of a large map, from a cube as written by st.readmap
+        cube = open_memmap(os.path.join(tmpdir, 'cube.npy'), mode='w+',
+                           dtype=np.float32, shape=(ny, nx, ndepth, 8))
+        for y in range(0, ny, 100):
+            cube[y:y+100] = np.random.rand(min(100, ny-y), nx, ndepth, 8)
+        cube.flush()
+        big = {'mod': {'data': cube, 'origin': (0, 0)}}
+        t_image = best_of(lambda: sp.map_image(big, 7, ndepth//2))
+        del big, cube
+
+        # ---- Clicks on the pixels of a map
+        mapdir = os.path.join(tmpdir, 'map')
+        os.mkdir(mapdir)
+        names = [os.path.join(mapdir, 'pix_%04d_%04d' % (y, x))
+                 for y in range(0, nmap) for x in range(0, nmap)]
+        model = synthetic_model(75)
+        scale = 1. + 0.2*np.random.rand(len(names))[:, None]
+        st.writemods([name+'.mod' for name in names],
+                     *([model[0]] + [x*scale for x in model[1:8]] +
+                       list(model[8:])))
+        profile = synthetic_profile(300)
+        st.writepros([name+'.per' for name in names],
+                     *(list(profile[0:2]) + [x*scale for x in profile[2:]]))
+        maps = sp.load_map(mapdir)
+        if len(maps['failures']) > 0: # the clicks would time a broken map
+            print('REGRESSION: %d pixel files not read, as %s: %s' %
+                  ((len(maps['failures']),) + maps['failures'][0]))
+            raise SystemExit(1)
+        stokes_chks = [1, 1, 1, 1]
+        model_chks = [1, 0, 0, 1, 1, 1, 1]
+
+        st.set_memory_cache(256*2**20)
+        st.readfiles([name+ext for name in names for ext in ('.per', '.mod')],
+                     workers=1) # what the prefetch does
+        figure = sp.FigureModel()
+        BlitCanvas(figure.figure)
+        times = {'lookup': [], 'load': [], 'update': [], 'draw': []}
+        for jj in range(0, len(names)):
+            t0 = time.perf_counter()
+            file_path, legend_names, per_mask, mod_mask = \
+              sp.pixel_runs(maps, jj//nmap, jj % nmap)
+            t1 = time.perf_counter()
+            data = sp.load_runs(legend_names, file_path, per_mask,
+                                mod_mask, workers=1)
+            data.update(maps['limits'])
+            t2 = time.perf_counter()
+            changed = figure.update(data, legend_names, stokes_chks,
+                                    model_chks)
+            t3 = time.perf_counter()
+            if changed is None:
+                figure.figure.canvas.draw()
+            else:
+                figure.redraw(changed)
+            t4 = time.perf_counter()
+            for key, t in (('lookup', t1-t0), ('load', t2-t1),
+                           ('update', t3-t2), ('draw', t4-t3)):
+                times[key].append(t)
+        t_full = best_of(figure.figure.canvas.draw)
+        total = np.sum([times[key] for key in times], axis=0)
+        print('%d x %d map, %d depth points: image %.1f ms' %
+              (ny, nx, ndepth, 1e3*t_image))
+        print('%d x %d map, clicks (median over the pixels):' % (nmap, nmap))
+        for key, label in (('lookup', 'pixel files'),
+                           ('load', 'read files (prefetched)'),
+                           ('update', 'update 11 panels'),
+                           ('draw', 'draw changed panels')):
+            print('  %-30s %8.1f ms' % (label, 1e3*np.median(times[key])))
+        print('  %-30s %8.1f ms (first click %.1f ms)' %
+              ('total', 1e3*np.median(total), 1e3*total[0]))
+        print('  %-30s %8.1f ms' % ('whole figure draw, for reference',
+                                    1e3*t_full))
+    finally:
+        st.set_memory_cache(0)
+        shutil.rmtree(tmpdir)
+
+def bench_watch(sizes=(10**3, 10**4, 10**5), nruns=3, ncycles=20):
+    """ Watch mode: cost of a look for new cycles of nruns runs of ncycles
+    cycles each, in a directory with other files, when nothing changed and
+    when a new cycle was written, against listing the directory and
+    checking every file of the runs at each look. """
+
+    import re
+    import sirplot as sp
+
+    for size in sizes:
+        tmpdir = tempfile.mkdtemp() + '/'
+        try:
+            for jj in range(0, size):
+                open(tmpdir + 'other_%06d.per' % jj, 'w').close()
+            for run in range(0, nruns):
+                for cycle in range(1, ncycles+1):
+                    for ext in ('.per', '.mod'):
+                        with open(tmpdir + 'run%d_%d%s' % (run, cycle, ext),
+                                  'w') as f:
+                            f.write('x')
+            # as if the files were written more than 2 s ago
+            old = time.time() - 10
+            os.utime(tmpdir, (old, old))
+            watch = sp.RunWatch(tmpdir, ['run%d_1' % run
+                                         for run in range(0, nruns)])
+            watch.poll()
+            t_idle = best_of(watch.poll)
+
+            pattern = re.compile(r'(run\d+)(_(\d+))?\.(per|mod|err)$')
+            def rescan():
+                return([(entry.name, os.stat(tmpdir + entry.name))
+                        for entry in os.scandir(tmpdir)
+                        if pattern.match(entry.name)])
+            t_rescan = best_of(rescan)
+
+            cycle = [ncycles]
+            def new_cycle():
+                cycle[0] += 1
+                with open(tmpdir + 'run0_%d.per' % cycle[0], 'w') as f:
+                    f.write('x')
+                os.utime(tmpdir, (old, old + cycle[0]))
+                watch.poll()
+            t_new = best_of(new_cycle)
+            print('%7d other files: poll %8.3f ms, new cycle %8.3f ms, '
+                  'full rescan %8.3f ms' %
+                  (size, 1e3*t_idle, 1e3*t_new, 1e3*t_rescan))
+        finally:
+            shutil.rmtree(tmpdir)
+
+def bench_animation(nruns=2, ncycles=20, ndepth=75, nwav=300):
+    """ Animation of the cycles of nruns runs: rendering the frames ahead
+    (figure updated in place, changed panels drawn), against drawing the
+    whole figure for every frame, and showing a rendered frame from the
+    cache when scrubbing. """
+
+    import matplotlib
+    matplotlib.use('Agg')
+    import sirplot as sp
+
+    tmpdir = tempfile.mkdtemp() + '/'
+    try:
+        model = synthetic_model(ndepth)
+        profile = synthetic_profile(nwav)
+        for run in range(0, nruns):
+            for cycle in range(1, ncycles+1):
+                scale = 1. + 0.01*cycle*(run+1)
+                name = tmpdir + 'run%d_%d' % (run, cycle)
+                st.writemods([name+'.mod'], *([model[0]] +
+                             [x*scale for x in model[1:8]] + list(model[8:])))
+                st.writepros([name+'.per'], *(list(profile[0:2]) +
+                             [x*scale for x in profile[2:]]))
+        st.set_memory_cache(256*2**20)
+        args = (tmpdir, ['run%d' % run for run in range(0, nruns)],
+                [1, 1, 1, 1], [1, 0, 0, 1, 1, 1, 1])
+
+        animation = sp.CycleAnimation(*args)
+        animation.load()
+        animation.frame(0)
+        t0 = time.perf_counter()
+        animation.render(start=1)
+        t_ahead = (time.perf_counter() - t0)/(ncycles-1)
+
+        full = sp.CycleAnimation(*args)
+        full.load()
+        def draw_all():
+            for k in range(0, ncycles):
+                file_path, legend_names, per_mask, mod_mask = \
+                  full.frames[k][1]
+                data = sp.load_runs(legend_names, file_path, per_mask,
+                                    mod_mask, workers=1)
+                data.update(full.limits)
+                sir_fig = sp.build_figure(data, legend_names, *args[2:])
+                sir_fig.canvas.draw()
+        t0 = time.perf_counter()
+        draw_all()
+        t_full = (time.perf_counter() - t0)/ncycles
+
+        t_cached = best_of(lambda: [animation.frame(k)
+                                    for k in range(0, ncycles)])/ncycles
+        print('%d runs x %d cycles, %d frames of %.1f MB:' %
+              (nruns, ncycles, ncycles, animation.nbytes/2.**20/ncycles))
+        print('  rendered ahead, in place    %8.1f ms/frame' % (1e3*t_ahead))
+        print('  new figure every frame      %8.1f ms/frame' % (1e3*t_full))
+        print('  frame from the cache        %8.3f ms/frame' %
+              (1e3*t_cached))
+        t0 = time.perf_counter()
+        animation.export(tmpdir + 'cycles.gif')
+        print('  GIF export                  %8.1f ms/frame' %
+              (1e3*(time.perf_counter() - t0)/ncycles))
+    finally:
+        st.set_memory_cache(0)
+        shutil.rmtree(tmpdir)
+
+def bench_catalog(sizes=(10**3, 10**4, 10**5)):
+    """ Selection of nruns runs (a .per and a .mod file each, one .mod
+    missing): matching the file names of a selection (parse_filelist,
+    against the list scans it replaced), and the catalog of the directory:
+    first listing, opening it again from the saved index, filtering by a
+    name pattern and the selection of the runs found. """
+
+    import sircatalog as sc
+    import sirplot as sp
+
+    def list_scans(filelist):
+        # matching of parse_filelist before the catalog
+        per_names = [x[:-4].rpartition('/')[2] for x in filelist
+                     if x.endswith('.per')]
+        mod_names = [x[:-4].rpartition('/')[2] for x in filelist
+                     if x.endswith('.mod')]
+        legend_names = list(set(per_names+mod_names))
+        per_mask = [int(name in per_names) for name in legend_names]
+        mod_mask = [int(name in mod_names) for name in legend_names]
+        return(legend_names, per_mask, mod_mask)
+
+    for nruns in sizes:
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filelist = []
+            for jj in range(0, nruns):
+                for ext in ('.per', '.mod'):
+                    if ext == '.mod' and jj == nruns-1:
+                        continue
+                    filelist.append(os.path.join(tmpdir, 'inv_%06d%s' %
+                                                 (jj, ext)))
+                    open(filelist[-1], 'w').close()
+            t_parse = best_of(lambda: sp.parse_filelist(filelist))
+            t_scans = float('nan') # quadratic: only for the smaller sizes
+            if nruns <= 10**4:
+                t_scans = best_of(lambda: list_scans(filelist), repeat=1)
+
+            index = tmpdir + '_catalog.json' # not in the directory listed
+            old = time.time() - 10 # as if written more than 2 s ago
+            os.utime(tmpdir, (old, old))
+            t0 = time.perf_counter()
+            sc.Catalog(tmpdir, index=index).refresh()
+            t_first = time.perf_counter() - t0
+            def reopen():
+                catalog = sc.Catalog(tmpdir, index=index)
+                catalog.refresh()
+                return(catalog.runs())
+            t_reopen = best_of(reopen)
+            catalog = sc.Catalog(tmpdir, index=index)
+            catalog.refresh()
+            catalog.runs()
+            t_refresh = best_of(catalog.refresh)
+            t_filter = best_of(lambda: catalog.runs('*_0001??'))
+            names = [run[0] for run in catalog.runs()]
+            t_select = best_of(lambda: catalog.selection(names))
+            scans = 'not run, too slow'
+            if t_scans == t_scans:
+                scans = '%.1f ms' % (1e3*t_scans)
+            print('%7d runs: parse_filelist %8.1f ms (list scans %s)' %
+                  (nruns, 1e3*t_parse, scans))
+            print('  catalog: first listing %8.1f ms, reopen %8.1f ms, '
+                  'refresh %6.3f ms, filter %6.1f ms, select all %6.1f ms' %
+                  (1e3*t_first, 1e3*t_reopen, 1e3*t_refresh, 1e3*t_filter,
+                   1e3*t_select))
+        finally:
+            shutil.rmtree(tmpdir)
+            if os.path.exists(tmpdir + '_catalog.json'):
+                os.remove(tmpdir + '_catalog.json')
+
+def bench_compressed(sizes=((300, 75, 200), (10**4, 10**4, 10))):
+    """ Reading nfiles profiles and models, plain and compressed (gzip,
+    bzip2, xz), for profiles of nwav wavelengths and models of ndepth
+    points (sizes of (nwav, ndepth, nfiles)): time per file, size on disk
+    and the throughput of the text parsed. Files are decompressed in
+    memory as they are read. """
+
+    import bz2
+    import gzip
+    import lzma
+
+    compressions = (('plain', '', open), ('gzip', '.gz', gzip.open),
+                    ('bzip2', '.bz2', bz2.open), ('xz', '.xz', lzma.open))
+    for nwav, ndepth, nfiles in sizes:
+        tmpdir = tempfile.mkdtemp()
+        try:
+            names = [os.path.join(tmpdir, 'inv_%04d' % jj)
+                     for jj in range(0, nfiles)]
+            model = synthetic_model(ndepth)
+            st.writemods([name+'.mod' for name in names], *model)
+            profile = synthetic_profile(nwav)
+            st.writepros([name+'.per' for name in names], *profile)
+            for kind in ('.per', '.mod'):
+                plain = [name+kind for name in names]
+                text = sum([os.path.getsize(name) for name in plain])
+                for label, ext, opener in compressions:
+                    files = [name+ext for name in plain]
+                    if ext:
+                        for name in plain:
+                            with open(name, 'rb') as f:
+                                data = f.read()
+                            with opener(name+ext, 'wb') as f:
+                                f.write(data)
+                    size = sum([os.path.getsize(name) for name in files])
+                    t = best_of(lambda: st.readfiles(files, workers=1))
+                    print('%s %6d %-5s: %7.3f ms/file, %6.1f MB/s of text, '
+                          'size %5.1f%%' %
+                          (kind, nwav if kind == '.per' else ndepth, label,
+                           1e3*t/nfiles, text/t/2**20, 100.*size/text))
+        finally:
+            shutil.rmtree(tmpdir)
+
+# ---------------------------------------------------------------------------
+
+BENCHMARKS = {'readers': bench_readers,
+              'writers': bench_writers,
+              'cache': bench_cache,
+              'memory': bench_memory,
+              'parallel': bench_parallel,
+              'startup': bench_startup,
+              'redraw': bench_redraw,
+              'lod': bench_lod,
+              'collection': bench_collection,
+              'errors': bench_errors,
+              'aggregate': bench_aggregate,
+              'resample': bench_resample,
+              'limits': bench_limits,
+              'containers': bench_containers,
+              'precision': bench_precision,
+              'grids': bench_grids,
+              'lines': bench_lines,
+              'map': bench_map,
+              'pixel': bench_pixel,
+              'watch': bench_watch,
+              'animation': bench_animation,
+              'catalog': bench_catalog,
+              'compressed': bench_compressed}
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or sorted(BENCHMARKS)
+    for name in names:
+        print('---- ' + name)
+        BENCHMARKS[name]()
@@ -1,5 +1,3 @@
-from loader import *
-    
 AllStokesTitles =["Stokes I", "Stokes Q", "Stokes U", "Stokes V"]
 AllModelTitles = ["Temperature (kK)", r"Pe (dyn cm$^{-2}$)", \
                       "Microturbulence (km/s)","B (kG)", \
@@ -7,6 +5,43 @@ AllModelTitles = ["Temperature (kK)", r"Pe (dyn cm$^{-2}$)", \
                       r"Azimuth ($^{\circ}$)"]
 colorlist = ["teal","sandybrown", "darkorchid","red", "blue",\
                  "purple","yellow", "pink", "black","green","sienna"]
+# 'auto': one curve (Line2D) per run with the colors above, or, with more
+# runs than colors, one LineCollection per panel colored by colormap.
+# 'lines' or 'collection' force either mode.
+plot_mode = 'auto'
+colormap = 'viridis'
+# Errors of the .err files: 'band' (shaded band around each model curve)
+# or 'bars' (error bars at every depth point)
+error_style = 'band'
+# Percentile summary of large sets of runs (see sirplot.aggregate_runs):
+# percentiles shown (median and symmetric bands), files read and reduced
+# per chunk, and size of the stacked data above which it is kept in a
+# temporary file instead of memory.
+percentiles = [5, 16, 50, 84, 95]
+aggregate_chunk = 256
+aggregate_memory_bytes = 256*2**20
+# Raster maps, one run per pixel (see sirplot.load_map): regular expression
+# with groups y and x that finds the pixel coordinates in the file names
+# (None: the last two numbers of the name, as inv_0012_0034.mod), and name
+# of the memory-mapped arrays of the map, written in the subdirectory maps
+# of cache_dir (kept in memory if cache_dir is empty).
+map_pattern = None
+map_cube_name = 'sirgui_map'
+# Watch mode (see sirplot.RunWatch): time between two looks for new
+# cycles of the running inversions, in ms.
+watch_interval = 1000
+# Cycle number at the end of a run name, as SIR writes it (name_1, name_12),
+# a regular expression with a group named cycle. Numbers with leading zeros
+# are not cycles, so that pixels of maps (inv_0012_0034) are runs of their
+# own.
+cycle_pattern = r'_(?P<cycle>[1-9]\d*)'
+# Animation of the cycles of the runs (see sirplot.CycleAnimation): size
+# of the rendered frames kept in memory, and frames per second.
+animation_cache_bytes = 256*2**20
+animation_fps = 4
+# Catalog of the runs of a directory tree (see sircatalog.Catalog):
+# directory of the saved indexes, one per tree ('': ~/.cache/sirgui).
+catalog_dir = ''
 
 filenames=[]
 checks = {}
@@ -17,6 +52,21 @@ lower_limits = []
 upper_limits = []
 file_path = ''
 
+# Binary cache of parsed files (see sirtools2.set_cache). Empty: disabled.
+cache_dir = ''
+cache_max_bytes = 512*2**20
+# In-memory store of parsed files reused across plots (see
+# sirtools2.set_memory_cache). 0: disabled.
+memory_cache_bytes = 1024*2**20
+# Concurrent file loading (see sirtools2.readfiles). None: automatic
+# number of workers. load_processes parses in worker processes.
+load_workers = None
+load_processes = False
+# Precision of the loaded data: 'float64', or 'float32' to halve the
+# memory of large selections (log(tau) and wavelength grids stay float64).
+# Set from the 'Single precision' check button of the main window.
+load_dtype = 'float64'
+
 stokes_chks=[]
 model_chks=[]
 n_stokes_chks = 0.
@@ -3,15 +3,10 @@
 import sys
 import os
 import glob
+import threading
 
-import numpy as np
-import matplotlib as mpl
-mpl.use('TkAgg')
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-#from matplotlib.backends.backend_tkagg import NavigationToolbar2TkAgg
-from matplotlib.backends.backend_tkagg import NavigationToolbar2Tk
-import matplotlib.pyplot as plt
-
+# numpy and matplotlib are not imported here, so that the main window comes
+# up quickly: they are imported by plotloader.py when the first plot is made.
 
 if sys.version_info[0] < 3:
     # for Python2
@@ -28,8 +23,6 @@ else:
     #import pickle as pickle
     import tkinter.messagebox as tkMessageBox
     import tkinter.filedialog as tkFileDialog
-    from matplotlib import style
-    style.use("ggplot")
 
 
 import sirtools2 as st
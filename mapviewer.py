@@ -0,0 +1,321 @@
+import config
+from loader import*
+from plotloader import *
+import sirplot as sp
+
+class MapCanvas(Toplevel):
+
+    def __init__(self, parent, directory, read_checks, title="Map"):
+
+        Toplevel.__init__(self, parent)
+        self.__parent = parent
+        self.title(title+': '+directory)
+        self.geometry("+%d+%d" % (parent.winfo_rootx()+150,
+                                  parent.winfo_rooty()+30))
+        body = Frame(self)
+        self.__body = body
+        self.initial_focus = self.__body
+        body.pack(padx = 5, pady= 5)
+        self.protocol("WM_DELETE_WINDOW", self.__close)
+
+        # Map of the directory (sirplot.load_map) and its image. Clicking a
+        # pixel plots its files in a plot window, read on demand.
+        self.__directory = directory
+        self.__read_checks = read_checks # sets config.stokes_chks, ...
+        self.__maps = None
+        self.__quantities = []  # (title, quantity of sp.map_image)
+        self.__points = None    # wavelengths or log(tau) of the quantity
+        self.__index = None     # wavelength or depth point of the image
+        self.__figure = None
+        self.__image = None
+        self.__marker = None
+        self.__plotwindow = None
+        self.__cancel = threading.Event()
+
+        self.__buttonbox(body)
+        self.__load_map()
+
+
+    # -------------------------------------------------------------------
+    def __buttonbox(self, body):
+        ''' Add the Close button, quantity menu, point slider and progress
+        bar to the canvas.
+        '''
+
+        w = Button(body, text="Close", width=10, \
+                   command=self.__close)
+        w.pack(side=LEFT, padx=5, pady=5)
+
+        self.__quantity = StringVar()
+        self.__menu = Combobox(body, textvariable=self.__quantity, \
+                               state='readonly', width=22)
+        self.__menu.bind('<<ComboboxSelected>>', self.__select_quantity)
+        self.__slider = Scale(body, orient=HORIZONTAL, length=200, \
+                              from_=0, to=1, command=self.__select_point)
+        self.__pointlabel = Label(body, text='')
+
+        self.__progressbar = Progressbar(body, orient=HORIZONTAL, \
+                                         length=200, mode='determinate')
+        self.__progressbar.pack(side=LEFT, padx=5, pady=5)
+        self.__cancelbutton = Button(body, text="Cancel", width=10, \
+                                     command=self.__cancel.set)
+        self.__cancelbutton.pack(side=LEFT, padx=5, pady=5)
+
+    # -------------------------------------------------------------------
+    def __load_map(self):
+        ''' Read the map (or open the arrays of an earlier reading) in a
+        loading thread.
+        '''
+
+        self.__nfiles = [0, 0] # files read, total files
+        self.__result = None
+        self.__error = None
+        self.__worker = threading.Thread(target=self.__load, \
+                                         args=(config.load_dtype,))
+        self.__worker.daemon = True
+        self.__worker.start()
+        self.after(50, self.__poll)
+
+    # -------------------------------------------------------------------
+    def __progress(self, ndone, ntotal):
+        ''' Called from the loading thread after each file is read.
+        '''
+
+        self.__nfiles = [ndone, ntotal]
+
+    # -------------------------------------------------------------------
+    def __load(self, dtype):
+        ''' Runs in the loading thread: reads the map.
+        '''
+
+        try:
+            self.__result = sp.load_map(self.__directory, \
+                                        workers=config.load_workers, \
+                                        processes=config.load_processes, \
+                                        progress=self.__progress, \
+                                        cancel=self.__cancel, dtype=dtype)
+        except Exception as exception:
+            self.__error = exception
+
+    # -------------------------------------------------------------------
+    def __poll(self):
+        ''' Runs in the Tk main thread: updates the progress bar until the
+        map is read, then shows it.
+        '''
+
+        if not self.winfo_exists():
+            return
+        ndone, ntotal = self.__nfiles
+        if ntotal > 0:
+            self.__progressbar.config(maximum=ntotal, value=ndone)
+        if self.__worker.is_alive():
+            self.after(50, self.__poll)
+            return
+
+        self.__progressbar.pack_forget()
+        self.__cancelbutton.pack_forget()
+        if self.__error is not None:
+            tkMessageBox.showerror("Map not read", str(self.__error), \
+                                   parent=self)
+        if self.__result is None:
+            self.__close()
+            return
+        if self.__result['per'] is None and self.__result['mod'] is None:
+            lines = ['No pixel of {0} could be read'.format(self.__directory)]
+            lines += self.__failure_lines(self.__result['failures'])
+            tkMessageBox.showerror("Map not read", '\n'.join(lines), \
+                                   parent=self)
+            self.__close()
+            return
+
+        self.__maps = self.__result
+        if self.__maps['per'] is not None:
+            self.__quantities += [(config.AllStokesTitles[k], k) \
+                                  for k in range(0,4)]
+        if self.__maps['mod'] is not None:
+            self.__quantities += [(config.AllModelTitles[k], 4+k) \
+                                  for k in range(0,7)]
+        self.__menu.config(values=[title for title, q in self.__quantities])
+        self.__menu.pack(side=LEFT, padx=5, pady=5)
+        self.__slider.pack(side=LEFT, padx=5, pady=5)
+        self.__pointlabel.pack(side=LEFT, padx=5, pady=5)
+        self.__quantity.set(self.__quantities[0][0])
+        self.__select_quantity()
+        self.__report_failures(self.__maps['failures'])
+
+    # -------------------------------------------------------------------
+    def __report_failures(self, failures):
+        ''' Tell the user which files of the map could not be read, and why.
+        '''
+
+        if len(failures) == 0:
+            return
+        tkMessageBox.showwarning("Files not read", \
+                                 '\n'.join(self.__failure_lines(failures)), \
+                                 parent=self)
+
+    def __failure_lines(self, failures):
+        ''' Lines of a message listing the first 15 failures.
+        '''
+
+        lines = []
+        for filename, error in failures:
+            lines.append('{0}: {1}'.format(filename.rpartition('/')[2], error))
+        if len(lines) > 15:
+            lines = lines[:15] + ['... and {0} more'.format(len(lines)-15)]
+        return(lines)
+
+    # -------------------------------------------------------------------
+    def __select_quantity(self, event=None):
+        ''' Show the map of the quantity chosen in the menu, at the
+        continuum for the profiles and at log(tau) = 0 for the models.
+        '''
+
+        quantity = dict(self.__quantities)[self.__quantity.get()]
+        self.__points = sp.map_points(self.__maps, quantity)
+        index = 0
+        if quantity >= 4:
+            index = int(np.argmin(np.absolute(self.__points)))
+        self.__slider.config(to=len(self.__points)-1)
+        self.__index = None
+        self.__slider.set(index)
+        self.__select_point(index, force=True)
+
+    # -------------------------------------------------------------------
+    def __select_point(self, value, force=False):
+        ''' Show the map at the wavelength or depth point of the slider.
+        '''
+
+        index = int(round(float(value)))
+        if index == self.__index and not force:
+            return
+        self.__index = index
+        quantity = dict(self.__quantities)[self.__quantity.get()]
+        image, extent = sp.map_image(self.__maps, quantity, index)
+        if quantity < 4:
+            self.__pointlabel.config(text=u'\u0394\u03BB = {0:.1f} m\u00C5'\
+                                     .format(self.__points[index]))
+        else:
+            self.__pointlabel.config(text=u'log(\u03C4) = {0:.2f}'\
+                                     .format(self.__points[index]))
+        self.__show_image(image, extent, self.__quantity.get())
+
+    # -------------------------------------------------------------------
+    def __show_image(self, image, extent, title):
+        ''' Draw the image, in a figure made the first time.
+        '''
+
+        from matplotlib.figure import Figure
+
+        image = np.ma.masked_invalid(image)
+        if self.__figure is None:
+            self.__figure = Figure()
+            self.__axes = self.__figure.add_subplot(1, 1, 1)
+            self.__image = self.__axes.imshow(image, origin='lower', \
+                                              extent=extent, \
+                                              cmap=config.colormap, \
+                                              interpolation='nearest')
+            self.__figure.colorbar(self.__image, ax=self.__axes)
+            self.__marker, = self.__axes.plot([], [], marker='s', \
+                                              markersize=8, \
+                                              markerfacecolor='none', \
+                                              markeredgecolor='red', \
+                                              linestyle='none')
+            self.__axes.set_xlabel('x (pixel)', fontsize='small')
+            self.__axes.set_ylabel('y (pixel)', fontsize='small')
+            self.__show(self.__figure)
+        else:
+            self.__image.set_data(image)
+            self.__image.set_extent(extent)
+            self.__image.autoscale()
+        self.__axes.set_title(title, fontsize='small')
+        self.__figure.canvas.draw_idle()
+
+    # -------------------------------------------------------------------
+    def __show(self, map_fig):
+        ''' Attach the figure to a Tk canvas in this window, and plot the
+        pixels clicked on it.
+        '''
+
+        canvas = FigureCanvasTkAgg(map_fig, self)
+
+        canvas.draw()
+        canvas.get_tk_widget().pack(side=BOTTOM, fill=BOTH, \
+                                    expand=True)
+        self.__toolbar = NavigationToolbar2Tk(canvas, self)
+
+        self.__toolbar.update()
+        canvas._tkcanvas.pack(side=TOP, fill=BOTH, expand=True)
+        canvas.mpl_connect('button_press_event', self.__click)
+
+    # -------------------------------------------------------------------
+    def __click(self, event):
+        ''' Plot the files of the clicked pixel in the plot window of the
+        map, then read those of the pixels around it.
+        '''
+
+        if event.inaxes is not self.__axes or self.__toolbar.mode:
+            return # outside the map, or zooming/panning
+        x = int(round(event.xdata))
+        y = int(round(event.ydata))
+        runs = sp.pixel_runs(self.__maps, y, x)
+        if runs is None:
+            return
+        self.__read_checks()
+        if config.total_chks == 0:
+            tkMessageBox.showwarning("No parameters to plot", \
+                                     "Plese check one or more parameters "\
+                                     "to plot", parent=self)
+            return
+
+        self.__marker.set_data([x], [y])
+        self.__figure.canvas.draw_idle()
+        title = 'Pixel y={0}, x={1}'.format(y, x)
+        if self.__plotwindow is not None and self.__plotwindow.winfo_exists():
+            self.__plotwindow.title(title)
+            self.__plotwindow.replot(runs=runs, now=True, \
+                                     limits=self.__maps['limits'])
+        else:
+            from visualization import VisualizationCanvas
+            self.__plotwindow = VisualizationCanvas(self, title=title, \
+                                            runs=runs, \
+                                            limits=self.__maps['limits'])
+        self.__prefetch(y, x)
+
+    # -------------------------------------------------------------------
+    def __prefetch(self, y, x):
+        ''' Read the files of the 8 pixels around y, x in a thread, so that
+        they are in the in-memory store if they are clicked next.
+        '''
+
+        if st.memory_cache_info()['max_bytes'] == 0:
+            return
+        filenames = []
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                runs = sp.pixel_runs(self.__maps, y+dy, x+dx)
+                if runs is None or (dy, dx) == (0, 0):
+                    continue
+                file_path, legend_names, per_mask, mod_mask = runs
+                if per_mask[0]:
+                    filenames.append(file_path+legend_names[0]+'.per')
+                if mod_mask[0]:
+                    filenames.append(file_path+legend_names[0]+'.mod')
+                if mod_mask[0] and config.checks['err'].get():
+                    filenames.append(file_path+legend_names[0]+'.err')
+        prefetcher = threading.Thread(target=st.readfiles, \
+                                      args=(filenames,), \
+                                      kwargs={'workers': 1, \
+                                              'dtype': config.load_dtype, \
+                                              'share_grids': True})
+        prefetcher.daemon = True
+        prefetcher.start()
+
+    def __close(self, event=None):
+        ''' Method that handles the window closing.
+        '''
+
+        # stop the loading thread, put focus back to the parent window
+        self.__cancel.set()
+        self.__parent.focus_set()
+        self.destroy()
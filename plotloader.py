@@ -0,0 +1,14 @@
+# Imports for the plot windows. Kept apart from loader.py so that numpy and
+# matplotlib are only imported when the first plot window is opened.
+import sys
+
+import numpy as np
+import matplotlib as mpl
+mpl.use('TkAgg')
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+#from matplotlib.backends.backend_tkagg import NavigationToolbar2TkAgg
+from matplotlib.backends.backend_tkagg import NavigationToolbar2Tk
+
+if sys.version_info[0] >= 3:
+    from matplotlib import style
+    style.use("ggplot")
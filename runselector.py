@@ -0,0 +1,147 @@
+from loader import*
+import sircatalog as sc
+
+class RunSelector(Toplevel):
+
+    def __init__(self, parent, directory, select, title="Runs"):
+
+        Toplevel.__init__(self, parent)
+        self.__parent = parent
+        self.title(title+': '+directory)
+        self.geometry("+%d+%d" % (parent.winfo_rootx()+150,
+                                  parent.winfo_rooty()+30))
+        body = Frame(self)
+        self.__body = body
+        self.initial_focus = self.__body
+        body.pack(padx = 5, pady= 5)
+        self.protocol("WM_DELETE_WINDOW", self.__close)
+
+        # Runs of the directory tree (sircatalog.Catalog), filtered by a
+        # name pattern. The runs chosen are passed to select, as
+        # (file_path, legend_names, per_mask, mod_mask).
+        self.__select = select
+        self.__runs = []  # runs shown in the list
+        self.__filter = None # pending filtering of the list (after id)
+
+        self.__buttonbox(body)
+        self.config(cursor='watch')
+        self.update_idletasks()
+        self.__catalog = sc.Catalog(directory)
+        self.__catalog.refresh()
+        self.config(cursor='')
+        self.__show_runs()
+
+
+    # -------------------------------------------------------------------
+    def __buttonbox(self, body):
+        ''' Add the pattern entry, the list of runs and the Select, Refresh
+        and Close buttons to the canvas.
+        '''
+
+        top = Frame(body)
+        top.pack(side=TOP, fill=X)
+        Label(top, text='Name pattern:').pack(side=LEFT, padx=5, pady=5)
+        self.__pattern = StringVar()
+        entry = Entry(top, textvariable=self.__pattern, width=30)
+        entry.pack(side=LEFT, padx=5, pady=5)
+        entry.bind('<KeyRelease>', self.__pattern_changed)
+        entry.focus_set()
+        self.__countlabel = Label(top, text='')
+        self.__countlabel.pack(side=LEFT, padx=5, pady=5)
+
+        middle = Frame(body)
+        middle.pack(side=TOP, fill=BOTH, expand=True)
+        scrollbar = Scrollbar(middle, orient=VERTICAL)
+        self.__listbox = Listbox(middle, selectmode=EXTENDED, width=60, \
+                                 height=25, font='TkFixedFont', \
+                                 yscrollcommand=scrollbar.set)
+        scrollbar.config(command=self.__listbox.yview)
+        scrollbar.pack(side=RIGHT, fill=Y)
+        self.__listbox.pack(side=LEFT, fill=BOTH, expand=True)
+        self.__listbox.bind('<Double-Button-1>', self.__use_selection)
+
+        bottom = Frame(body)
+        bottom.pack(side=TOP, fill=X)
+        w = Button(bottom, text="Select", width=10, \
+                   command=self.__use_selection)
+        w.pack(side=LEFT, padx=5, pady=5)
+        w = Button(bottom, text="Select all", width=10, \
+                   command=self.__select_all)
+        w.pack(side=LEFT, padx=5, pady=5)
+        w = Button(bottom, text="Refresh", width=10, \
+                   command=self.__refresh)
+        w.pack(side=LEFT, padx=5, pady=5)
+        w = Button(bottom, text="Close", width=10, \
+                   command=self.__close)
+        w.pack(side=LEFT, padx=5, pady=5)
+
+    # -------------------------------------------------------------------
+    def __show_runs(self):
+        ''' Fill the list with the runs matching the pattern, and the files
+        each of them has.
+        '''
+
+        self.__filter = None
+        self.__runs = self.__catalog.runs(self.__pattern.get().strip())
+        lines = []
+        for name, per, mod, err in self.__runs:
+            files = ' '.join([ext if stat is not None else '    ' for ext, \
+                              stat in zip(('per', 'mod', 'err'), \
+                                          (per, mod, err))])
+            lines.append('{0}  {1}'.format(files, name))
+        self.__listbox.delete(0, END)
+        if len(lines) > 0:
+            self.__listbox.insert(END, *lines)
+        self.__countlabel.config(text='{0} runs'.format(len(lines)))
+
+    # -------------------------------------------------------------------
+    def __pattern_changed(self, event=None):
+        ''' Filter the list once the user stops typing.
+        '''
+
+        if self.__filter is not None:
+            self.after_cancel(self.__filter)
+        self.__filter = self.after(200, self.__show_runs)
+
+    # -------------------------------------------------------------------
+    def __select_all(self):
+        ''' Select all the runs of the list.
+        '''
+
+        self.__listbox.selection_set(0, END)
+
+    # -------------------------------------------------------------------
+    def __refresh(self):
+        ''' List again the directories changed since the catalog was made.
+        '''
+
+        self.config(cursor='watch')
+        self.update_idletasks()
+        self.__catalog.refresh()
+        self.config(cursor='')
+        self.__show_runs()
+
+    # -------------------------------------------------------------------
+    def __use_selection(self, event=None):
+        ''' Pass the runs selected in the list to the main window.
+        '''
+
+        names = [self.__runs[int(line)][0] \
+                 for line in self.__listbox.curselection()]
+        if len(names) == 0:
+            tkMessageBox.showwarning("No runs selected", \
+                                     "Plese select one or more runs", \
+                                     parent=self)
+            return
+        self.__select(self.__catalog.selection(names))
+        self.__close()
+
+    def __close(self, event=None):
+        ''' Method that handles the window closing.
+        '''
+
+        # put focus back to the parent window
+        if self.__filter is not None:
+            self.after_cancel(self.__filter)
+        self.__parent.focus_set()
+        self.destroy()
@@ -0,0 +1,218 @@
+"""
+Headless batch rendering of SIR GUI figures.
+
+Renders the same figures as the GUI plot window (Stokes profiles and model
+atmospheres) to PNG or PDF files, without a display, for many runs at once.
+Figures are rendered in parallel by a pool of worker processes.
+
+Call:
+    python sirbatch.py runs/ -o figures/
+    python sirbatch.py 'runs/*/inv_*' --stokes IV --model T,B,vlos --format pdf
+    python sirbatch.py runs/ --overlay --errors --zscale --workers 16
+    python sirbatch.py runs/ --stokes IV --lines
+    python sirbatch.py 'runs/inv_*' --animate cycles.gif --fps 4
+
+A run is a set of files sharing a name: name.per, name.mod and name.err,
+plain or compressed (name.per.gz, .bz2, .xz or .zst).
+Each argument is a directory (all runs in it) or a glob pattern (matched
+against the file names without extension). By default every run gets its
+own figure; with --overlay all runs of a directory are overlaid in a single
+comparison figure.
+With --animate, the cycles of the runs (name_1, name_2, ...) are written
+as an animation instead, to a GIF (Pillow) or MP4 (ffmpeg) file.
+"""
+
+import os
+import sys
+import glob
+import time
+import argparse
+
+import matplotlib as mpl
+mpl.use('Agg')
+from matplotlib import style
+style.use("ggplot")
+
+import config
+import sirplot as sp
+
+ModelKeys = ['T', 'Pe', 'vmic', 'B', 'vlos', 'gamma', 'phi']
+
+
+def find_runs(patterns):
+    # Returns the .per/.mod files matched by the directories or glob patterns
+    filelist = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, '*')
+        for ext in ('.per', '.mod'):
+            if pattern.endswith(ext):
+                files = pattern
+            else:
+                files = pattern+ext
+            for compressed in ('', '.gz', '.bz2', '.xz', '.zst'):
+                filelist += glob.glob(files+compressed)
+    return(sorted(set(filelist)))
+
+def make_jobs(filelist, outdir, fmt, overlay):
+    # Groups the files by directory and returns one (file_path, legend_names,
+    # per_mask, mod_mask, outfile) job per figure. Output files are named
+    # after the path of the directory from the one common to all of them
+    # (runs/a/x and runs/b/x give a_x and b_x), and a repeated name gets a
+    # numbered suffix, so that no figure overwrites another one.
+    bydir = {}
+    for name in filelist:
+        bydir.setdefault(os.path.dirname(os.path.abspath(name)), []).append(name)
+    if len(bydir) == 0:
+        return([])
+    common = os.path.commonpath(list(bydir))
+
+    jobs = []
+    used = set()
+    def outfile(name):
+        path = os.path.join(outdir, name+'.'+fmt)
+        count = 1
+        while path in used:
+            count += 1
+            path = os.path.join(outdir, '{0}_{1}.{2}'.format(name, count, fmt))
+        used.add(path)
+        return(path)
+
+    for directory in sorted(bydir):
+        file_path, legend_names, per_mask, mod_mask = \
+          sp.parse_filelist(bydir[directory])
+        prefix = os.path.relpath(directory, common)
+        if prefix == '.': # the common directory itself
+            prefix = os.path.basename(directory)
+        prefix = prefix.replace(os.sep, '_')
+        if overlay:
+            jobs.append((file_path, legend_names, per_mask, mod_mask, \
+                         outfile(prefix)))
+        else:
+            for jj in range(0, len(legend_names)):
+                jobs.append((file_path, [legend_names[jj]], [per_mask[jj]], \
+                             [mod_mask[jj]], \
+                             outfile(prefix+'_'+legend_names[jj])))
+    return(jobs)
+
+def render(job, stokes_chks, model_chks, read_err, zscale, dpi, \
+           split_lines=False):
+    # Renders one figure. Runs in a worker process.
+    file_path, legend_names, per_mask, mod_mask, outfile = job
+    data = sp.load_runs(legend_names, file_path, per_mask, mod_mask, \
+                        read_err=read_err, workers=1)
+    sir_fig = sp.build_figure(data, legend_names, stokes_chks, model_chks, \
+                              read_err=read_err, zscale=zscale, \
+                              split_lines=split_lines)
+    sir_fig.savefig(outfile, dpi=dpi)
+    failures = ['{0}: {1}'.format(name, error) \
+                for name, error in data['failures']]
+    return(outfile, failures)
+
+def animate(filelist, outfile, stokes_chks, model_chks, read_err, zscale, \
+            dpi, split_lines=False, fps=4):
+    # Writes the animation of the cycles of the runs of filelist, overlaid
+    file_path, legend_names, per_mask, mod_mask = sp.parse_filelist(filelist)
+    animation = sp.CycleAnimation(file_path, legend_names, stokes_chks, \
+                                  model_chks, read_err=read_err, \
+                                  zscale=zscale, split_lines=split_lines, \
+                                  dpi=dpi)
+    failures = ['{0}: {1}'.format(name, error) \
+                for name, error in animation.load()]
+    animation.export(outfile, fps=fps)
+    return(len(animation.frames), failures)
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Render SIR GUI figures '\
+                                     'without a display.')
+    parser.add_argument('runs', nargs='+', \
+                        help='directories or glob patterns of runs')
+    parser.add_argument('-o', '--outdir', default='.', \
+                        help='output directory (default: .)')
+    parser.add_argument('--format', default='png', choices=['png', 'pdf'])
+    parser.add_argument('--dpi', type=int, default=100)
+    parser.add_argument('--stokes', default='IQUV', \
+                        help='Stokes parameters to plot (default: IQUV)')
+    parser.add_argument('--model', default='T,B,vlos,gamma,phi', \
+                        help='model parameters to plot, from '+\
+                        ','.join(ModelKeys)+' (default: T,B,vlos,gamma,phi)')
+    parser.add_argument('--errors', action='store_true', \
+                        help='plot errors from the .err files')
+    parser.add_argument('--zscale', action='store_true', \
+                        help='plot models against z instead of log(tau)')
+    parser.add_argument('--lines', action='store_true', \
+                        help='one Stokes panel per spectral line')
+    parser.add_argument('--overlay', action='store_true', \
+                        help='one comparison figure per directory')
+    parser.add_argument('--workers', type=int, default=None, \
+                        help='number of worker processes (default: CPUs)')
+    parser.add_argument('--animate', metavar='FILE', default=None, \
+                        help='write the cycles of the runs as an animation '\
+                        '(.gif, or .mp4 with ffmpeg) instead')
+    parser.add_argument('--fps', type=float, default=config.animation_fps, \
+                        help='frames per second of the animation')
+    args = parser.parse_args(argv)
+
+    stokes_chks = [int(s in args.stokes.upper()) for s in 'IQUV']
+    model_keys = [key for key in args.model.split(',') if key]
+    for key in model_keys:
+        if key not in ModelKeys:
+            parser.error('unknown model parameter: '+key)
+    model_chks = [int(key in model_keys) for key in ModelKeys]
+    if sum(stokes_chks) + sum(model_chks) == 0:
+        parser.error('no parameters to plot')
+
+    if args.animate is not None:
+        filelist = find_runs(args.runs)
+        if len(filelist) == 0:
+            parser.error('no .per or .mod files found')
+        if len(set([os.path.dirname(os.path.abspath(name)) \
+                    for name in filelist])) > 1:
+            parser.error('the runs of an animation must be in one directory')
+        t0 = time.perf_counter()
+        try:
+            nframes, failures = animate(filelist, args.animate, stokes_chks,\
+                                        model_chks, args.errors, args.zscale,\
+                                        args.dpi, split_lines=args.lines, \
+                                        fps=args.fps)
+        except IOError as error:
+            print(error)
+            return(1)
+        for failure in failures:
+            print('Could not read ', failure)
+        print('{0} cycles in {1:.2f} s'.format(nframes, \
+                                               time.perf_counter()-t0))
+        return(0)
+
+    jobs = make_jobs(find_runs(args.runs), args.outdir, args.format, \
+                     args.overlay)
+    if len(jobs) == 0:
+        parser.error('no .per or .mod files found')
+    if not os.path.isdir(args.outdir):
+        os.makedirs(args.outdir)
+
+    from concurrent.futures import ProcessPoolExecutor
+    from functools import partial
+
+    t0 = time.perf_counter()
+    nfailed = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        task = partial(render, stokes_chks=stokes_chks, \
+                       model_chks=model_chks, read_err=args.errors, \
+                       zscale=args.zscale, dpi=args.dpi, \
+                       split_lines=args.lines)
+        for outfile, failures in executor.map(task, jobs, chunksize=4):
+            for failure in failures:
+                print('Could not read ', failure)
+            nfailed += len(failures) > 0
+    elapsed = time.perf_counter() - t0
+
+    print('{0} figures in {1:.2f} s ({2:.1f} figures/s), {3} with missing '\
+          'files'.format(len(jobs), elapsed, len(jobs)/elapsed, nfailed))
+
+    return(0)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
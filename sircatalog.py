@@ -0,0 +1,196 @@
+"""
+Catalog of the runs of a directory tree, for the run selection of the GUI.
+
+A run is a set of files sharing a name: name.per, name.mod and name.err,
+plain or compressed (name.per.gz, see sirtools2).
+The catalog lists the tree once and keeps, for every directory, its
+modification time and the size and modification time of its SIR files. The
+index is saved apart from the tree (in config.catalog_dir), so that opening
+the same tree again only lists the directories that changed since (new,
+removed or renamed files change the modification time of their directory),
+and only checks the size and modification time of the SIR files of the
+others (a file rewritten in place does not change its directory).
+Does not import Tk, numpy or matplotlib.
+
+******* Contains:
+
+>> catalog = Catalog(root), listed = catalog.refresh()
+
+>> runs = catalog.runs(pattern), (name, per, mod, err) with [size, mtime]
+   or None for every file
+
+>> file_path, legend_names, per_mask, mod_mask = catalog.selection(names)
+
+"""
+
+import os
+import re
+import json
+import time
+import fnmatch
+import hashlib
+
+import config
+import sirtools2 as st
+
+Extensions = ('.per', '.mod', '.err')
+
+
+class Catalog(object):
+    ''' Index of the runs of the directory tree root. refresh lists the
+    directories changed since the last refresh (or since the index was
+    saved), and checks the SIR files of the others with a stat each, so
+    that the files of the tree that are not runs are not looked at again.
+    The index is saved in the file
+    index (by default named after root, in config.catalog_dir; not saved if
+    None). It is not kept in the tree, where writing it would change the
+    modification time of root.
+    '''
+
+    def __init__(self, root, index=''):
+
+        self.root = os.path.abspath(root)
+        if index == '':
+            directory = config.catalog_dir or \
+              os.path.join(os.path.expanduser('~'), '.cache', 'sirgui')
+            key = hashlib.md5(self.root.encode('utf-8')).hexdigest()[:16]
+            index = os.path.join(directory, 'catalog_'+key+'.json')
+        self.index = index
+        self.dirs = {} # path from root -> {'mtime', 'dirs', 'files'}
+        self.__runs = None # sorted (name, per, mod, err) of all the runs
+        if index is not None and os.path.isfile(index):
+            try:
+                with open(index) as f:
+                    saved = json.load(f)
+                if saved.get('root') == self.root and \
+                   saved.get('version') == 1:
+                    self.dirs = saved['dirs']
+            except (IOError, ValueError, KeyError):
+                self.dirs = {} # listed again
+
+    def refresh(self, rescan=False):
+        ''' Lists again the directories whose modification time changed,
+        or all of them with rescan, updates the size and modification time
+        of the files of the others, and saves the index if anything
+        changed. Returns the number of directories listed.
+        '''
+
+        dirs = {}
+        listed = 0
+        updated = 0 # directories not listed with files rewritten in place
+        pending = ['']
+        while len(pending) > 0:
+            reldir = pending.pop()
+            path = os.path.join(self.root, reldir)
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError: # removed
+                continue
+            entry = self.dirs.get(reldir)
+            # list again if the directory changed, or could change within
+            # the resolution of its modification time
+            if rescan or entry is None or entry['mtime'] != mtime or \
+               time.time_ns() - mtime < 2*10**9:
+                entry = self.__list(path, mtime)
+                listed += 1
+            else:
+                files = self.__check(path, entry['files'])
+                if files is not None:
+                    entry = dict(entry, files=files)
+                    updated += 1
+            dirs[reldir] = entry
+            pending += [os.path.join(reldir, name) for name in entry['dirs']]
+
+        if listed > 0 or updated > 0 or len(dirs) != len(self.dirs):
+            self.dirs = dirs
+            self.__runs = None
+            self.save()
+        return(listed)
+
+    def __list(self, path, mtime):
+        # Subdirectories and SIR files, with their size and modification
+        # time, of the directory path
+        dirs = []
+        files = {}
+        for item in os.scandir(path):
+            if item.name.startswith('.'):
+                continue
+            if item.is_dir(follow_symlinks=False):
+                dirs.append(item.name)
+            elif st.plainname(item.name)[-4:] in Extensions:
+                try:
+                    stat = item.stat()
+                except OSError: # removed meanwhile
+                    continue
+                files[item.name] = [stat.st_size, stat.st_mtime_ns]
+        return({'mtime': mtime, 'dirs': sorted(dirs), 'files': files})
+
+    def __check(self, path, files):
+        # The files of the directory path with their current size and
+        # modification time, if any of files changed, or None
+        checked = {}
+        changed = False
+        for name, stat in files.items():
+            try:
+                current = os.stat(os.path.join(path, name))
+            except OSError: # removed meanwhile
+                changed = True
+                continue
+            checked[name] = [current.st_size, current.st_mtime_ns]
+            changed = changed or checked[name] != stat
+        return(checked if changed else None)
+
+    def save(self):
+        ''' Writes the index, if it has a file name.
+        '''
+
+        if self.index is None:
+            return
+        try:
+            if not os.path.isdir(os.path.dirname(self.index)):
+                os.makedirs(os.path.dirname(self.index))
+            with open(self.index+'.tmp', 'w') as f:
+                json.dump({'version': 1, 'root': self.root, \
+                           'dirs': self.dirs}, f, separators=(',', ':'))
+            os.replace(self.index+'.tmp', self.index)
+        except (IOError, OSError): # kept in memory only
+            pass
+
+    def runs(self, pattern=None):
+        ''' The runs of the tree, sorted by name (path from root without
+        extension), as tuples (name, per, mod, err) with the [size, mtime]
+        of each file, or None if the run has no such file. pattern selects
+        the names matching it, as a shell pattern (inv_*_1), or containing
+        it if it has no wildcards.
+        '''
+
+        if self.__runs is None:
+            # extension -> run name -> [size, mtime] of its file
+            files = dict([(ext, {}) for ext in Extensions])
+            for reldir, entry in self.dirs.items():
+                prefix = reldir + '/' if reldir else ''
+                for filename, stat in entry['files'].items():
+                    filename = st.plainname(filename) # as inv_1.per.gz
+                    files[filename[-4:]][prefix+filename[:-4]] = stat
+            per, mod, err = [files[ext] for ext in Extensions]
+            names = sorted(set(per) | set(mod) | set(err))
+            self.__runs = [(name, per.get(name), mod.get(name), \
+                            err.get(name)) for name in names]
+        if not pattern:
+            return(list(self.__runs))
+
+        if not any([c in pattern for c in '*?[']):
+            pattern = '*' + pattern + '*'
+        match = re.compile(fnmatch.translate(pattern)).match
+        return([run for run in self.__runs if match(run[0])])
+
+    def selection(self, names):
+        ''' The runs names as parse_filelist of sirplot gives them:
+        file_path, legend_names, per_mask, mod_mask.
+        '''
+
+        files = dict([(run[0], run) for run in self.runs()])
+        legend_names = [name for name in names if name in files]
+        per_mask = [int(files[name][1] is not None) for name in legend_names]
+        mod_mask = [int(files[name][2] is not None) for name in legend_names]
+        return(self.root.rstrip('/')+'/', legend_names, per_mask, mod_mask)
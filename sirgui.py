@@ -5,10 +5,16 @@ Date: 2018-07-27
 GUI that allows user to visualize output (Stokes profiles and model atmospheres)
 from the SIR inversion code.
 
-Uses 4 files:
-    loader.py: loads all necessary modules
+Uses these files:
+    loader.py: loads the Tk modules
+    plotloader.py: loads numpy and matplotlib for the plot windows
     config.py: contains some global variables
     visualization.py: defines VisualizationCanvas class with canvas and figures
+    mapviewer.py: defines MapCanvas class, the window of a raster map
+    runselector.py: defines RunSelector class, the runs of a directory tree
+    sircatalog.py: catalog of the runs of a directory tree
+    animation.py: defines AnimationCanvas class, the animation of the cycles of runs
+    sirplot.py: reads the runs and builds the figures
     sirgui.py (this file): Main program. Calls SirGUI class, which contains 
         the menu and main functionality of the GUI.
 Third party imports: 
@@ -26,12 +32,33 @@ Updates:
        plotted when there were more .per files than .mod files in the user selection.
     ** Introduced and error file counter (missing) in visualization.py to account for 
        missing .err files. 
+
+- 2026/10/18:
+    ** numpy and matplotlib are no longer imported at start up. visualization.py (and
+       with it plotloader.py) is imported when the first plot window is opened, so the
+       main window comes up without waiting for matplotlib. The Tk root is only created
+       when sirgui.py is run as a program.
+    ** Select Map button: opens a raster map (one run per pixel) in a map window
+       (mapviewer.py). Clicking a pixel plots its profiles and model. With
+       config.cache_dir, the arrays of the map are kept in its subdirectory maps,
+       never in the directory of the map, and opening it again reuses them.
+    ** Watch running inversions check button: the plot window follows the cycles of
+       the selected runs (name_1.per, name_2.per, ...) as SIR writes them.
+    ** Cycles button of the plot window: animation of the cycles of the runs plotted
+       (animation.py), exported to GIF or MP4.
+    ** Select Directory button: the runs of a directory tree (.per, .mod and .err files),
+       filtered by a name pattern (runselector.py). The catalog of the tree is saved
+       and only the directories changed since are listed again (sircatalog.py).
+    ** Selected files are matched in linear time, keep the order of the selection and
+       may come from several directories.
+    ** Compressed files (.per.gz, .mod.xz, ...) can be selected and are read without
+       decompressing them to disk.
 """
 
 
 import config # file with global variables
 from loader import * #file with imports
-from visualization import *
+import sirplot as sp
 
 class SirGUI:
 
@@ -43,6 +70,11 @@ class SirGUI:
         self.__toggletext = StringVar() # toggle button for height scale
         self.__toggletext.set('z scale')
         config.checks['toggle']=self.__toggletext
+        self.__plotwindow = None # plot window, reused by later plots
+        if config.cache_dir: # opt-in binary cache of parsed files
+            st.set_cache(config.cache_dir, config.cache_max_bytes)
+        # parsed files are kept in memory between plots
+        st.set_memory_cache(config.memory_cache_bytes)
         self.__main_menu(self.__main_frame) # main menu, contains all buttons.
         self.__main_frame.grid()
         
@@ -54,6 +86,10 @@ class SirGUI:
         else:
             self.__toggletext.set('z scale')
         config.checks['toggle']=self.__toggletext
+        # Update the open plot window in place
+        if self.__plotwindow is not None and self.__plotwindow.winfo_exists():
+            self.__plotwindow.set_zscale(self.__toggletext.get() == \
+                                         (u'\u03C4'+'  scale'))
         
     def __main_menu(self, main_frame):
         # Mehod that defines the file dialog, as well as the check buttons and
@@ -63,6 +99,16 @@ class SirGUI:
         b = Button(main_frame, text="Select File", width=25,\
                        command=self.__file_select, pady=20, padx=20)
         b.grid(columnspan=3, sticky=(W+E), padx=10)
+
+        # ---- Directory Selection Button - Calls: __directory_select()
+        b = Button(main_frame, text="Select Directory", width=25,\
+                       command=self.__directory_select, pady=5, padx=20)
+        b.grid(columnspan=3, sticky=(W+E), padx=10)
+
+        # ---- Map Selection Button - Calls: __map_select()
+        b = Button(main_frame, text="Select Map", width=25,\
+                       command=self.__map_select, pady=5, padx=20)
+        b.grid(columnspan=3, sticky=(W+E), padx=10)
         
         # ---- Stokes Check Buttons:
         # All the values of all the check buttons are saved in a global dictionary
@@ -168,6 +214,47 @@ class SirGUI:
         ErrorButton.grid(columnspan=3, sticky=(W), padx =20)
         config.checks['err'] = err_check
 
+        # ---- Summary Check Button: percentile bands instead of one curve
+        # per run, for large sets of runs
+
+        summary_check = BooleanVar()
+        summary_check.set(0)
+        SummaryButton = Checkbutton(main_frame, text = 'Percentile summary', \
+                                    variable = summary_check, padx = 20, pady = 10)
+        SummaryButton.grid(columnspan=3, sticky=(W), padx =20)
+        config.checks['summary'] = summary_check
+
+        # ---- Lines Check Button: one Stokes panel per spectral line of the
+        # profiles (line_ind), against the wavelength
+
+        lines_check = BooleanVar()
+        lines_check.set(0)
+        LinesButton = Checkbutton(main_frame, text = 'Split spectral lines', \
+                                  variable = lines_check, padx = 20, pady = 10)
+        LinesButton.grid(columnspan=3, sticky=(W), padx =20)
+        config.checks['lines'] = lines_check
+
+        # ---- Watch Check Button: plot all the cycles of the selected runs
+        # and follow them as they are written (see sirplot.RunWatch)
+
+        watch_check = BooleanVar()
+        watch_check.set(0)
+        WatchButton = Checkbutton(main_frame, text = 'Watch running inversions', \
+                                  variable = watch_check, padx = 20, pady = 10)
+        WatchButton.grid(columnspan=3, sticky=(W), padx =20)
+        config.checks['watch'] = watch_check
+
+        # ---- Precision Check Button: data loaded in single precision, half
+        # the memory (config.load_dtype)
+
+        single_check = BooleanVar()
+        single_check.set(config.load_dtype == 'float32')
+        SingleButton = Checkbutton(main_frame, text = 'Single precision (less memory)', \
+                                   variable = single_check, padx = 20, pady = 10, \
+                                   command = self.__read_checks)
+        SingleButton.grid(columnspan=3, sticky=(W), padx =20)
+        config.checks['single'] = single_check
+
    
         # ---- Plot, z/tau scale, Close Buttons
 
@@ -194,49 +281,14 @@ class SirGUI:
         # vice-versa, or may select models and profiles that don't have
         # correspondence to each other).
         
-        per_files = [x for x in filelist if x.endswith('.per')]
-        mod_files = [x for x in filelist if x.endswith('.mod')]
+        self.__set_runs(sp.parse_filelist(filelist))
 
-        per_names = [] # temporary var that saves profile (.per) files
-        mod_names = [] # temporary var that saves model (.mod) files
-        
-        try: #for Python 3
-            config.per_mask.clear()
-            config.mod_mask.clear()
-        except: # for python 2.7
-            config.per_mask[:] = []
-            config.mod_mask[:] = []
-
-        # Get file names without path or extension. Will use them for
-        # figure legends
-        for file in per_files:
-            per_names.append(file[:-4].rpartition('/')[2])
-        for file in mod_files:
-            mod_names.append(file[:-4].rpartition('/')[2])
-        # Save the file path (common to all files)
-        config.file_path = file.rpartition('/')[0]+'/'
+    def __set_runs(self, runs):
+        # Method that saves the runs selected by the user (file_path,
+        # legend_names, per_mask, mod_mask) in the global variables
 
-        
-        if per_names != mod_names: # Profile and model lists are different
-            # keep all unique names
-            config.legend_names = list(set(per_names+mod_names))
-            # create masks for profiles and models
-            for name in config.legend_names:
-                if name in per_names:
-                    config.per_mask.append(1)
-                else:
-                    config.per_mask.append(0)
-                    
-            for name in config.legend_names:
-                if name in mod_names:
-                    config.mod_mask.append(1)
-                else:
-                    config.mod_mask.append(0)
-                  
-        else: # Both lists are identical
-            config.legend_names = mod_names
-            config.per_mask = [1]*len(mod_names)
-            config.mod_mask = [1]*len(mod_names)
+        config.file_path, config.legend_names, config.per_mask, \
+          config.mod_mask = runs
 
         
     def __file_select(self):
@@ -244,7 +296,10 @@ class SirGUI:
         # Calls self.__file_parse to separate mod and per files and creates masks.
         filez = tkFileDialog.askopenfilenames\
           (initialdir='./', title="Select a file:", \
-               filetypes=[('SIR files','*.per *.mod')])
+               filetypes=[('SIR files','*.per *.mod'), \
+                          ('Compressed SIR files', '*.per.gz *.mod.gz '\
+                           '*.per.bz2 *.mod.bz2 *.per.xz *.mod.xz '\
+                           '*.per.zst *.mod.zst')])
         #filez = tkFileDialog.askopenfilenames\
         #  (initialdir='./', title="Select a Stokes file:",\
         #       filetypes=(('Stokes files','*.per'),('Model files', '*.mod')))
@@ -256,15 +311,37 @@ class SirGUI:
         else:
             tkMessageBox.showwarning("No file selected","Plese load a file")
         
-    def __plot_stokes(self):
-        # Method that calls the VisualizationCanvas class, that does all the
-        # plots and creates the canvas
-
-        config.stokes_chks = np.array([int(config.checks['I'].get()),\
+    def __directory_select(self):
+        # Method that opens a directory dialog and lists the runs of the
+        # directory tree (catalog kept between sessions), filtered by name,
+        # for the user to select some of them.
+        directory = tkFileDialog.askdirectory(initialdir='./', \
+                                              title="Select a directory:")
+        if directory:
+            from runselector import RunSelector
+            RunSelector(self.__main_frame, directory, self.__set_runs)
+
+    def __map_select(self):
+        # Method that opens a directory dialog for a raster map (one .per and
+        # .mod file per pixel) and shows it in a map window. Clicking a pixel
+        # plots its files with the parameters checked in this window.
+        directory = tkFileDialog.askdirectory(initialdir='./', \
+                                              title="Select a map directory:")
+        if directory:
+            # matplotlib is imported with the first map window
+            from mapviewer import MapCanvas
+            self.__read_checks()
+            MapCanvas(self.__main_frame, directory, self.__read_checks)
+
+    def __read_checks(self):
+        # Method that saves the Stokes and model parameters checked by the
+        # user in the global variables
+
+        config.stokes_chks = ([int(config.checks['I'].get()),\
                                     int(config.checks['Q'].get()),\
                                     int(config.checks['U'].get()),\
                                     int(config.checks['V'].get())])
-        config.model_chks = np.array([int(config.checks['T'].get()),\
+        config.model_chks = ([int(config.checks['T'].get()),\
                                    int(config.checks['Pe'].get()),\
                                    int(config.checks['vmic'].get()),\
                                    int(config.checks['B'].get()),\
@@ -273,13 +350,31 @@ class SirGUI:
                                    int(config.checks['phi'].get())])
         # number of Stokes and Models Checked                           
 
-        config.n_stokes_chks = np.sum(config.stokes_chks)      
-        config.n_model_chks = np.sum(config.model_chks)
+        config.n_stokes_chks = sum(config.stokes_chks)      
+        config.n_model_chks = sum(config.model_chks)
         # Total number of subplots plus 1 (for figure legend)
         config.total_chks = config.n_stokes_chks + config.n_model_chks
+        # Precision of the data read, for the plot and map windows
+        if config.checks['single'].get():
+            config.load_dtype = 'float32'
+        else:
+            config.load_dtype = 'float64'
+
+    def __plot_stokes(self):
+        # Method that calls the VisualizationCanvas class, that does all the
+        # plots and creates the canvas
 
+        self.__read_checks()
         if config.total_chks > 0:
-            canvas = VisualizationCanvas(self.__main_frame, title = "Stokes Plots")
+            if self.__plotwindow is not None and self.__plotwindow.winfo_exists():
+                # update the figure of the open plot window in place
+                self.__plotwindow.replot()
+                self.__plotwindow.lift()
+            else:
+                # matplotlib is imported with the first plot window
+                from visualization import VisualizationCanvas
+                self.__plotwindow = VisualizationCanvas(self.__main_frame, \
+                                                        title = "Stokes Plots")
         else:
             tkMessageBox.showwarning("No parameters to plot","Plese check one or more parameters to plot")
 #########################################################################
@@ -287,9 +382,10 @@ class SirGUI:
 #########################################################################
 
 
-root = Tk()
-root.wm_title('SIR GUI')
+if __name__ == '__main__':
+    root = Tk()
+    root.wm_title('SIR GUI')
 
-sirgui = SirGUI(root)
-root.mainloop()
+    sirgui = SirGUI(root)
+    root.mainloop()
         
@@ -0,0 +1,1667 @@
+"""
+Builds the figures with Stokes profiles and model atmospheres shown by the
+GUI. Used by the Tk canvas (visualization.py) and by the headless batch
+renderer (sirbatch.py). Does not import Tk or pyplot, and imports
+matplotlib only to build figures.
+
+******* Contains:
+
+>> file_path, legend_names, per_mask, mod_mask = parse_filelist(filelist)
+
+>> data = load_runs(legend_names, file_path, per_mask, mod_mask, read_err)
+
+>> summary = aggregate_runs(legend_names, file_path, per_mask, mod_mask)
+
+>> maps = load_map(directory), points = map_points(maps, quantity)
+
+>> image, extent = map_image(maps, quantity, index)
+
+>> file_path, legend_names, per_mask, mod_mask = pixel_runs(maps, y, x)
+
+>> watch = RunWatch(file_path, legend_names), runs = watch.poll()
+
+>> frames = run_cycles(file_path, legend_names)
+
+>> animation = CycleAnimation(file_path, legend_names, stokes_chks, model_chks)
+>> animation.load(), image = animation.frame(k), animation.export(filename)
+
+>> sir_fig = build_figure(data, legend_names, stokes_chks, model_chks, read_err, zscale)
+
+>> xd, yd = minmax_decimate(x, y, nbins, xmin=None, xmax=None)
+
+>> verts = error_band(x, y, err)
+
+>> model = FigureModel(sir_fig), changed = model.update(data, ...), model.redraw(changed)
+
+"""
+
+import sys
+import errno
+import tempfile
+
+import numpy as np
+
+import config
+import sirtools2 as st
+
+
+def parse_filelist(filelist):
+    # Parses a list of .per and .mod files, creates the figure legend names
+    # and the masks that define whether a given profile or model file exists
+    # or not (the user can select more models than profiles, or vice-versa,
+    # or may select models and profiles that don't have correspondence to
+    # each other). The runs are in the order of their first file in
+    # filelist. Files of several directories are named after their path
+    # from the common directory (as sub/inv_1), so that file_path+name is
+    # always the file without extension.
+    import os
+
+    # compressed files (inv_1.per.gz) are named as the plain ones, which
+    # the readers of sirtools2 find
+    files = [st.plainname(x) for x in filelist]
+    files = [x for x in files if x.endswith('.per') or x.endswith('.mod')]
+    directories = set([file[:file.rfind('/')+1] for file in files])
+    # The file path (common to all files)
+    if len(directories) == 1:
+        file_path = directories.pop()
+    else:
+        file_path = os.path.commonpath(list(directories))
+        if file_path and not file_path.endswith('/'):
+            file_path += '/'
+
+    legend_names = []
+    index = {} # legend name -> position in legend_names
+    per_mask = []
+    mod_mask = []
+    # Get file names without common path or extension. Will use them for
+    # figure legends
+    for file in files:
+        name = file[len(file_path):-4]
+        if name not in index:
+            index[name] = len(legend_names)
+            legend_names.append(name)
+            per_mask.append(0)
+            mod_mask.append(0)
+        if file.endswith('.per'):
+            per_mask[index[name]] = 1
+        else:
+            mod_mask[index[name]] = 1
+
+    return(file_path, legend_names, per_mask, mod_mask)
+
+def load_runs(legend_names, file_path, per_mask, mod_mask, read_err=False, \
+              workers=None, processes=False, progress=None, cancel=None, \
+              dtype=None):
+    # Reads the .per, .mod (and, if read_err, .err) files of every run and
+    # computes the default figure limits. dtype='float32' keeps the data in
+    # single precision (see sirtools2.readfiles). Returns a dictionary with
+    # the data to plot, or None if loading was cancelled.
+
+    Nfiles = len(legend_names)
+    
+    # Variables that will contain the data to plot:
+    Stokes = []
+    Profiles = [] # st.Profile of each entry of Stokes (line index, wvlen)
+    Models = []
+    Errors = []
+    ErrorFileMask=[] # Mask variable for error files
+    ErrorIndex = [] # index in Errors of the error file of each run, or None
+    # Variable that captures if all models contain a z-scale column
+    is_z = True
+    # ---- Read files in list of files, concurrently. Only the files
+    # selected by the user (per_mask, mod_mask) are read. Local copies
+    # of the masks are cleared for files that could not be read.
+    per_mask = list(per_mask)
+    mod_mask = list(mod_mask)
+    base = [file_path+name for name in legend_names]
+    filenames = []
+    for jj in np.arange(0,Nfiles):
+        if per_mask[jj]:
+            filenames.append(base[jj]+'.per')
+        if mod_mask[jj]:
+            filenames.append(base[jj]+'.mod')
+        # If the error button is checked, then read error files (only shown
+        # on the model panels)
+        if read_err and mod_mask[jj]:
+            filenames.append(base[jj]+'.err')
+    results = dict(zip(filenames, st.readfiles(filenames, \
+                                              workers=workers,\
+                                              processes=processes,\
+                                              progress=progress,\
+                                              cancel=cancel, dtype=dtype, \
+                                              share_grids=True)))
+    if cancel is not None and cancel.is_set():
+        return(None)
+    failures = []
+    # Running minimum and maximum of the model columns, for the default
+    # figure limits: merged from the per-file stats of sirtools2, so that
+    # no array of all the models is built
+    model_columns = [0, 1, 2, 3, 4, 5, 6, 7, 11, 12, 13]
+    model_scale = np.array(st.MODEL_SCALE)
+    model_min = np.full(11, np.inf)
+    model_max = np.full(11, -np.inf)
+    common_wvlen = None # wavelength grid of all the profiles, if they share one
+
+    for jj in np.arange(0,Nfiles):
+        if per_mask[jj]: # Stokes profiles
+            data, error = results[base[jj]+'.per']
+            if error is None:
+                line_ind, wvlen, StkI, StkQ, StkU, StkV = data
+                Stokes.append([StkI, StkQ, StkU, StkV])
+                Profiles.append(data)
+                # grids are shared by identical files (st.intern_grid)
+                if len(Stokes) == 1:
+                    common_wvlen = wvlen
+                elif wvlen is not common_wvlen:
+                    common_wvlen = None
+            else: # keep the Stokes index consistent with per_mask
+                per_mask[jj] = 0
+                failures.append((base[jj]+'.per', error))
+
+        if mod_mask[jj]: # Model files
+            data, error = results[base[jj]+'.mod']
+            if error is None:
+                # tau, T, Pe, vmic, B, vlos, gamma, phi, z, rho, Pg in the
+                # units of the plots (st.Model)
+                Models.append(data.scaled())
+
+                # Check if new model contains a z-scale column. Update is_z.
+                is_z = is_z and data.has_z and (np.absolute(data.z).sum() !=0)
+                lower, upper = st.filestats(base[jj]+'.mod', data)
+                model_min = np.fmin(model_min, lower[model_columns])
+                model_max = np.fmax(model_max, upper[model_columns])
+            else:
+                mod_mask[jj] = 0
+                failures.append((base[jj]+'.mod', error))
+
+        if read_err and base[jj]+'.err' in results: # Error files
+            data, error = results[base[jj]+'.err']
+            if error is None and mod_mask[jj]:
+                ErrorIndex.append(len(Errors))
+                Errors.append(data.scaled())
+                ErrorFileMask.append(1)
+            else: # corresponding error (or model) file does not exist
+                ErrorIndex.append(None)
+                ErrorFileMask.append(0)
+                # a missing .err is normal (not every run has one): only
+                # the files that could not be parsed are reported
+                if error is not None and \
+                   getattr(error, 'errno', None) != errno.ENOENT:
+                    failures.append((base[jj]+'.err', error))
+        else:
+            ErrorIndex.append(None)
+            ErrorFileMask.append(0)
+
+    # Calculate default figure limits
+    model_min = model_min/model_scale
+    model_max = model_max/model_scale
+    lower_limits = []
+    upper_limits = []
+    for jj in range(0,11):
+        if len(Models) == 0:
+            datamin = 0.0
+            datamax = 0.0
+        else:
+            datamin = model_min[jj]*0.9
+            datamax = model_max[jj]*1.1
+        if datamin == datamax:
+            datamax = datamin+1
+            datamin -= 1
+        lower_limits.append(datamin)
+        upper_limits.append(datamax)
+
+    return({'Stokes': Stokes, 'Profiles': Profiles, 'Models': Models, \
+            'Errors': Errors, \
+            'ErrorFileMask': ErrorFileMask, 'ErrorIndex': ErrorIndex, \
+            'wvlen': common_wvlen, \
+            'per_mask': per_mask, \
+            'mod_mask': mod_mask, 'is_z': is_z, 'failures': failures, \
+            'lower_limits': lower_limits, 'upper_limits': upper_limits})
+
+
+def _stack_files(filenames, columns, chunk, workers, processes, progress, \
+                 cancel, grid_column=None, dtype=None, shared_grid=None):
+    # Reads the files in chunks of chunk files and stacks the given columns
+    # of their data in an array (ncolumns, nfiles, npoints), kept in a
+    # temporary file if larger than config.aggregate_memory_bytes. With
+    # grid_column, the index of the depth scale in columns, each chunk is
+    # resampled onto the depth grid of the first file; otherwise files with
+    # a different number of points than the first one are skipped. With
+    # shared_grid, a function that returns the interned grid of a file (see
+    # st.intern_grid), files with another grid than the first one are
+    # skipped. The array has type dtype (float64 if None).
+    # Returns the array (only the first n files are filled), n, and the
+    # failures.
+    stack = None
+    grid = None
+    n = 0
+    failures = []
+    for start in range(0, len(filenames), chunk):
+        names = filenames[start:start+chunk]
+        report = None
+        if progress is not None:
+            report = lambda ndone, ntotal, start=start: progress(start+ndone)
+        results = st.readfiles(names, workers=workers, processes=processes, \
+                               progress=report, cancel=cancel, dtype=dtype, \
+                               share_grids=True)
+        if cancel is not None and cancel.is_set():
+            return(None, 0, failures)
+        resample = []
+        for name, (data, error) in zip(names, results):
+            if error is not None:
+                failures.append((name, error))
+                continue
+            columns_data = [columns[key](data) for key in range(len(columns))]
+            if grid_column is not None and grid is not None:
+                resample.append(columns_data)
+                continue
+            if stack is None:
+                shape = (len(columns), len(filenames), len(columns_data[0]))
+                itemsize = np.dtype(dtype or np.float64).itemsize
+                nbytes = itemsize*shape[0]*shape[1]*shape[2]
+                if nbytes > config.aggregate_memory_bytes:
+                    stack = np.memmap(tempfile.TemporaryFile(), \
+                                      dtype=dtype or np.float64, mode='w+', \
+                                      shape=shape)
+                else:
+                    stack = np.empty(shape, dtype=dtype or np.float64)
+                if grid_column is not None:
+                    grid = columns_data[grid_column]
+                if shared_grid is not None:
+                    grid = shared_grid(data)
+                    first = name
+            if shared_grid is not None and shared_grid(data) is not grid:
+                failures.append((name, ValueError('different grid than {0}'\
+                                                  .format(first))))
+                continue
+            if len(columns_data[0]) != stack.shape[2]:
+                failures.append((name, ValueError('{0} points, {1} expected'\
+                                 .format(len(columns_data[0]), stack.shape[2]))))
+                continue
+            for key in range(len(columns)):
+                stack[key, n, :] = columns_data[key]
+            n = n + 1
+        if len(resample) > 0: # the whole chunk at once
+            grid, cube = st.resample(resample, grid=grid, column=grid_column)
+            stack[:, n:n+len(resample), :] = cube.transpose(1, 0, 2)
+            n = n + len(resample)
+    return(stack, n, failures)
+
+
+def _percentiles(stack, n, percentiles, chunk):
+    # Percentiles over the files (axis 1) of the first n files of stack, for
+    # blocks of points so that at most about chunk*npoints values are
+    # in memory at once. Returns a list with one (len(percentiles), npoints)
+    # array per column.
+    stats = []
+    block = max(1, int(chunk*stack.shape[2]/max(n, 1)))
+    for key in range(stack.shape[0]):
+        out = np.empty((len(percentiles), stack.shape[2]))
+        for j0 in range(0, stack.shape[2], block):
+            values = np.asarray(stack[key, 0:n, j0:j0+block])
+            out[:, j0:j0+block] = np.nanpercentile(values, percentiles, axis=0)
+        stats.append(out)
+    return(stats)
+
+
+def aggregate_runs(legend_names, file_path, per_mask, mod_mask, \
+                   percentiles=None, chunk=None, workers=None, \
+                   processes=False, progress=None, cancel=None, dtype=None):
+    # Statistical summary of a large set of runs: stacks the Stokes profiles
+    # and the models of all the runs and computes, for every wavelength or
+    # depth point, the percentiles (config.percentiles by default: median,
+    # 16-84 and 5-95 percent bands). Files are read and reduced in chunks of
+    # chunk files (config.aggregate_chunk), so that memory stays bounded
+    # for any number of runs. Returns a dictionary like load_runs, with one
+    # (len(percentiles), npoints) array per Stokes parameter and per model
+    # column, or None if loading was cancelled. Models with other depth
+    # grids are interpolated onto the log(tau) grid of the first one.
+    # dtype='float32' halves the memory of the stacked data.
+
+    if percentiles is None:
+        percentiles = config.percentiles
+    if chunk is None:
+        chunk = config.aggregate_chunk
+    base = [file_path+name for name in legend_names]
+    per_files = [base[jj]+'.per' for jj in range(len(base)) if per_mask[jj]]
+    mod_files = [base[jj]+'.mod' for jj in range(len(base)) if mod_mask[jj]]
+    ntotal = len(per_files) + len(mod_files)
+
+    def report(offset):
+        if progress is None:
+            return(None)
+        return(lambda ndone: progress(offset+ndone, ntotal))
+
+    # ---- Stokes I, Q, U, V
+    stack, nper, failures = _stack_files(per_files, \
+      [lambda data, k=k: data[2+k] for k in range(4)], chunk, workers, \
+      processes, report(0), cancel, dtype=dtype, \
+      shared_grid=lambda data: data.wvlen)
+    if cancel is not None and cancel.is_set():
+        return(None)
+    Stokes = []
+    if nper > 0:
+        Stokes = _percentiles(stack, nper, percentiles, chunk)
+    del stack
+
+    # ---- Model columns in the units of load_runs: tau, T, Pe, vmic, B,
+    # vlos, gamma, phi, z. A model without z column has z = 0.
+    columns = [lambda data, c=c: data.scaled()[c] for c in range(0,9)]
+    stack, nmod, mod_failures = _stack_files(mod_files, columns, chunk, \
+      workers, processes, report(len(per_files)), cancel, grid_column=0, \
+      dtype=dtype)
+    if cancel is not None and cancel.is_set():
+        return(None)
+    failures = failures + mod_failures
+    Models = []
+    is_z = True
+    if nmod > 0:
+        # all models must have a z column to plot against z: a finite, non
+        # zero sum of |z| (NaN of resampling or padding ignored)
+        for j0 in range(0, nmod, chunk):
+            zsum = np.nansum(np.absolute(np.asarray(stack[8, j0:j0+chunk])),\
+                             axis=1)
+            is_z = is_z and bool(np.all(np.isfinite(zsum) & (zsum != 0)))
+        Models = _percentiles(stack, nmod, percentiles, chunk)
+    del stack
+
+    # Default figure limits, from the outermost percentiles
+    lower_limits = []
+    upper_limits = []
+    for jj in range(0,9):
+        if len(Models) == 0:
+            datamin = 0.0
+            datamax = 0.0
+        else:
+            datamin = np.nanmin(Models[jj][0])*0.9
+            datamax = np.nanmax(Models[jj][-1])*1.1
+        if datamin == datamax:
+            datamax = datamin+1
+            datamin -= 1
+        lower_limits.append(datamin)
+        upper_limits.append(datamax)
+
+    return({'summary': True, 'percentiles': list(percentiles), \
+            'Stokes': Stokes, 'Models': Models, 'nper': nper, 'nmod': nmod, \
+            'is_z': is_z, 'failures': failures, \
+            'lower_limits': lower_limits, 'upper_limits': upper_limits})
+
+
+def load_map(directory, workers=None, processes=False, progress=None, \
+             cancel=None, dtype=None):
+    # Reads the raster map of directory, one run per pixel (as inv_0012_0034
+    # .per and .mod, see st.readmap). With config.cache_dir, the arrays are
+    # memory-mapped files kept in its subdirectory maps (named after
+    # config.map_cube_name and the path of directory), so that a later call
+    # reuses them, or completes them if the reading was interrupted; they
+    # are kept in memory without it, or if it cannot be written. Returns a
+    # dictionary with the maps of the profiles ('per') and of the models
+    # ('mod'), None if there are no such files, the failures, and 'limits',
+    # the limits of the figures of all the pixels (keys of load_runs, and
+    # 'stokes_limits' for the Stokes panels); or None if loading was
+    # cancelled.
+    import os
+    import hashlib
+
+    prefix = None # of the files of the arrays
+    if config.cache_dir:
+        cubes = os.path.join(config.cache_dir, 'maps')
+        try:
+            if not os.path.isdir(cubes):
+                os.makedirs(cubes)
+            if os.access(cubes, os.W_OK):
+                key = hashlib.md5(os.path.abspath(directory).encode('utf-8'))
+                prefix = os.path.join(cubes, config.map_cube_name + '_' + \
+                                      key.hexdigest()[:16] + '_')
+        except OSError: # kept in memory
+            pass
+
+    pixels = {}
+    for ext in ('.per', '.mod'):
+        pixels[ext] = st.mapfiles(directory, ext, config.map_pattern)
+    ntotal = len(pixels['.per']) + len(pixels['.mod'])
+    if ntotal == 0:
+        raise IOError('No .per or .mod files of pixels in '+directory)
+
+    maps = {'per': None, 'mod': None, 'failures': []}
+    offset = 0
+    for ext in ('.per', '.mod'):
+        if len(pixels[ext]) == 0:
+            continue
+        out = None
+        if prefix is not None:
+            out = prefix + ext[1:]
+        report = None
+        if progress is not None:
+            report = lambda ndone, n, offset=offset: progress(offset+ndone, \
+                                                              ntotal)
+        try:
+            result = st.readmap(directory, ext, config.map_pattern, out=out, \
+                                workers=workers, processes=processes, \
+                                progress=report, cancel=cancel, dtype=dtype)
+        except IOError as error: # no pixel could be read
+            maps['failures'].append((directory, error))
+            result = None
+        if cancel is not None and cancel.is_set():
+            return(None)
+        if result is not None:
+            maps[ext[1:]] = result
+            maps['failures'] += result['failures']
+        offset += len(pixels[ext])
+
+    # ---- Limits of the figures of the pixels, the same for the whole map
+    # (as load_runs gives them for a set of runs), so that the axes of the
+    # plot window do not change from one pixel to the next
+    maps['limits'] = {}
+    if maps['per'] is not None:
+        lower, upper = _cube_range(maps['per']['data'])
+        margin = (upper-lower)*0.05
+        maps['limits']['stokes_limits'] = list(zip(lower-margin, upper+margin))
+    if maps['mod'] is not None:
+        lower, upper = _cube_range(maps['mod']['data'])
+        if len(lower) < 11: # no z, rho, Pg columns
+            lower = np.append(lower, [0., 0., 0.])
+            upper = np.append(upper, [0., 0., 0.])
+        scale = np.array(st.MODEL_SCALE)
+        lower = lower/scale*0.9
+        upper = upper/scale*1.1
+        same = (lower == upper)
+        upper[same] = lower[same]+1
+        lower[same] -= 1
+        maps['limits']['lower_limits'] = list(lower)
+        maps['limits']['upper_limits'] = list(upper)
+    return(maps)
+
+
+def _cube_range(cube, rows=16):
+    # Minimum and maximum of every column (last axis) of a (ny, nx, npoints,
+    # ncol) map cube, NaN ignored, read by blocks of rows
+    lower = np.full(cube.shape[-1], np.inf)
+    upper = np.full(cube.shape[-1], -np.inf)
+    for y in range(0, cube.shape[0], rows):
+        block = np.asarray(cube[y:y+rows]).reshape(-1, cube.shape[-1])
+        if np.isnan(block).all():
+            continue
+        lower = np.fmin(lower, np.nanmin(block, axis=0))
+        upper = np.fmax(upper, np.nanmax(block, axis=0))
+    return(lower, upper)
+
+
+def map_points(maps, quantity):
+    # Wavelengths (quantity 0-3, Stokes I, Q, U, V) or log(tau) of the
+    # first pixel read (quantity 4-10, model parameters) of the map of
+    # load_map: the points at which map_image can show the quantity.
+    if quantity < 4:
+        return(maps['per']['grid'][1])
+    cube = maps['mod']
+    first = np.unravel_index(np.argmax(cube['mask']), cube['mask'].shape)
+    return(np.asarray(cube['data'][first][:, 0], dtype=float))
+
+
+def map_image(maps, quantity, index):
+    # Image of one quantity of the map of load_map, at one wavelength or
+    # depth point (see map_points): quantity 0-3 is Stokes I, Q, U, V, 4-10
+    # a model parameter T, Pe, vmic, B, vlos, gamma, phi in the units of
+    # the plots. Returns the (ny, nx) image and its extent (left, right,
+    # bottom, top) in the pixel coordinates of the file names.
+    if quantity < 4:
+        cube = maps['per']
+        image = np.asarray(cube['data'][:, :, index, quantity], dtype=float)
+    else:
+        cube = maps['mod']
+        image = cube['data'][:, :, index, quantity-3]/\
+                st.MODEL_SCALE[quantity-3]
+    y0, x0 = cube['origin']
+    ny, nx = image.shape
+    return(image, (x0-0.5, x0+nx-0.5, y0-0.5, y0+ny-0.5))
+
+
+def pixel_runs(maps, y, x):
+    # Files of the pixel y, x (coordinates of the file names) of the map of
+    # load_map, as parse_filelist returns them: file_path, legend_names,
+    # per_mask, mod_mask. Returns None if the pixel has no files.
+    filelist = []
+    for kind in ('per', 'mod'):
+        cube = maps[kind]
+        if cube is None:
+            continue
+        iy = y - cube['origin'][0]
+        ix = x - cube['origin'][1]
+        ny, nx = cube['index'].shape
+        if 0 <= iy < ny and 0 <= ix < nx and cube['index'][iy, ix] >= 0:
+            filelist.append(cube['files'][cube['index'][iy, ix]])
+    if len(filelist) == 0:
+        return(None)
+    return(parse_filelist(filelist))
+
+
+class RunWatch(object):
+    ''' Follows the files of running inversions. SIR writes the results of
+    every cycle as name_1.per, name_1.mod, name_2.per, ...: the watch of
+    the runs legend_names in file_path (named with or without a cycle
+    number) finds the files of all their cycles as they are written.
+    The cost of poll does not grow with the directories: a directory is
+    listed again only when its modification time changes, and only the
+    files of the last cycle of each run, and those still being written,
+    are checked. A file is taken once its size and modification time are
+    the same in two polls, so that files being written are not read; the
+    files of the cycles before the last one of a run are complete, and are
+    taken at the first poll. Names may have subdirectories (sub/name_1),
+    as parse_filelist gives them. cycle_pattern is the regular expression
+    of the cycle number at the end of a name (config.cycle_pattern if
+    None), with a group named cycle.
+    '''
+
+    def __init__(self, file_path, legend_names, cycle_pattern=None):
+
+        import os
+        import re
+
+        if cycle_pattern is None:
+            cycle_pattern = config.cycle_pattern
+        self.selection = (file_path, list(legend_names))
+        self.runs = None # file_path, legend_names, per_mask, mod_mask
+        stems = []
+        for name in legend_names:
+            stem = re.sub('(' + cycle_pattern + ')$', '', name)
+            if stem not in stems:
+                stems.append(stem)
+        self.__stems = stems
+        # subdirectory of the runs (path from file_path) -> pattern of the
+        # names of their files
+        bydir = {}
+        for stem in stems:
+            subdir, base = os.path.split(stem)
+            bydir.setdefault(subdir, []).append(base)
+        self.__patterns = {}
+        for subdir, bases in bydir.items():
+            self.__patterns[subdir] = re.compile('(?P<stem>' + '|'.join(\
+                                      [re.escape(base) for base in bases]) + \
+                                      ')(' + cycle_pattern + ')?' + \
+                                      r'\.(?P<ext>per|mod|err)' + \
+                                      r'(\.gz|\.bz2|\.xz|\.zst)?$')
+        self.__listed = {}   # subdirectory -> modification time listed
+        self.__files = {}    # file name -> (run, cycle, name without ext)
+        self.__latest = {}   # (run, ext) -> file name of the last cycle
+        self.__stats = {}    # file name -> (size, mtime) at the last poll
+        self.__ready = {}    # file name -> (size, mtime) when taken
+        self.poll(first=True)
+
+    def poll(self, first=False):
+        ''' Looks for new or changed files. Returns the runs of all the
+        files taken (file_path, legend_names, per_mask, mod_mask, as
+        parse_filelist), if any changed, or None.
+        '''
+
+        import os
+        import time
+
+        file_path = self.selection[0] or './'
+        for subdir, pattern in self.__patterns.items():
+            prefix = subdir + '/' if subdir else ''
+            directory = file_path + prefix
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+            except OSError:
+                continue
+            # list again if the directory changed, or could change within
+            # the resolution of its modification time
+            if mtime == self.__listed.get(subdir) and \
+               time.time_ns() - mtime >= 2*10**9:
+                continue
+            self.__listed[subdir] = mtime
+            for entry in os.scandir(directory):
+                name = prefix + entry.name # file name from file_path
+                if name in self.__files:
+                    continue
+                match = pattern.match(entry.name)
+                if match is None:
+                    continue
+                run = self.__stems.index(prefix + match.group('stem'))
+                cycle = int(match.group('cycle') or 0)
+                ext = match.group('ext')
+                self.__files[name] = (run, cycle, st.plainname(name)[:-4])
+                self.__stats[name] = None
+                last = self.__latest.get((run, ext))
+                if last is None or self.__files[last][1] < cycle:
+                    self.__latest[(run, ext)] = name
+
+        # ---- Files not taken yet, or of the last cycle of a run
+        latest = set(self.__latest.values())
+        changed = False
+        for name in list(set(self.__stats) | latest):
+            try:
+                stat = os.stat(file_path+name)
+            except OSError: # removed
+                self.__stats.pop(name, None)
+                continue
+            stat = (stat.st_size, stat.st_mtime_ns)
+            if (first and name not in latest) or \
+               (stat == self.__stats.get(name) and stat[0] > 0):
+                if self.__ready.get(name) != stat:
+                    self.__ready[name] = stat
+                    changed = True
+                if name not in latest: # will not change any more
+                    self.__stats.pop(name, None)
+                    continue
+            self.__stats[name] = stat
+
+        if not changed:
+            return(None)
+        runs = sorted(set([self.__files[name] for name in self.__ready \
+                           if not st.plainname(name).endswith('.err')]))
+        legend_names = [run[2] for run in runs]
+        ready = set([st.plainname(name) for name in self.__ready])
+        per_mask = [int(name+'.per' in ready) for name in legend_names]
+        mod_mask = [int(name+'.mod' in ready) for name in legend_names]
+        self.runs = (self.selection[0], legend_names, per_mask, mod_mask)
+        return(self.runs)
+
+
+def run_cycles(file_path, legend_names, cycle_pattern=None):
+    # Frames of an animation of the cycles of the runs legend_names in
+    # file_path (named with or without a cycle number, see RunWatch for
+    # cycle_pattern): a list of (cycle, (file_path, legend_names, per_mask,
+    # mod_mask)), one per cycle number, with the files of the last cycle of
+    # each run up to that cycle. Returns an empty list if there are no files.
+    import re
+    import time
+
+    if cycle_pattern is None:
+        cycle_pattern = config.cycle_pattern
+    watch = RunWatch(file_path, legend_names, cycle_pattern)
+    time.sleep(0.1) # the last cycles are taken if not being written
+    watch.poll()
+    runs = watch.runs
+    if runs is None:
+        return([])
+    file_path, names, per_mask, mod_mask = runs
+    latest = {}  # run -> (name, per, mod) of its last cycle
+    bycycle = {} # cycle -> [(run, name, per, mod)]
+    for name, per, mod in zip(names, per_mask, mod_mask):
+        match = re.match('(?P<stem>.*?)(' + cycle_pattern + ')?$', name)
+        bycycle.setdefault(int(match.group('cycle') or 0), []).append(\
+          (match.group('stem'), name, per, mod))
+    frames = []
+    order = [] # runs in the order they appear
+    for cycle in sorted(bycycle):
+        for run, name, per, mod in bycycle[cycle]:
+            if run not in latest:
+                order.append(run)
+            latest[run] = (name, per, mod)
+        files = [latest[run] for run in order]
+        frames.append((cycle, (file_path, [name for name, per, mod in files],\
+                               [per for name, per, mod in files], \
+                               [mod for name, per, mod in files])))
+    return(frames)
+
+
+class CycleAnimation(object):
+    ''' Animation of the cycles of running or finished inversions (see
+    run_cycles): frame k shows the files of cycle k of every run, with
+    the limits of all the cycles, so that the axes stay the same.
+    Frames are rendered off screen (Agg) by a FigureModel of their own,
+    updated in place from one frame to the next, and kept as RGB arrays
+    in a cache of at most max_bytes (least recently used frames are
+    dropped), so that a loading thread can render them ahead and going
+    back and forth through the cycles only shows arrays. All the files
+    are read once by load, and again for every frame from the in-memory
+    store of sirtools2, if enabled.
+    '''
+
+    def __init__(self, file_path, legend_names, stokes_chks, model_chks, \
+                 read_err=False, zscale=False, split_lines=False, \
+                 dtype=None, size=None, dpi=None, max_bytes=None):
+
+        import threading
+
+        self.frames = run_cycles(file_path, legend_names)
+        if len(self.frames) == 0:
+            raise IOError('No .per or .mod files of the runs in '+file_path)
+        self.cycles = [cycle for cycle, runs in self.frames]
+        self.limits = None
+        self.__options = (stokes_chks, model_chks, read_err, zscale, \
+                          split_lines, dtype)
+        self.__size = size
+        self.__dpi = dpi
+        if max_bytes is None:
+            max_bytes = config.animation_cache_bytes
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.__cache = {} # frame -> RGB array, in order of use
+        self.__model = None
+        self.__render_lock = threading.Lock() # one frame at a time
+        self.__cache_lock = threading.Lock()
+
+    def load(self, workers=None, processes=False, progress=None, \
+             cancel=None):
+        ''' Reads the files of all the frames and sets the limits of the
+        figure. Returns the failures of load_runs, or None if cancelled.
+        '''
+
+        stokes_chks, model_chks, read_err, zscale, split_lines, dtype = \
+          self.__options
+        names = {} # name -> (per, mod) of the files of all the frames
+        for cycle, runs in self.frames:
+            for name, per, mod in zip(*runs[1:]):
+                names[name] = (per, mod)
+        legend_names = sorted(names)
+        data = load_runs(legend_names, self.frames[0][1][0], \
+                         [names[name][0] for name in legend_names], \
+                         [names[name][1] for name in legend_names], \
+                         read_err=read_err, workers=workers, \
+                         processes=processes, progress=progress, \
+                         cancel=cancel, dtype=dtype)
+        if data is None:
+            return(None)
+        limits = {'lower_limits': data['lower_limits'], \
+                  'upper_limits': data['upper_limits']}
+        if len(data['Stokes']) > 0:
+            lower = np.array([[np.nanmin(s) for s in stokes] \
+                              for stokes in data['Stokes']]).min(axis=0)
+            upper = np.array([[np.nanmax(s) for s in stokes] \
+                              for stokes in data['Stokes']]).max(axis=0)
+            margin = (upper-lower)*0.05 + (upper == lower)
+            limits['stokes_limits'] = list(zip(lower-margin, upper+margin))
+        self.limits = limits
+        return(data['failures'])
+
+    def cached(self, k):
+        ''' The RGB array of frame k, if rendered, or None.
+        '''
+
+        with self.__cache_lock:
+            image = self.__cache.pop(k, None)
+            if image is not None:
+                self.__cache[k] = image # most recently used
+        return(image)
+
+    def frame(self, k):
+        ''' The RGB array (height, width, 3) of frame k, rendered if not
+        in the cache.
+        '''
+
+        image = self.cached(k)
+        if image is not None:
+            return(image)
+        with self.__render_lock:
+            image = self.cached(k) # rendered meanwhile
+            if image is None:
+                image = self.__render(k)
+        return(image)
+
+    def __render(self, k):
+        # Updates the figure with the files of frame k and draws the panels
+        # that changed into the Agg buffer
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        class BufferCanvas(FigureCanvasAgg):
+            # the drawn regions stay in the buffer; nothing to show
+            supports_blit = True
+            def blit(self, bbox=None):
+                pass
+
+        stokes_chks, model_chks, read_err, zscale, split_lines, dtype = \
+          self.__options
+        if self.__model is None:
+            sir_fig = Figure(figsize=self.__size, dpi=self.__dpi)
+            BufferCanvas(sir_fig)
+            self.__model = FigureModel(sir_fig)
+        file_path, legend_names, per_mask, mod_mask = self.frames[k][1]
+        data = load_runs(legend_names, file_path, per_mask, mod_mask, \
+                         read_err=read_err, workers=1, dtype=dtype)
+        if self.limits is not None:
+            data.update(self.limits)
+        changed = self.__model.update(data, legend_names, stokes_chks, \
+                                      model_chks, read_err=read_err, \
+                                      zscale=zscale, split_lines=split_lines)
+        if changed is None:
+            self.__model.figure.canvas.draw()
+        else:
+            self.__model.redraw(changed)
+        image = np.array(self.__model.figure.canvas.buffer_rgba())[:, :, :3]
+
+        with self.__cache_lock:
+            self.__cache[k] = image
+            self.nbytes += image.nbytes
+            while self.nbytes > self.max_bytes and len(self.__cache) > 1:
+                oldest = next(iter(self.__cache))
+                self.nbytes -= self.__cache.pop(oldest).nbytes
+        return(image)
+
+    def render(self, start=0, progress=None, cancel=None):
+        ''' Renders the frames not in the cache, from start on and then
+        from the first one, while they fit in the cache.
+        progress(ndone, ntotal) is called after each frame.
+        '''
+
+        nframes = len(self.frames)
+        for jj in range(0, nframes):
+            if cancel is not None and cancel.is_set():
+                return
+            if self.nbytes > self.max_bytes*0.9 and jj > 0:
+                return # would drop the frames rendered first
+            self.frame((start+jj) % nframes)
+            if progress is not None:
+                progress(jj+1, nframes)
+
+    def export(self, filename, fps=4, progress=None, cancel=None):
+        ''' Writes the animation to filename: an MP4 file through ffmpeg,
+        if installed, or a GIF (or any other format of Pillow with several
+        frames, as WebP or PNG) with Pillow. Returns False if cancelled.
+        '''
+
+        import os
+        from PIL import Image
+
+        nframes = len(self.frames)
+        def frames():
+            for k in range(0, nframes):
+                if cancel is not None and cancel.is_set():
+                    return
+                yield self.frame(k)
+                if progress is not None:
+                    progress(k+1, nframes)
+
+        if os.path.splitext(filename)[1].lower() in ('.mp4', '.m4v'):
+            _write_mp4(filename, frames(), fps)
+        else:
+            images = (Image.fromarray(image) for image in frames())
+            first = next(images)
+            first.save(filename, save_all=True, append_images=images, \
+                       duration=int(1000./fps), loop=0)
+        return(cancel is None or not cancel.is_set())
+
+
+def _write_mp4(filename, frames, fps):
+    # Writes the RGB arrays of frames to an H.264 MP4 file, through a pipe
+    # to the ffmpeg program (of matplotlib's animation.ffmpeg_path)
+    import shutil
+    import subprocess
+    import matplotlib
+
+    ffmpeg = shutil.which(matplotlib.rcParams['animation.ffmpeg_path'])
+    if ffmpeg is None:
+        raise IOError('MP4 export needs ffmpeg, which was not found; '\
+                      'export to GIF instead')
+    process = None
+    try:
+        for image in frames:
+            if process is None:
+                height, width = image.shape[:2]
+                process = subprocess.Popen([ffmpeg, '-y', '-loglevel', \
+                            'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24',\
+                            '-s', '{0}x{1}'.format(width, height), \
+                            '-r', str(fps), '-i', '-', '-vf', \
+                            'pad=ceil(iw/2)*2:ceil(ih/2)*2', \
+                            '-pix_fmt', 'yuv420p', filename], \
+                            stdin=subprocess.PIPE)
+            process.stdin.write(np.ascontiguousarray(image).tobytes())
+    finally:
+        if process is not None:
+            process.stdin.close()
+            if process.wait() != 0:
+                raise IOError('ffmpeg could not write '+filename)
+
+
+def build_figure(data, legend_names, stokes_chks, model_chks, read_err=False,\
+                 zscale=False, split_lines=False):
+    # Builds the figure with one panel per checked Stokes and model
+    # parameter, for the runs loaded by load_runs. The model parameters are
+    # plotted against z if zscale is set and all models have a z column.
+    # With split_lines, one Stokes panel per spectral line of the profiles.
+
+    model = FigureModel()
+    model.update(data, legend_names, stokes_chks, model_chks, \
+                 read_err=read_err, zscale=zscale, split_lines=split_lines)
+
+    return(model.figure)
+
+
+def minmax_decimate(x, y, nbins, xmin=None, xmax=None):
+    # Level of detail reduction of a curve for display: keeps the minimum
+    # and the maximum of y in each of nbins bins (about one per pixel
+    # column), so that line cores and Stokes V lobes are drawn exactly as
+    # with every sample. If x is increasing, only the samples between xmin
+    # and xmax (plus one on each side) are used. Returns x, y unchanged if
+    # there are fewer than 4*nbins samples.
+    lo, hi = 0, len(y)
+    if xmin is not None and len(x) > 1 and x[-1] > x[0]:
+        lo = max(0, int(np.searchsorted(x, xmin)) - 1)
+        hi = min(len(y), int(np.searchsorted(x, xmax, side='right')) + 1)
+    nbins = max(int(nbins), 1)
+    if hi - lo < 4*nbins:
+        return(x[lo:hi], y[lo:hi])
+
+    # ---- bins of binsize samples; the last partial bin is padded by
+    # repeating the last sample
+    binsize = int(np.ceil(float(hi-lo)/nbins))
+    index = np.arange(lo, lo+nbins*binsize).reshape(nbins, binsize)
+    index = np.minimum(index, hi-1)
+    values = y[index]
+    rows = np.arange(nbins)
+    imin = index[rows, np.argmin(values, axis=1)]
+    imax = index[rows, np.argmax(values, axis=1)]
+    # first and last samples are kept so that the x range does not shrink
+    keep = np.concatenate(([lo], np.minimum(imin, imax), \
+                           np.maximum(imin, imax), [hi-1]))
+    keep = np.unique(keep)
+
+    return(x[keep], y[keep])
+
+
+def error_band(x, y, err):
+    # Vertices of the band y-err .. y+err around a curve, as a closed
+    # polygon for a PolyCollection: the lower edge from left to right and
+    # the upper edge back.
+    x = np.asarray(x)
+    lower = y - err
+    upper = y + err
+    return(np.column_stack((np.concatenate((x, x[::-1])), \
+                            np.concatenate((lower, upper[::-1])))))
+
+
+class FigureModel(object):
+    ''' Persistent figure: keeps the panels (axes) and the curves (Line2D)
+    of a figure, and updates them in place when the selection, the data or
+    the height scale change, instead of building a new figure.
+    With many runs (more than the colors of config.colorlist, or always if
+    config.plot_mode is 'collection') all the curves of a panel are drawn
+    by a single LineCollection colored with config.colormap, and the legend
+    is replaced by a colorbar.
+    The errors of the .err files are shown as shaded bands, one
+    PolyCollection per panel (config.error_style 'band'), or with errorbar
+    ('bars').
+    The summary of aggregate_runs is shown as percentile bands and the
+    median curve in every panel.
+    '''
+
+    def __init__(self, sir_fig=None):
+
+        # matplotlib is imported here so that parse_filelist and load_runs
+        # can be used without it (the GUI main window does not need it)
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        # ---- Create Figure. Only the object oriented matplotlib interface
+        # is used (no pyplot), so that this can run outside of the Tk main
+        # thread or without a display.
+        if sir_fig is None:
+            sir_fig = Figure()
+            FigureCanvasAgg(sir_fig)
+        self.figure = sir_fig
+        self.panels = []  # ('stokes', k) or ('model', k), in plot order
+        self.axes = {}    # panel -> Axes
+        self.lines = {}   # (panel, run name) -> Line2D
+        self.sources = {} # (panel, run name) -> arrays shown by the Line2D
+        self.lod = set()  # (panel, run name) of curves drawn decimated
+        self.errbars = {} # (panel, run name) -> ErrorbarContainer
+        self.bands = {}   # panel -> PolyCollection of the error bands
+        self.collections = {} # panel -> LineCollection (collection mode)
+        self.shown = {}   # panel -> names of the runs drawn in the panel
+        self.collection = False # True in collection mode
+        self.summary = False # True when showing the summary of aggregate_runs
+        self.summaries = {} # panel -> (PolyCollection of bands, median Line2D)
+        self.nruns = 0
+        self.legend = None
+        self.colorbar = None
+        self.labels = []  # run names in the legend
+        self.__args = None
+        self.__sample_grids = {}
+        self.__backgrounds = {} # Axes -> (limits and labels, background)
+        self.__old_legend = None # region of a replaced legend, to redraw
+
+    # -------------------------------------------------------------------
+    def update(self, data, legend_names, stokes_chks, model_chks, \
+               read_err=False, zscale=False, split_lines=False):
+        ''' Shows the given data and selection. Only the panels whose
+        selection changed are added or removed; the curves of the other
+        panels get their new data with set_data. Returns the list of axes
+        that changed, or None if the figure layout changed (the whole figure
+        must then be drawn again).
+        With split_lines, each spectral line of the profiles (line_ind) has
+        its own Stokes panels, against the wavelength.
+        '''
+
+        self.__args = (data, legend_names, stokes_chks, model_chks, \
+                       read_err, split_lines)
+        # Plot in z-scale only if requested and all models have z columns
+        zscale = zscale and data['is_z']
+
+        # ---- Stokes panels: ('stokes', k), or ('stokes', k, line) for
+        # every line of the profiles
+        if split_lines and 'Profiles' in data:
+            lines = []
+            for profile in data['Profiles']:
+                lines += [line for line in profile.lines if line not in lines]
+            panels = [('stokes', k, line) for k in range(0,4) \
+                      if stokes_chks[k] for line in lines]
+        else:
+            panels = [('stokes', k) for k in range(0,4) if stokes_chks[k]]
+        panels = panels + [('model', k) for k in range(0,7) if model_chks[k]]
+        relayout = (panels != self.panels)
+
+        # ---- Line or collection mode
+        self.nruns = len(legend_names)
+        collection = (config.plot_mode == 'collection') or \
+          (config.plot_mode == 'auto' and self.nruns > len(config.colorlist))
+        summary = data.get('summary', False)
+        if collection != self.collection or summary != self.summary:
+            for panel in self.panels:
+                self.__clear_panel(panel)
+            self.collection = collection
+            self.summary = summary
+            self.labels = None # legend or colorbar is made again
+
+        # ---- Remove the panels that are no longer selected
+        for panel in self.panels:
+            if panel not in panels:
+                self.__clear_panel(panel)
+                self.axes.pop(panel).remove()
+
+        # ---- Add the new panels and place all of them on the grid
+        Nrows = int(np.floor(np.sqrt(len(panels)+1)))
+        Ncols = int(np.ceil(float(len(panels)+1)/Nrows))
+        if relayout:
+            from matplotlib.gridspec import GridSpec
+            grid = GridSpec(Nrows, Ncols, figure=self.figure)
+        for Nplot, panel in enumerate(panels):
+            if panel not in self.axes:
+                axstks = self.figure.add_subplot(grid[Nplot])
+                if panel[0] == 'stokes':
+                    title = config.AllStokesTitles[panel[1]]
+                    if len(panel) == 3:
+                        title = '{0}, line {1:g}'.format(title, panel[2])
+                else:
+                    title = config.AllModelTitles[panel[1]]
+                axstks.set_title(title, fontsize=config.figfontsize)
+                axstks.tick_params(axis='both', labelsize='small')
+                if sys.version_info[0] < 3:
+                    axstks.locator_params(axis='both', nbins=5)
+                if panel[0] == 'stokes':
+                    axstks.callbacks.connect('xlim_changed', self.__refine)
+                self.axes[panel] = axstks
+            elif relayout:
+                self.axes[panel].set_subplotspec(grid[Nplot])
+        self.panels = panels
+
+        # ---- Update the curves of every panel
+        full = relayout
+        changed = []
+        for panel in panels:
+            axstks = self.axes[panel]
+            limits = axstks.axis()
+            if summary:
+                modified = self.__summary_panel(panel, data, zscale)
+            elif panel[0] == 'stokes':
+                modified = self.__stokes_panel(panel, data, legend_names)
+            else:
+                modified = self.__model_panel(panel, data, legend_names, \
+                                              read_err, zscale)
+            if modified:
+                changed.append(axstks)
+            # New axis limits change the ticks: the whole figure is drawn
+            full = full or (axstks.axis() != limits)
+
+        if relayout:
+            if self.colorbar is not None: # not handled by tight_layout
+                self.colorbar.remove()
+                self.colorbar = None
+            self.figure.tight_layout()
+        shown = set()
+        for panel in panels:
+            shown.update(self.shown.get(panel, []))
+        if summary:
+            labels = sorted(shown)
+        else:
+            labels = [name for name in legend_names if name in shown]
+        if relayout or labels != self.labels:
+            legend = self.legend
+            if not relayout and legend is not None:
+                extent = legend.get_window_extent()
+            self.__make_legend(labels)
+            if relayout or legend is None or self.legend is None:
+                full = True
+            else: # only the legend is drawn again (see redraw)
+                self.__old_legend = extent
+
+        return(None if full else changed)
+
+    # -------------------------------------------------------------------
+    def set_zscale(self, zscale):
+        ''' Switches the model panels between z and log(tau) scales, by
+        swapping the x data of their curves.
+        '''
+
+        data, legend_names, stokes_chks, model_chks, read_err, split_lines = \
+          self.__args
+        return(self.update(data, legend_names, stokes_chks, model_chks, \
+                           read_err=read_err, zscale=zscale, \
+                           split_lines=split_lines))
+
+    # -------------------------------------------------------------------
+    def __set_line(self, panel, jj, name, x, y, linewidth=0.9, lod=False):
+        # Updates the data of the curve of a run, or creates it. Returns True
+        # if the curve changed. Arrays from the in-memory store are shared
+        # between loads, so unchanged data is recognized by identity.
+        # With lod, the curve shows a min/max decimation of x, y at the
+        # resolution of the axes (see minmax_decimate), refined on zoom.
+        axstks = self.axes[panel]
+        key = (panel, name)
+        line = self.lines.get(key)
+        color = self.__color(jj)
+        source = (x, y, color)
+        if line is not None and source[0] is self.sources[key][0] and \
+           source[1] is self.sources[key][1] and color == self.sources[key][2]:
+            return(False)
+        self.sources[key] = source
+        if lod:
+            self.lod.add(key)
+            x, y = minmax_decimate(x, y, self.__pixels(axstks))
+        else:
+            self.lod.discard(key)
+        if line is None:
+            line, = axstks.plot(x, y, color = color, \
+                                label=name, linewidth=linewidth)
+            self.lines[key] = line
+        else:
+            line.set_data(x, y)
+            line.set_color(color)
+        return(True)
+
+    def __color(self, jj):
+        # Color of run jj: from config.colorlist, or from the colormap when
+        # there are more runs than colors in the list
+        if not self.collection and jj < len(config.colorlist):
+            return(config.colorlist[jj])
+        from matplotlib import colormaps
+        return(colormaps[config.colormap](float(jj)/max(self.nruns-1, 1)))
+
+    def __set_curves(self, panel, curves, linewidth=0.9, lod=False):
+        # Shows the curves, a list of (jj, name, x, y), in the panel: one
+        # Line2D per run, or a single LineCollection in collection mode.
+        # Returns True if the panel changed.
+        names = [curve[1] for curve in curves]
+        modified = (names != self.shown.get(panel))
+        self.shown[panel] = names
+        if not self.collection:
+            for jj, name, x, y in curves:
+                modified |= self.__set_line(panel, jj, name, x, y, \
+                                            linewidth=linewidth, lod=lod)
+            modified |= self.__drop_lines(panel, names)
+            return(modified)
+
+        from matplotlib.collections import LineCollection
+        axstks = self.axes[panel]
+        source = ([(curve[2], curve[3]) for curve in curves], \
+                  [self.__color(curve[0]) for curve in curves], lod)
+        old = self.sources.get(panel)
+        if not modified and old is not None and source[1] == old[1] and \
+           all(a[0] is b[0] and a[1] is b[1] for a, b in zip(source[0], old[0])):
+            return(False)
+        self.sources[panel] = source
+        lc = self.collections.get(panel)
+        if lc is None:
+            lc = LineCollection([], linewidths=linewidth)
+            axstks.add_collection(lc, autolim=False)
+            self.collections[panel] = lc
+        lc.set_color(source[1])
+        self.__set_segments(panel)
+        return(True)
+
+    def __set_segments(self, panel, xmin=None, xmax=None):
+        # Segments of the LineCollection of a panel, decimated if lod
+        xy, colors, lod = self.sources[panel]
+        axstks = self.axes[panel]
+        segments = []
+        for x, y in xy:
+            if lod:
+                x, y = minmax_decimate(x, y, self.__pixels(axstks), xmin, xmax)
+            segments.append(np.column_stack((x, y)))
+        self.collections[panel].set_segments(segments)
+
+    def __autoscale(self, panel):
+        # Autoscales the axes of a panel to its curves. Collections are not
+        # handled by relim, so their limits are computed from the data.
+        axstks = self.axes[panel]
+        if panel not in self.collections:
+            axstks.relim()
+            axstks.autoscale_view()
+            return
+        xy = self.sources[panel][0]
+        if len(xy) == 0:
+            return
+        xmin = min(np.nanmin(x) for x, y in xy)
+        xmax = max(np.nanmax(x) for x, y in xy)
+        ymin = min(np.nanmin(y) for x, y in xy)
+        ymax = max(np.nanmax(y) for x, y in xy)
+        xmargin, ymargin = axstks.margins()
+        dx = (xmax-xmin)*xmargin or 1.
+        dy = (ymax-ymin)*ymargin or 1.
+        axstks.set_xlim(xmin-dx, xmax+dx)
+        axstks.set_ylim(ymin-dy, ymax+dy)
+
+    def __clear_panel(self, panel):
+        # Removes every curve and error bar of a panel
+        for key in [key for key in self.lines if key[0] == panel]:
+            self.lines.pop(key).remove()
+            del self.sources[key]
+            self.lod.discard(key)
+        for key in [key for key in self.errbars if key[0] == panel]:
+            self.errbars.pop(key).remove()
+        if panel in self.collections:
+            self.collections.pop(panel).remove()
+            del self.sources[panel]
+        if panel in self.bands:
+            self.bands.pop(panel).remove()
+            del self.sources[('band', panel)]
+        if panel in self.summaries:
+            for artist in self.summaries.pop(panel):
+                artist.remove()
+            del self.sources[('summary', panel)]
+        self.shown.pop(panel, None)
+
+    def __set_bands(self, panel, errors):
+        # Shows the error bands of a panel, errors being a list of
+        # (jj, x, y, err), with a single PolyCollection. Returns True if the
+        # panel changed.
+        from matplotlib.collections import PolyCollection
+        axstks = self.axes[panel]
+        band = self.bands.get(panel)
+        if len(errors) == 0:
+            if band is None:
+                return(False)
+            band.remove()
+            del self.bands[panel]
+            del self.sources[('band', panel)]
+            return(True)
+        source = ([error[1:] for error in errors], \
+                  [self.__color(error[0]) for error in errors])
+        old = self.sources.get(('band', panel))
+        if old is not None and source[1] == old[1] and \
+           len(source[0]) == len(old[0]) and \
+           all(a is b for new, prev in zip(source[0], old[0]) \
+               for a, b in zip(new, prev)):
+            return(False)
+        self.sources[('band', panel)] = source
+        verts = [error_band(x, y, err) for x, y, err in source[0]]
+        if band is None:
+            band = PolyCollection(verts, linewidths=0, alpha=0.25, zorder=1)
+            axstks.add_collection(band, autolim=False)
+            self.bands[panel] = band
+        else:
+            band.set_verts(verts)
+        band.set_facecolor(source[1])
+        return(True)
+
+    def __pixels(self, axstks):
+        # Width of the axes in pixels: the number of decimation bins
+        width = axstks.bbox.width
+        return(width if width > 10 else 1000)
+
+    def __refine(self, axstks):
+        # xlim_changed callback of the Stokes axes: decimates the curves
+        # again for the visible x range, so that zooming in shows the full
+        # resolution where needed
+        xmin, xmax = sorted(axstks.get_xlim())
+        for key in self.lod:
+            if self.axes.get(key[0]) is axstks:
+                x, y = self.sources[key][0:2]
+                self.lines[key].set_data(*minmax_decimate(x, y, \
+                    self.__pixels(axstks), xmin, xmax))
+        for panel in self.collections:
+            if self.axes.get(panel) is axstks and self.sources[panel][2]:
+                self.__set_segments(panel, xmin, xmax)
+
+    def __drop_lines(self, panel, keep):
+        # Removes the curves (and error bars) of runs not in keep. Returns
+        # True if any was removed.
+        dropped = False
+        for key in list(self.lines):
+            if key[0] == panel and key[1] not in keep:
+                self.lines.pop(key).remove()
+                del self.sources[key]
+                self.lod.discard(key)
+                dropped = True
+        for key in list(self.errbars):
+            if key[0] == panel and key[1] not in keep:
+                self.errbars.pop(key).remove()
+        return(dropped)
+
+    # -------------------------------------------------------------------
+    def __stokes_panel(self, panel, data, legend_names):
+        # Stokes profiles of every run with a .per file, against the sample
+        # number, or, for the panel of one line, the samples of the line
+        # against the wavelength. Returns True if the panel changed.
+        k = panel[1]
+        axstks = self.axes[panel]
+        Stokes = data['Stokes']
+        curves = []
+        file_ctr = 0 # Count number of non-existing Stokes files,
+        # so that the filename index jj is consistent for Stokes
+        # variable (could have fewer Stokes files than model files)
+
+        # ---- Loop through different profile files:
+        for jj in np.arange(0,len(legend_names)):
+            if data['per_mask'][jj] and len(panel) == 3:
+                # views of the line, made once per profile
+                profile = data['Profiles'][jj-file_ctr]
+                if panel[2] in profile.lines:
+                    columns = profile.line(panel[2])
+                    curves.append((jj, legend_names[jj], columns[1], \
+                                   columns[2+k]))
+            elif data['per_mask'][jj]:
+                y = Stokes[jj-file_ctr][k]
+                curves.append((jj, legend_names[jj], self.__samples(len(y)), y))
+            else:
+                file_ctr = file_ctr + 1
+        modified = self.__set_curves(panel, curves, lod=True)
+
+        if len(panel) == 3:
+            axstks.set_xlabel(r'$\Delta\lambda$ (m$\AA$)', fontsize='small')
+        else:
+            axstks.set_xlabel(r'$\Delta\lambda$(Arb. units)', fontsize='small')
+        if modified:
+            self.__autoscale(panel)
+            if data.get('stokes_limits') is not None: # fixed, as for a map
+                axstks.set_ylim(*data['stokes_limits'][k])
+            self.__refine(axstks)
+
+        return(modified)
+
+    def __samples(self, n):
+        # Sample numbers 0..n-1, shared by all the profiles of equal length
+        # so that unchanged curves are recognized by identity
+        x = self.__sample_grids.get(n)
+        if x is None:
+            x = np.arange(n)
+            self.__sample_grids[n] = x
+        return(x)
+
+    # -------------------------------------------------------------------
+    def __model_panel(self, panel, data, legend_names, read_err, zscale):
+        # Model parameter of every run with a .mod file, against z or
+        # log(tau). Returns True if the panel changed.
+        k = panel[1]
+        axstks = self.axes[panel]
+        Models = data['Models']
+        Errors = data['Errors']
+        ErrorIndex = data['ErrorIndex']
+        bars = (config.error_style == 'bars')
+        xcol = 8 if zscale else 0
+        curves = []
+        errors = [] # (jj, x, y, err) of the runs with an .err file
+        file_ctr = 0
+
+        # Error bars can not be updated in place: remove them, they are drawn
+        # again below
+        modified = False
+        for key in [key for key in self.errbars if key[0] == panel]:
+            self.errbars.pop(key).remove()
+            modified = True
+
+        # ---- Loop through different model files:
+        for jj in np.arange(0,len(legend_names)):
+            if data['mod_mask'][jj]: # Model file exists, plot model
+                name = legend_names[jj]
+                x = Models[jj-file_ctr][xcol]
+                y = Models[jj-file_ctr][k+1]
+                curves.append((jj, name, x, y))
+
+                # plot with errors (some .mod files might not have
+                # associated .err files):
+                if read_err and ErrorIndex[jj] is not None:
+                    err = Errors[ErrorIndex[jj]][k+1]
+                    if bars:
+                        self.errbars[(panel, name)] = axstks.errorbar(x, y, \
+                                        yerr=err, color = self.__color(jj),\
+                                        fmt='none',linewidth=0.7)
+                        modified = True
+                    else:
+                        errors.append((jj, x, y, err))
+            else:
+                file_ctr = file_ctr + 1
+        modified |= self.__set_curves(panel, curves)
+        modified |= self.__set_bands(panel, errors)
+
+        if zscale:
+            axstks.set_xlabel('z (Mm)',fontsize='small')
+        else: # Plot in tau-scale (because user request through
+            # toggle or because z column does not exist)
+            axstks.set_xlabel(r'log($\tau$)', fontsize='small')
+        axstks.axis([data['lower_limits'][xcol],\
+                     data['upper_limits'][xcol],\
+                     data['lower_limits'][k+1],\
+                     data['upper_limits'][k+1]])
+
+        return(modified)
+
+    # -------------------------------------------------------------------
+    def __summary_panel(self, panel, data, zscale):
+        # Percentile bands and median of the Stokes parameter or model
+        # parameter of the panel, from the summary of aggregate_runs. Returns
+        # True if the panel changed.
+        k = panel[1]
+        axstks = self.axes[panel]
+        percentiles = data['percentiles']
+        middle = len(percentiles)//2
+        xcol = 8 if zscale else 0
+        stats = None
+        if panel[0] == 'stokes':
+            axstks.set_xlabel(r'$\Delta\lambda$(Arb. units)', fontsize='small')
+            if len(data['Stokes']) > 0:
+                stats = data['Stokes'][k]
+                x = xsource = self.__samples(stats.shape[1])
+        else:
+            if zscale:
+                axstks.set_xlabel('z (Mm)',fontsize='small')
+            else:
+                axstks.set_xlabel(r'log($\tau$)', fontsize='small')
+            if len(data['Models']) > 0:
+                stats = data['Models'][k+1]
+                xsource = data['Models'][xcol]
+                x = xsource[middle]
+
+        old = self.sources.get(('summary', panel))
+        if stats is None:
+            self.shown[panel] = []
+            if old is None:
+                return(False)
+            for artist in self.summaries.pop(panel):
+                artist.remove()
+            del self.sources[('summary', panel)]
+            return(True)
+        if old is not None and old[0] is stats and old[1] is xsource:
+            return(False)
+        if old is not None:
+            for artist in self.summaries.pop(panel):
+                artist.remove()
+        self.sources[('summary', panel)] = (stats, xsource)
+
+        # ---- One band between each pair of symmetric percentiles, the
+        # inner ones darker
+        from matplotlib.collections import PolyCollection
+        from matplotlib.colors import to_rgba
+        color = config.colorlist[0]
+        verts = []
+        facecolors = []
+        for ii in range(0, middle):
+            verts.append(np.column_stack((np.concatenate((x, x[::-1])), \
+                np.concatenate((stats[ii], stats[-1-ii][::-1])))))
+            facecolors.append(to_rgba(color, 0.2*(ii+1)))
+        bands = PolyCollection(verts, facecolors=facecolors, linewidths=0)
+        axstks.add_collection(bands, autolim=False)
+        median, = axstks.plot(x, stats[middle], color=color, linewidth=1.2)
+        self.summaries[panel] = (bands, median)
+        if panel[0] == 'stokes':
+            self.shown[panel] = ['{0} profiles'.format(data['nper'])]
+        else:
+            self.shown[panel] = ['{0} models'.format(data['nmod'])]
+
+        if panel[0] == 'stokes':
+            dy = (stats[-1].max() - stats[0].min())*0.05 or 1.
+            axstks.axis([x[0], x[-1], stats[0].min()-dy, stats[-1].max()+dy])
+        else:
+            axstks.axis([data['lower_limits'][xcol],\
+                         data['upper_limits'][xcol],\
+                         data['lower_limits'][k+1],\
+                         data['upper_limits'][k+1]])
+        return(True)
+
+    # -------------------------------------------------------------------
+    def __make_legend(self, labels):
+        # One legend entry per run, with the handle of its first curve. In
+        # collection mode, a colorbar of the run index instead.
+        if self.legend is not None:
+            self.legend.remove()
+            self.legend = None
+        if self.colorbar is not None:
+            self.colorbar.remove()
+            self.colorbar = None
+        self.labels = labels
+        if self.summary:
+            self.__make_summary_legend(labels)
+            return
+        if self.collection:
+            self.__make_colorbar(labels)
+            return
+        handles = []
+        for name in labels:
+            for panel in self.panels:
+                if (panel, name) in self.lines:
+                    handles.append(self.lines[(panel, name)])
+                    break
+        # make the legend
+        self.legend = self.figure.legend(handles, labels, \
+                          bbox_to_anchor=[0.95, 0.2],\
+                          loc = 'lower right', ncol=1, \
+                          labelspacing=0.1,fontsize=8 )
+
+    def __make_summary_legend(self, labels):
+        # Legend of the percentile bands and the median, titled with the
+        # number of runs summarized
+        if len(self.summaries) == 0:
+            return
+        from matplotlib.patches import Patch
+        data = self.__args[0]
+        percentiles = data['percentiles']
+        middle = len(percentiles)//2
+        bands, median = list(self.summaries.values())[0]
+        handles = [median]
+        names = ['median' if percentiles[middle] == 50 else \
+                 '{0} %'.format(percentiles[middle])]
+        for ii in range(middle-1, -1, -1):
+            handles.append(Patch(facecolor=bands.get_facecolor()[ii]))
+            names.append('{0}-{1} %'.format(percentiles[ii], \
+                                            percentiles[-1-ii]))
+        self.legend = self.figure.legend(handles, names, \
+                          title=', '.join(labels), \
+                          bbox_to_anchor=[0.95,0.2], loc='lower right', \
+                          ncol=1, labelspacing=0.1, fontsize=8, \
+                          title_fontsize=8)
+
+    def __make_colorbar(self, labels):
+        # Colorbar of the run colors, where the legend would be. Runs are
+        # numbered in file order; with few runs their names are shown.
+        from matplotlib.cm import ScalarMappable
+        from matplotlib.colors import Normalize
+        mappable = ScalarMappable(norm=Normalize(0, max(self.nruns-1, 1)), \
+                                  cmap=config.colormap)
+        cax = self.figure.add_axes([0.88, 0.06, 0.02, 0.25])
+        self.colorbar = self.figure.colorbar(mappable, cax=cax)
+        self.colorbar.ax.tick_params(labelsize=config.figfontsize)
+        if len(labels) <= 12:
+            self.colorbar.set_ticks(np.arange(len(labels)))
+            self.colorbar.set_ticklabels(labels)
+        else:
+            self.colorbar.set_label('Run (file order)', \
+                                    fontsize=config.figfontsize)
+
+    # -------------------------------------------------------------------
+    def redraw(self, changed):
+        ''' Draws the result of update on the figure canvas. If only some
+        axes changed and the canvas supports it, only those axes are drawn
+        again and blitted; otherwise the whole figure is drawn. The axes
+        are kept as a background without the curves: if their limits and
+        labels did not change, only the curves are drawn on it.
+        '''
+
+        from matplotlib.patches import Rectangle
+        from matplotlib.transforms import Bbox
+
+        canvas = self.figure.canvas
+        if changed is not None and len(changed) == 0 and \
+           self.__old_legend is None:
+            return
+        renderer = None
+        if changed is not None and canvas.supports_blit and \
+           hasattr(canvas, 'get_renderer'):
+            renderer = canvas.get_renderer()
+        legend = None
+        if renderer is not None and self.__old_legend is not None:
+            # a new legend: its region and that of the former one are drawn
+            # again, unless they overlap some axes
+            legend = Bbox.union([self.__old_legend, \
+                        self.legend.get_window_extent(renderer)]).padded(2)
+            for axstks in self.axes.values():
+                if axstks in self.__backgrounds: # region known
+                    bbox = self.__backgrounds[axstks][2]
+                else:
+                    bbox = axstks.get_tightbbox(renderer)
+                if legend.overlaps(bbox):
+                    renderer = None
+        self.__old_legend = None
+        if renderer is None:
+            self.__backgrounds = {}
+            canvas.draw_idle()
+            return
+        if legend is not None:
+            eraser = Rectangle((legend.x0, legend.y0), legend.width, \
+                               legend.height, transform=None, linewidth=0, \
+                               antialiased=False, \
+                               facecolor=self.figure.get_facecolor())
+            eraser.set_figure(self.figure)
+            eraser.draw(renderer)
+            self.legend.draw(renderer)
+            canvas.blit(legend)
+        for axstks in changed:
+            curves = sorted(axstks.lines + axstks.collections, \
+                            key=lambda artist: artist.get_zorder())
+            state = (axstks.get_xlim(), axstks.get_ylim(), \
+                     axstks.get_title(), axstks.get_xlabel(), \
+                     axstks.get_ylabel(), canvas.get_width_height())
+            background = self.__backgrounds.get(axstks)
+            if background is not None and background[0] == state:
+                bbox = background[2]
+                canvas.restore_region(background[1])
+                for artist in curves:
+                    axstks.draw_artist(artist)
+                if self.legend is not None and \
+                   self.legend.get_window_extent(renderer).overlaps(bbox):
+                    self.legend.draw(renderer)
+                canvas.blit(bbox)
+                continue
+            bbox = axstks.get_tightbbox(renderer).padded(2)
+            # clear the region of the axes and its labels, draw it again,
+            # first without the curves, kept as background
+            eraser = Rectangle((bbox.x0, bbox.y0), bbox.width, bbox.height,\
+                               transform=None, linewidth=0, \
+                               antialiased=False, \
+                               facecolor=self.figure.get_facecolor())
+            eraser.set_figure(self.figure)
+            eraser.draw(renderer)
+            visible = [artist.get_visible() for artist in curves]
+            for artist in curves:
+                artist.set_visible(False)
+            axstks.draw(renderer)
+            self.__backgrounds[axstks] = (state, \
+                                          canvas.copy_from_bbox(bbox), bbox)
+            for artist, shown in zip(curves, visible):
+                artist.set_visible(shown)
+                axstks.draw_artist(artist)
+            if self.legend is not None and \
+               self.legend.get_window_extent(renderer).overlaps(bbox):
+                self.legend.draw(renderer)
+            canvas.blit(bbox)
+
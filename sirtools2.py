@@ -15,130 +15,1262 @@ The reading routines are used by the visualization GUI: SirGUI
 
 >> tau, temp, Pe, vmic, B, vlos, gamma, phi, vmac, ff, stray, z, rho, Pg  = readmod(filename)
 
+>> profile = readpro(filename, dtype=None, share_grids=False), model = readmod(filename, dtype=None):
+   Profile and Model containers, which also unpack as the tuples above
+
+>> lower, upper = filestats(filename, data=None)
+
+>> grid = intern_grid(x)
+
+>> data = readfile(filename, dtype=None), results = readfiles(filenames, workers=None, processes=False, progress=None, cancel=None, dtype=None, share_grids=False)
+
+>> grid, cube = resample(models, grid=None, column=0, npoints=None, fill=nan)
+
+>> pixels = mapfiles(directory, ext='.mod', pattern=None)
+
+>> name = plainname(filename)
+
+>> maps = readmap(directory, ext='.mod', pattern=None, out=None, chunk=256, workers=None, processes=False, progress=None, cancel=None, dtype=None)
+
+>> set_cache(directory, max_bytes=512*2**20), clear_cache()
+
+>> set_memory_cache(max_bytes), memory_cache_info(), clear_memory_cache()
+
+>> MODEL_SCALE: scale of the model columns from SIR units to plot units
+
 >>  writepro(filename, line_ind, wvlen, StkI, StkQ, StkU, StkV)
 
 >> writemod(filename, tau, temp, Pe, vmic, B, vlos, gamma, phi, vmac, ff, stray, z=z, rho=rho, Pg = Pg)
 
+>> writepros(filenames, line_ind, wvlen, StkI, StkQ, StkU, StkV)
+
+>> writemods(filenames, tau, temp, Pe, vmic, B, vlos, gamma, phi, vmac, ff, stray, z=z, rho=rho, Pg = Pg)
+
 ******* Changes:
 
 10-01-2018: Change in readpro so that line index is not assumed to be an integer.
 
+10-18-2026: readpro and readmod parse the whole file in one pass into a single
+            (ncol, nrows) block and return its rows. Fortran 'D' exponents are
+            accepted.
+            writepro and writemod format the whole file into one buffer and
+            write it at once. New writepros and writemods write N files from
+            stacked arrays.
+            Optional binary (.npy) cache of parsed files, keyed by path, size
+            and modification time: set_cache, clear_cache.
+            Optional in-memory LRU store of parsed files: set_memory_cache,
+            memory_cache_info, clear_memory_cache.
+            readfiles reads many files concurrently and reports errors per
+            file.
+            resample interpolates models with different depth grids onto a
+            common grid, into a single (nfiles, nparams, npoints) array.
+            filestats returns the minimum and maximum of every quantity of a
+            file, kept by file identity once the file has been read.
+            readpro and readmod return Profile and Model containers with
+            __slots__, whose columns are views of the parsed block; they
+            still unpack as the former tuples. Model.scaled gives the
+            columns in the units of the plots. Containers are kept with the
+            block in the in-memory store.
+            dtype option of the readers and of readfiles: 'float32' stores
+            the data in single precision, with the log(tau) and wavelength
+            grids kept in float64.
+            intern_grid: registry of grids shared by many files. The
+            line_ind and wvlen columns of profiles read with share_grids
+            are kept once per distinct grid instead of once per file.
+            Profile.index and Profile.line: samples of each spectral line of
+            a profile, indexed once per file.
+            mapfiles and readmap: raster maps with one file per pixel read
+            into (ny, nx, ...) arrays, optionally memory-mapped, with a
+            checkpoint to resume an interrupted reading.
+            Compressed files (.gz, .bz2, .xz, and .zst with Python 3.14)
+            are read by all the readers, decompressed line by line as they
+            are parsed; a plain name (inv_1.per) reads its compressed copy if
+            the plain file does not exist. plainname strips the extension
+            of the compression.
+
 """
 
-def readpro(filename):
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+# In-memory LRU store of parsed files, shared by the whole process.
+# Disabled (0 bytes) until set_memory_cache is called.
+_memory = OrderedDict()
+_memory_lock = threading.Lock()
+_memory_stats = {'hits': 0, 'misses': 0, 'nbytes': 0}
+_memory_max_bytes = 0
+
+def set_memory_cache(max_bytes):
+
+    """ 
+    Sets the size of the in-memory LRU store of parsed files (0 disables
+    it). Arrays returned from the store are read-only and shared between
+    calls, so they must be copied before being modified.
+    Call:
+    st.set_memory_cache(1024*2**20)
+    """
+
+    global _memory_max_bytes
+
+    with _memory_lock:
+        _memory_max_bytes = max_bytes
+        _memoryevict()
+
+def memory_cache_info():
+
+    """ 
+    Returns a dictionary with the hits, misses, number of entries, bytes
+    used and byte limit of the in-memory store.
+    """
+
+    with _memory_lock:
+        info = dict(_memory_stats)
+        info['entries'] = len(_memory)
+        info['max_bytes'] = _memory_max_bytes
+
+    return(info)
+
+def clear_memory_cache():
+
+    """ 
+    Empties the in-memory store and resets its counters.
+    """
+
+    with _memory_lock:
+        _memory.clear()
+        _memory_stats.update(hits=0, misses=0, nbytes=0)
+    with _filestats_lock:
+        _filestats.clear()
+
+def _memoryevict():
+
+    # Drops least recently used entries until the store fits in
+    # _memory_max_bytes. Must be called with _memory_lock held.
+    while _memory and _memory_stats['nbytes'] > _memory_max_bytes:
+        key, entry = _memory.popitem(last=False)
+        _memory_stats['nbytes'] -= _entrybytes(entry)
+
+def _entrybytes(entry):
+
+    # Bytes of the arrays of an in-memory store entry
+    if entry[3] is None:
+        return(entry[1].nbytes)
+    return(entry[1].nbytes + sum([row.nbytes for row in entry[3]]))
+
+# Registry of grids (line indices, wavelengths) shared by many files: one
+# read-only array per distinct grid, while any file uses it
+_grids = weakref.WeakValueDictionary()
+_grids_lock = threading.Lock()
+
+def intern_grid(x):
+
+    """ 
+    Returns a shared read-only float64 array equal to x. Identical grids
+    of different files (as the line_ind and wvlen columns of .per files of
+    the same inversion setup) are then a single array, so that 'a is b'
+    tells that two files share a grid.
+    Call:
+    wvlen = st.intern_grid(wvlen)
+    """
+
+    import hashlib
+    from numpy import array, ascontiguousarray, float64
+
+    x = ascontiguousarray(x, dtype=float64)
+    key = (x.shape, hashlib.sha1(x.tobytes()).hexdigest())
+    with _grids_lock:
+        grid = _grids.get(key)
+        if grid is None:
+            grid = array(x) # not a view of the block of a file
+            grid.flags.writeable = False
+            _grids[key] = grid
+
+    return(grid)
+
+# Minimum and maximum of every quantity returned by readfile, by file
+# identity, for the files read so far (at most _filestats_max files).
+_filestats = OrderedDict()
+_filestats_lock = threading.Lock()
+_filestats_max = 10**5
+
+def filestats(filename, data=None):
+
+    """ 
+    Returns two arrays with the minimum and the maximum of every quantity
+    returned by readfile for the file (NaN are ignored). They are kept, by
+    file identity (path, size and modification time), when the file is read
+    by readfile, so that the limits of any set of files already read can be
+    merged without touching their arrays. If they are not known, they are
+    computed from data (the result of readfile for the file) if given, or
+    by reading the file.
+    Call:
+    lower, upper = st.filestats(filename)
+    """
+
+    ident = _fileident(filename)
+    with _filestats_lock:
+        stats = _filestats.get(ident)
+        if stats is not None:
+            _filestats.move_to_end(ident)
+            return(stats)
+    if data is None:
+        data = readfile(filename)
+        with _filestats_lock:
+            stats = _filestats.get(ident)
+        if stats is not None:
+            return(stats)
+
+    return(_storestats(ident, data))
+
+def _storestats(ident, data):
+
+    # Computes and keeps the minimum and maximum of every quantity of data
+    from numpy import array, nanmin, nanmax
+
+    if isinstance(data, Model) and not data.has_z:
+        # the zeros of z, rho, Pg are not allocated
+        columns = [data[k] for k in range(0, 11)] + [0.]*3
+    else:
+        columns = list(data)
+    stats = (array([nanmin(x) for x in columns]), \
+             array([nanmax(x) for x in columns]))
+    with _filestats_lock:
+        _filestats[ident] = stats
+        while len(_filestats) > _filestats_max:
+            _filestats.popitem(last=False)
+
+    return(stats)
+
+# Binary sidecar cache of parsed files. Disabled (None) until set_cache is
+# called with a directory.
+_cache_dir = None
+_cache_max_bytes = 512*2**20
+# Bytes of the .npy entries of the cache directory, counted once and then
+# kept up to date by _cachestore (None: not counted yet)
+_cache_bytes = None
+_cache_lock = threading.Lock()
+
+def set_cache(directory, max_bytes=512*2**20):
+
+    """ 
+    Enables the binary cache of parsed files in the given directory, or
+    disables it if directory is None. When the cache grows beyond max_bytes
+    the least recently used entries are removed.
+    Cached reads return read-only memory-mapped arrays.
+    Call:
+    st.set_cache('~/.sircache', max_bytes=2**30)
+    """
+
+    global _cache_dir, _cache_max_bytes, _cache_bytes
+
+    if directory is not None:
+        directory = os.path.expanduser(directory)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+    with _cache_lock:
+        _cache_dir = directory
+        _cache_max_bytes = max_bytes
+        _cache_bytes = None
+
+def clear_cache():
 
     """ 
-    Reads a line profile from a .per file
+    Removes every entry from the binary cache directory.
+    """
+
+    global _cache_bytes
+
+    if _cache_dir is None:
+        return
+    with _cache_lock:
+        for name in os.listdir(_cache_dir):
+            if name.endswith('.npy') or name.endswith('.hdr'):
+                os.remove(os.path.join(_cache_dir, name))
+        _cache_bytes = 0
+
+def _fileident(filename):
+
+    # Identity of a file: absolute path, size and modification time. Any
+    # change to the file produces a different identity.
+    try:
+        stat = os.stat(filename)
+    except OSError: # compressed copy, if any
+        filename = _findfile(filename)
+        stat = os.stat(filename)
+    return((os.path.abspath(filename), stat.st_size, stat.st_mtime_ns))
+
+# Extensions of compressed SIR files (inv_1.per.gz), read by decompressing
+# them as they are parsed
+_COMPRESSED = ('.gz', '.bz2', '.xz', '.zst')
+
+def plainname(filename):
+
+    """ 
+    Returns the name of a SIR file without the extension of its
+    compression, if any (inv_1.per for inv_1.per.gz).
+    Call:
+    name = st.plainname(filename)
+    """
+
+    root, ext = os.path.splitext(filename)
+    if ext in _COMPRESSED:
+        return(root)
+    return(filename)
+
+def _findfile(filename):
+
+    # The file to read for filename: filename itself if it exists, or else
+    # a compressed copy of it (filename.gz, ...), so that runs stored
+    # compressed are read by their plain names
+    if os.path.exists(filename) or plainname(filename) != filename:
+        return(filename)
+    for ext in _COMPRESSED:
+        if os.path.exists(filename+ext):
+            return(filename+ext)
+    return(filename)
+
+def _openfile(filename):
+
+    # Opens a SIR file as text. Compressed files (.gz, .bz2, .xz, and .zst
+    # with Python 3.14 or later) are decompressed as they are read, without
+    # temporary files.
+    ext = os.path.splitext(filename)[1]
+    if ext == '.gz':
+        import gzip
+        return(gzip.open(filename, 'rt'))
+    if ext == '.bz2':
+        import bz2
+        return(bz2.open(filename, 'rt'))
+    if ext == '.xz':
+        import lzma
+        return(lzma.open(filename, 'rt'))
+    if ext == '.zst':
+        try:
+            from compression import zstd
+        except ImportError:
+            raise IOError('Reading .zst files needs Python 3.14 or later: '+\
+                          filename)
+        return(zstd.open(filename, 'rt'))
+    return(open(filename, 'r'))
+
+def _cachekey(ident, skiprows=0, exact=()):
+
+    # Cache entry name of a file identity and of the parameters it is read
+    # with (a file read both as a profile and as a model has two entries)
+    import hashlib
+
+    text = '{0}|{1}|{2}'.format(*ident) + \
+      '|{0}|{1}'.format(skiprows, ','.join([str(k) for k in exact]))
+    return(hashlib.sha1(text.encode('utf-8')).hexdigest())
+
+def _cacheload(key, skiprows=0):
+
+    # Returns (header, block) for a cache entry, or None if absent, or if
+    # either file is damaged or partly written
+    from numpy import load
+
+    base = os.path.join(_cache_dir, key)
+    try:
+        block = load(base+'.npy', mmap_mode='r')
+        f = open(base+'.hdr', 'r')
+        header = f.read().splitlines(True)
+        f.close()
+        if len(header) != skiprows or block.ndim != 2:
+            return(None)
+        # Mark the entry as recently used for the eviction policy
+        os.utime(base+'.npy', None)
+    except (IOError, OSError, ValueError):
+        return(None)
+
+    return(header, block)
+
+def _cachestore(key, header, block):
+
+    # Writes a cache entry atomically and evicts old entries if needed. The
+    # temporary files are unique, so that two writers of the same entry do
+    # not collide; the last one replaces the entry.
+    import tempfile
+    from numpy import save
+
+    global _cache_bytes
+
+    base = os.path.join(_cache_dir, key)
+    temporary = []
+    try:
+        for ext in ('.hdr', '.npy'):
+            fd, name = tempfile.mkstemp(suffix=ext+'.tmp', prefix=key, \
+                                        dir=_cache_dir)
+            temporary.append(name)
+            with os.fdopen(fd, 'w' if ext == '.hdr' else 'wb') as f:
+                if ext == '.hdr':
+                    f.write(''.join(header))
+                else:
+                    save(f, block)
+        try:
+            replaced = os.path.getsize(base+'.npy')
+        except OSError:
+            replaced = 0
+        size = os.path.getsize(temporary[1])
+        os.replace(temporary[0], base+'.hdr')
+        os.replace(temporary[1], base+'.npy')
+    except (IOError, OSError): # the file is parsed again next time
+        for name in temporary:
+            if os.path.exists(name):
+                os.remove(name)
+        return
+
+    with _cache_lock:
+        if _cache_bytes is not None:
+            _cache_bytes += size - replaced
+        if _cache_bytes is None or _cache_bytes > _cache_max_bytes:
+            _cacheevict()
+
+def _cacheevict():
+
+    # Removes least recently used entries until the cache fits in
+    # _cache_max_bytes, and counts the bytes left. Lists the cache
+    # directory: only called when the running count is unknown or above
+    # the limit. Called with _cache_lock held.
+    global _cache_bytes
+
+    entries = []
+    total = 0
+    for name in os.listdir(_cache_dir):
+        if not name.endswith('.npy'):
+            continue
+        path = os.path.join(_cache_dir, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+        total += stat.st_size
+
+    entries.sort()
+    for mtime, size, path in entries:
+        if total <= _cache_max_bytes:
+            break
+        for fname in (path, path[:-4]+'.hdr'):
+            try:
+                os.remove(fname)
+            except OSError:
+                pass
+        total -= size
+    _cache_bytes = total
+
+def _readblock(filename, skiprows=0, dtype=None, exact=(), ngrids=0, \
+               share=False):
+
+    """ 
+    Returns a list [header, block, container, apart] with the header lines
+    and the (ncol, nrows) data block of a SIR file, the Profile or Model
+    built on them (None until readpro or readmod builds it), and a tuple of
+    float64 rows kept apart from the block (None if there are none): the
+    first ngrids rows, which are then removed from the block (and shared
+    through intern_grid with share), or else the rows listed in exact when
+    the block is stored with another dtype. The arrays of an entry kept in
+    the in-memory store are read-only. Looks first in the in-memory store,
+    then in the binary cache, and parses the file only if neither holds an
+    up to date copy.
+    """
+
+    from numpy import dtype as npdtype, float64
+
+    if dtype is not None and npdtype(dtype) == float64:
+        dtype = None
+    if dtype is not None:
+        dtype = npdtype(dtype)
+
+    if _cache_dir is None and _memory_max_bytes == 0:
+        return(_convertblock(_parseblock(filename, skiprows), dtype, exact, \
+                             ngrids, share))
+
+    ident = _fileident(filename)
+    memkey = ident + (skiprows, tuple(exact), str(dtype), ngrids, share)
+
+    if _memory_max_bytes > 0:
+        with _memory_lock:
+            entry = _memory.get(memkey)
+            if entry is not None:
+                _memory.move_to_end(memkey)
+                _memory_stats['hits'] += 1
+                return(entry)
+            _memory_stats['misses'] += 1
+
+    entry = None
+    if _cache_dir is not None:
+        key = _cachekey(ident, skiprows, exact)
+        entry = _cacheload(key, skiprows)
+    if entry is None:
+        entry = _parseblock(filename, skiprows)
+        if _cache_dir is not None:
+            _cachestore(key, *entry)
+    entry = _convertblock(entry, dtype, exact, ngrids, share)
+
+    if _memory_max_bytes > 0 and _entrybytes(entry) <= _memory_max_bytes:
+        entry[1].flags.writeable = False
+        for row in entry[3] or ():
+            row.flags.writeable = False
+        with _memory_lock:
+            if memkey not in _memory:
+                _memory[memkey] = entry
+                _memory_stats['nbytes'] += _entrybytes(entry)
+                _memoryevict()
+
+    return(entry)
+
+def _convertblock(entry, dtype, exact, ngrids, share=False):
+
+    # Store entry [header, block, None, apart] from a parsed or cached
+    # (header, block): the first ngrids rows removed from the block, and
+    # shared with share, or else views of the block (copies if it is
+    # converted or read-only); or the rows in exact kept in float64; the
+    # block converted to dtype, if given
+    from numpy import memmap
+
+    header, block = entry
+    apart = None
+    if ngrids > 0 and share:
+        apart = tuple([intern_grid(row) for row in block[0:ngrids]])
+        block = block[ngrids:]
+        if dtype is None and not isinstance(block, memmap):
+            block = block.copy() # the grid rows are released
+    elif ngrids > 0:
+        apart = tuple(block[0:ngrids])
+        if dtype is not None or not block.flags.writeable:
+            apart = tuple([row.copy() for row in apart])
+        block = block[ngrids:]
+    elif dtype is not None and len(exact) > 0:
+        apart = tuple([row.copy() for row in block[list(exact)]])
+    if dtype is not None:
+        block = block.astype(dtype)
+    return([header, block, None, apart])
+
+def _parseblock(filename, skiprows=0):
+
+    """ 
+    Reads a whitespace separated SIR table in a single pass.
+    Fortran double precision exponents (1.0D+02) are accepted. The lines
+    are passed to loadtxt as they are read (and decompressed, see
+    _openfile), so that the text of the file is never held whole.
+    Returns the skipped header lines and a C-contiguous (ncol, nrows) float
+    array, so that every row of the block is one column of the file.
+    Raises IOError if the file has no rows after the header (an empty file,
+    or a model with only its first line).
+    """
+
+    import itertools
+    from numpy import loadtxt, ascontiguousarray
+
+    with _openfile(_findfile(filename)) as f:
+        header = [f.readline() for k in range(0, skiprows)]
+        lines = (line.replace('D', 'E').replace('d', 'e') for line in f)
+        for first in lines: # the first row tells an empty table
+            if not first.isspace():
+                break
+        else:
+            raise IOError('No data rows in '+filename)
+        block = loadtxt(itertools.chain([first], lines), ndmin=2)
+
+    return(header, ascontiguousarray(block.T))
+
+class Profile(object):
+
+    """ 
+    Line profile of a .per file. The Stokes parameters are views of the
+    (4, nwav) block of I, Q, U, V; line_ind and wvlen are float64 grids,
+    shared by all the files with the same grid (see intern_grid) when read
+    with share_grids. Unpacks
+    (and indexes) as the tuple line_ind, wvlen, StkI, StkQ, StkU, StkV.
+    index lists the spectral lines of the file, as (line_ind, slice) pairs
+    for each contiguous run of samples of a line; line(line_ind) returns
+    the columns of one line as views.
+    """
+
+    __slots__ = ('block', 'index', '_columns', '_lines')
+
+    def __init__(self, block, line_ind, wvlen):
+        from numpy import concatenate, diff, flatnonzero
+
+        self.block = block
+        self._columns = (line_ind, wvlen) + tuple(block[0:4])
+        # ---- Line index: first and last sample of every line
+        starts = concatenate(([0], flatnonzero(diff(line_ind) != 0) + 1))
+        ends = concatenate((starts[1:], [len(line_ind)]))
+        if len(line_ind) == 0:
+            starts = ends = []
+        self.index = tuple([(float(line_ind[start]), \
+                             slice(int(start), int(end))) \
+                            for start, end in zip(starts, ends)])
+        self._lines = {}
+
+    line_ind = property(lambda self: self._columns[0])
+    wvlen = property(lambda self: self._columns[1])
+    StkI = property(lambda self: self._columns[2])
+    StkQ = property(lambda self: self._columns[3])
+    StkU = property(lambda self: self._columns[4])
+    StkV = property(lambda self: self._columns[5])
+    lines = property(lambda self: tuple([line for line, s in self.index]))
+
+    def line(self, line_ind):
+        """ 
+        Returns the columns line_ind, wvlen, StkI, StkQ, StkU, StkV of the
+        samples of one line (its first run, if not contiguous). They are
+        views, made once and kept with the profile.
+        """
+
+        views = self._lines.get(line_ind)
+        if views is None:
+            for line, samples in self.index:
+                if line == line_ind:
+                    views = tuple([column[samples] for column in self._columns])
+                    self._lines[line_ind] = views
+                    break
+            else:
+                raise KeyError(line_ind)
+        return(views)
+
+    def __iter__(self):
+        return(iter(self._columns))
+
+    def __len__(self):
+        return(len(self._columns))
+
+    def __getitem__(self, index):
+        return(self._columns[index])
+
+    def __getstate__(self): # (pickled by readfiles with processes)
+        return((self.block, self._columns[0], self._columns[1]))
+
+    def __setstate__(self, state):
+        block, line_ind, wvlen = state
+        self.__init__(block, intern_grid(line_ind), intern_grid(wvlen))
+
+# Scale from the units of SIR to the units of the plots, for the columns
+# tau, T (kK), Pe, vmic (km/s), B (kG), vlos (km/s), gamma, phi, z (Mm),
+# rho, Pg (also used by sirplot)
+MODEL_SCALE = (1., 1e3, 1., 1e5, 1e3, 1e5, 1., 1., 1e3, 1., 1.)
+
+class Model(object):
+
+    """ 
+    Model atmosphere of a .mod or .err file. The depth dependent columns
+    are views of the (8 or 11, ndepth) block of the file; z, rho and Pg of
+    8 column models (has_z is False) are arrays of zeros of their own,
+    allocated when first used.
+    tau can be given apart, in float64, when the block is stored in single
+    precision. Unpacks (and indexes) as the tuple
+    tau, temp, Pe, vmic, B, vlos, gamma, phi, vmac, ff, stray, z, rho, Pg.
+    """
+
+    __slots__ = ('block', 'vmac', 'ff', 'stray', '_columns', '_scaled')
+
+    def __init__(self, block, vmac, ff, stray, tau=None):
+
+        self.block = block
+        self.vmac = vmac
+        self.ff = ff
+        self.stray = stray
+        # 14 columns, or 11 until the zeros of z, rho, Pg are needed
+        self._columns = tuple(block[0:8]) + (vmac, ff, stray) + \
+                        tuple(block[8:11])
+        if tau is not None:
+            self._columns = (tau,) + self._columns[1:]
+        self._scaled = None
+
+    tau = property(lambda self: self._columns[0])
+    temp = property(lambda self: self._columns[1])
+    Pe = property(lambda self: self._columns[2])
+    vmic = property(lambda self: self._columns[3])
+    B = property(lambda self: self._columns[4])
+    vlos = property(lambda self: self._columns[5])
+    gamma = property(lambda self: self._columns[6])
+    phi = property(lambda self: self._columns[7])
+    z = property(lambda self: self._allcolumns()[11])
+    rho = property(lambda self: self._allcolumns()[12])
+    Pg = property(lambda self: self._allcolumns()[13])
+    has_z = property(lambda self: self.block.shape[0] == 11)
+
+    def _allcolumns(self):
+        # The 14 columns, with the zeros of z, rho and Pg allocated on the
+        # first call for 8 column models
+        from numpy import zeros
+
+        if len(self._columns) == 11:
+            self._columns += tuple([zeros(self.block.shape[1], \
+                                          dtype=self.block.dtype) \
+                                    for k in range(0, 3)])
+        return(self._columns)
+
+    def scaled(self):
+        """ 
+        Returns the 11 columns tau, T, Pe, vmic, B, vlos, gamma, phi, z,
+        rho, Pg in the units of the plots (T in kK, velocities in km/s, B
+        in kG, z in Mm). Columns that change are views of a single array
+        computed on the first call and kept with the model; the others are
+        the columns of the model.
+        """
+
+        from numpy import array, broadcast_to
+
+        if self._scaled is None:
+            nrows = self.block.shape[0]
+            rows = [k for k in range(0, nrows) if MODEL_SCALE[k] != 1.]
+            scaled = self.block[rows]
+            scaled /= array([MODEL_SCALE[k] for k in rows])[:, None]
+            scaled.flags.writeable = False
+            columns = list(self._columns[0:8]) + list(self._columns[11:14])
+            if not self.has_z: # read-only zeros, as the scaled columns
+                columns += [broadcast_to(0., self.block.shape[1])]*3
+            for k, row in zip(rows, scaled):
+                columns[k] = row
+            self._scaled = tuple(columns)
+        return(self._scaled)
+
+    def __iter__(self):
+        return(iter(self._allcolumns()))
+
+    def __len__(self):
+        return(14)
+
+    def __getitem__(self, index):
+        if isinstance(index, int) and 0 <= index < 11:
+            return(self._columns[index])
+        return(self._allcolumns()[index])
+
+    def __getstate__(self): # (pickled by readfiles with processes)
+        tau = None
+        if self._columns[0].dtype != self.block.dtype:
+            tau = self._columns[0]
+        return((self.block, self.vmac, self.ff, self.stray, tau))
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+def readpro(filename, dtype=None, share_grids=False):
+
+    """ 
+    Reads a line profile from a .per file. With dtype='float32' the
+    profile is stored in single precision, except the wavelengths.
+    Compressed files (.per.gz, .per.bz2, .per.xz, .per.zst) are read too,
+    also by the plain name if only the compressed file exists.
+    line_ind and wvlen are writeable arrays of their own; with
+    share_grids=True they are the read-only arrays shared by all the files
+    with the same grid (see intern_grid), which saves their memory and
+    lets 'a.wvlen is b.wvlen' tell that two files share a grid.
     Call:
     line_ind, wvlen, StkI, StkQ, StkU, StkV = st.readpro(filename)
+    profile = st.readpro(filename, dtype='float32', share_grids=True)
     """
-    
-    from numpy import array
-
-    f = open(filename, 'r')
-
-    line_ind = []
-    wvlen = []
-    StkI = []
-    StkQ = []
-    StkU = []
-    StkV = []
-    
-    for line in f:
-        data = line.split()
-        line_ind.append(float(data[0]))
-        wvlen.append(float(data[1]))
-        StkI.append(float(data[2]))
-        StkQ.append(float(data[3]))
-        StkU.append(float(data[4]))
-        StkV.append(float(data[5]))
 
-    f.close()
+    entry = _readblock(filename, dtype=dtype, ngrids=2, share=share_grids)
+    if entry[2] is None:
+        entry[2] = Profile(entry[1], *entry[3])
+    if not share_grids and not entry[3][0].flags.writeable:
+        return(_ownedgrids(entry[2])) # kept in the in-memory store
+
+    return(entry[2])
 
-    line_ind = array(line_ind)
-    wvlen = array(wvlen)
-    StkI = array(StkI)
-    StkQ = array(StkQ)
-    StkU = array(StkU)
-    StkV = array(StkV)
+def _ownedgrids(profile):
 
-    return(line_ind, wvlen, StkI, StkQ, StkU, StkV)
+    # Profile with copies of the grids of profile, and the same block
+    return(Profile(profile.block, profile.line_ind.copy(), \
+                   profile.wvlen.copy()))
 
-def readmod(filename):
+def readmod(filename, dtype=None):
 
     """ 
-    Reads SIR model file with 8 or 11 columns.
+    Reads SIR model file with 8 or 11 columns. With dtype='float32' the
+    model is stored in single precision, except the log(tau) grid.
+    Compressed files are read as by readpro.
     Call:
     tau, temp, Pe, vmic, B, vlos, gamma, phi, vmac, ff, stray, z, rho, Pg  = readmod(filename)
+    model = st.readmod(filename, dtype='float32')
     """
 
-    from numpy import array
-    
-    f = open(filename)
-    # Read the first line which contains vmac, filling factor, stray light
-    firstline = f.readline()
-    vmac, ff, stray = firstline.split()
-
-    vmac = float(vmac)
-    ff = float(ff)
-    stray = float(stray)
-    
+    # The first line contains vmac, filling factor, stray light
     # the rest of the file is 8 or 11 columns, with:
     # tau, temperature, electron pressure, microturbulent velocity
     # field strength, LOS velocity, inclination, azimuth
     # and 3 optional columns:
     # z scale, density, gas pressure
-   
-    tau = []
-    temp = []
-    Pe = []
-    vmic = []
-    B = []
-    vlos =[]
-    gamma =[]
-    phi = []
-    z = []
-    rho = []
-    Pg = []
- 
-    
-    for line in f:
-        data = line.split()
-        ncol = len(data)
-        tau.append(float(data[0]))
-        temp.append(float(data[1]))
-        Pe.append(float(data[2]))
-        vmic.append(float(data[3]))
-        B.append(float(data[4]))
-        vlos.append(float(data[5]))
-        gamma.append(float(data[6]))
-        phi.append(float(data[7]))
-        
-        if ncol == 11:
-            z.append(float(data[8]))
-            rho.append(float(data[9]))
-            Pg.append(float(data[10]))
+    entry = _readblock(filename, skiprows=1, dtype=dtype, exact=(0,))
+    if entry[2] is None:
+        vmac, ff, stray = [float(x) for x in entry[0][0].split()]
+        tau = None if entry[3] is None else entry[3][0]
+        entry[2] = Model(entry[1], vmac, ff, stray, tau=tau)
+
+    return(entry[2])
+
+def readfile(filename, dtype=None, share_grids=False):
+
+    """ 
+    Reads a .per file with readpro, or a .mod/.err file with readmod, and
+    keeps the minimum and maximum of its quantities (see filestats).
+    share_grids is passed to readpro.
+    Call:
+    data = st.readfile(filename, dtype=None)
+    """
+
+    ident = _fileident(filename)
+    if plainname(filename).endswith('.per'):
+        data = readpro(filename, dtype=dtype, share_grids=share_grids)
+    else:
+        data = readmod(filename, dtype=dtype)
+    with _filestats_lock:
+        known = ident in _filestats
+    if not known:
+        _storestats(ident, data)
+
+    return(data)
+
+def readfiles(filenames, workers=None, processes=False, progress=None, \
+              cancel=None, dtype=None, share_grids=False):
+
+    """ 
+    Reads many .per/.mod/.err files concurrently with readfile.
+    Files are read by a pool of workers threads (by default one per CPU, at
+    least 4), which overlaps the waits on slow or network storage; with
+    workers=1 they are read in the calling thread. With processes=True the
+    files are parsed in a pool of worker processes instead; their results
+    do not go through the in-memory store.
+    progress, if given, is called as progress(ndone, ntotal) after each
+    file. cancel is an optional threading.Event: once set, files not yet
+    started are skipped and reported with a CancelledError. dtype is passed
+    and share_grids to readfile ('float32' halves the memory of the data,
+    share_grids keeps a single read-only copy of each wavelength grid).
+    Returns a list with one (data, error) pair per file, in the order of
+    filenames: error is None if the file was read, and the exception raised
+    otherwise.
+    Call:
+    results = st.readfiles(filenames, workers=8)
+    """
+
+    from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, \
+         CancelledError, as_completed
+
+    if len(filenames) == 0:
+        return([])
+    if workers is None:
+        workers = max(4, os.cpu_count() or 1)
+    workers = max(1, min(workers, len(filenames)))
+
+    if workers == 1 and not processes: # in this thread, without a pool
+        results = []
+        for name in filenames:
+            if cancel is not None and cancel.is_set():
+                results.append((None, CancelledError()))
+                continue
+            try:
+                results.append((readfile(name, dtype, share_grids), None))
+            except Exception as error:
+                results.append((None, error))
+            if progress is not None:
+                progress(len(results), len(filenames))
+        return(results)
+
+    if processes:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers)
+
+    with executor:
+        futures = [executor.submit(readfile, name, dtype, share_grids) \
+                   for name in filenames]
+        ndone = 0
+        for future in as_completed(futures):
+            ndone += 1
+            if progress is not None:
+                progress(ndone, len(futures))
+            if cancel is not None and cancel.is_set():
+                for pending in futures:
+                    pending.cancel()
+                break
+
+    results = []
+    for future in futures:
+        if future.cancelled():
+            results.append((None, CancelledError()))
+        elif future.exception() is not None:
+            results.append((None, future.exception()))
         else:
-            z.append(0.)
-            rho.append(0.)
-            Pg.append(0.)
+            data = future.result()
+            if processes and not share_grids and isinstance(data, Profile):
+                data = _ownedgrids(data) # interned when unpickled
+            results.append((data, None))
+
+    return(results)
+
+# Pixel coordinates at the end of the file names of a raster map, as in
+# run_0012_0034.mod (y=12, x=34)
+_MAP_PATTERN = r'(?P<y>\d+)\D+(?P<x>\d+)$'
+
+def mapfiles(directory, ext='.mod', pattern=None):
+
+    """ 
+    Finds the files of a raster map, one file per pixel: the files of
+    directory with extension ext whose name (without the extension) ends
+    with the y and x coordinates of the pixel, as run_0012_0034.mod (or
+    compressed, as run_0012_0034.mod.gz). pattern is another regular
+    expression with groups y and x, searched in the names.
+    Returns a list of (y, x, filename), sorted by y and x.
+    Call:
+    pixels = st.mapfiles('maps/run1', '.per')
+    """
+
+    import re
+
+    regex = re.compile(pattern or _MAP_PATTERN)
+    pixels = []
+    for name in os.listdir(directory):
+        root, extension = os.path.splitext(plainname(name))
+        if extension != ext:
+            continue
+        match = regex.search(root)
+        if match is not None:
+            pixels.append((int(match.group('y')), int(match.group('x')), \
+                           os.path.join(directory, name)))
+    pixels.sort()
+
+    return(pixels)
+
+def readmap(directory, ext='.mod', pattern=None, out=None, chunk=256, \
+            workers=None, processes=False, progress=None, cancel=None, \
+            dtype=None):
+
+    """ 
+    Reads a raster map, one .per or .mod/.err file per pixel (see
+    mapfiles), into arrays allocated once. The files are read in chunks of
+    chunk files by readfiles (workers, processes, cancel and dtype as
+    there) and every chunk is written into the arrays at once.
+    Returns a dictionary with:
+    'data': (ny, nx, nwav, 4) array of I, Q, U, V for profiles, or
+            (ny, nx, ndepth, 8 or 11) array of tau, temp, Pe, vmic, B, vlos,
+            gamma, phi (and z, rho, Pg) for models;
+    'grid': line_ind, wvlen of the profiles (pixels with other wavelengths
+            are not read), None for models;
+    'scalars': (ny, nx, 3) array of vmac, ff, stray of models, None for
+            profiles;
+    'mask': (ny, nx) boolean array of the pixels read (the data of the
+            other pixels are NaN);
+    'origin': the y, x coordinates of pixel [0, 0];
+    'files': the files of the pixels, and 'index': (ny, nx) array of the
+            position in files of the file of each pixel (-1 if none);
+    'failures': (filename, exception) of the files not read;
+    'complete': False if the reading was cancelled.
+    With out, a path without extension, the arrays are memory-mapped .npy
+    files out.npy, out_mask.npy and out_grid.npy or out_scalars.npy. The
+    mask is written after the data of each chunk, so it is a checkpoint: a
+    new call with the same out after an interruption reads only the pixels
+    still missing, if the files of the map are the same.
+    progress, if given, is called as progress(ndone, ntotal) with the
+    number of pixels done, those of the checkpoint included.
+    Call:
+    maps = st.readmap('maps/run1', '.mod', out='maps/run1_models')
+    """
+
+    import numpy as np
+
+    pixels = mapfiles(directory, ext, pattern)
+    if len(pixels) == 0:
+        raise IOError('No {0} files of pixels in {1}'.format(ext, directory))
+    names = [pixel[2] for pixel in pixels]
+    ys = np.array([pixel[0] for pixel in pixels])
+    xs = np.array([pixel[1] for pixel in pixels])
+    origin = (int(ys.min()), int(xs.min()))
+    ys = ys - origin[0]
+    xs = xs - origin[1]
+    dtype = np.dtype(dtype or np.float64)
+    profiles = (ext == '.per')
+    state = {'files': [os.path.abspath(name) for name in names], \
+             'origin': list(origin), 'dtype': dtype.str}
+
+    # ---- Arrays of the checkpoint, if any; else made with the first pixel
+    maps = None
+    if out is not None:
+        maps = _openmap(out, state, profiles)
+    todo = np.arange(len(names))
+    if maps is not None:
+        todo = todo[~maps['mask'][ys, xs]]
+
+    failures = []
+    complete = True
+    ndone = len(names) - len(todo)
+    if progress is not None:
+        progress(ndone, len(names))
+    for start in range(0, len(todo), chunk):
+        part = todo[start:start+chunk]
+        report = None
+        if progress is not None:
+            report = lambda n, ntotal, done=ndone+start: \
+                     progress(done+n, len(names))
+        results = readfiles([names[ii] for ii in part], workers=workers, \
+                            processes=processes, progress=report, \
+                            cancel=cancel, dtype=dtype, share_grids=True)
+        if cancel is not None and cancel.is_set():
+            complete = False
+            break
+
+        # ---- Pixels of the chunk with the shape (and grid) of the map
+        good = []
+        values = []
+        taus = []
+        scalars = []
+        for ii, (data, error) in zip(part, results):
+            if error is None and maps is None:
+                maps = _newmap(out, state, data, profiles, \
+                               int(ys.max())+1, int(xs.max())+1, dtype)
+            # grids read with share_grids: equal grids are the same array
+            if error is None and profiles and \
+               (data.line_ind is not maps['grid'][0] or \
+                data.wvlen is not maps['grid'][1]):
+                error = ValueError('Different wavelengths than the map')
+            if error is None and data.block.T.shape != \
+                                 maps['data'].shape[2:4]:
+                error = ValueError('{0} points and columns, {1} expected'\
+                        .format(data.block.T.shape, maps['data'].shape[2:4]))
+            if error is not None:
+                failures.append((names[ii], error))
+                continue
+            good.append(ii)
+            values.append(data.block.T)
+            if not profiles:
+                taus.append(data.tau)
+                scalars.append((data.vmac, data.ff, data.stray))
+        if len(good) == 0:
+            continue
+
+        # ---- The whole chunk at once; the mask last, as checkpoint
+        iy = ys[good]
+        ix = xs[good]
+        values = np.array(values)
+        if not profiles:
+            values[:, :, 0] = taus
+            maps['scalars'][iy, ix] = scalars
+        maps['data'][iy, ix] = values
+        if out is not None:
+            maps['data'].flush()
+            if not profiles:
+                maps['scalars'].flush()
+        maps['mask'][iy, ix] = True
+        if out is not None:
+            maps['mask'].flush()
+
+    if maps is None:
+        raise IOError('No pixel of {0} could be read'.format(directory))
+    maps['origin'] = origin
+    maps['files'] = names
+    maps['index'] = np.full(maps['mask'].shape, -1, dtype=np.int64)
+    maps['index'][ys, xs] = np.arange(len(names))
+    maps['failures'] = failures
+    maps['complete'] = complete
+
+    return(maps)
+
+def _newmap(out, state, data, profiles, ny, nx, dtype):
+
+    # Allocates the arrays of a map with the shape of the first pixel read,
+    # as .npy files if out is given (see readmap)
+    import json
+    import numpy as np
+    from numpy.lib.format import open_memmap
+
+    def allocate(suffix, shape, dtype, fill):
+        if out is None:
+            return(np.full(shape, fill, dtype=dtype))
+        array = open_memmap(out+suffix+'.npy', mode='w+', dtype=dtype, \
+                            shape=shape)
+        array[...] = fill
+        return(array)
+
+    ncol, npoints = data.block.shape
+    maps = {'data': allocate('', (ny, nx, npoints, ncol), dtype, np.nan), \
+            'mask': allocate('_mask', (ny, nx), bool, False), \
+            'grid': None, 'scalars': None}
+    if profiles:
+        maps['grid'] = (data.line_ind, data.wvlen)
+        if out is not None:
+            np.save(out+'_grid.npy', np.array(maps['grid']))
+    else:
+        maps['scalars'] = allocate('_scalars', (ny, nx, 3), np.float64, \
+                                   np.nan)
+    if out is not None:
+        maps['mask'].flush()
+        with open(out+'.json', 'w') as f:
+            json.dump(state, f)
+
+    return(maps)
+
+def _openmap(out, state, profiles):
+
+    # Opens the arrays of the checkpoint of a map (see readmap), or returns
+    # None if there is none for the same files
+    import json
+    import numpy as np
+    from numpy.lib.format import open_memmap
+
+    try:
+        with open(out+'.json', 'r') as f:
+            saved = json.load(f)
+    except (IOError, ValueError):
+        return(None)
+    if saved != state:
+        return(None)
+
+    maps = {'data': open_memmap(out+'.npy', mode='r+'), \
+            'mask': open_memmap(out+'_mask.npy', mode='r+'), \
+            'grid': None, 'scalars': None}
+    if profiles:
+        maps['grid'] = tuple([intern_grid(row) for row in \
+                              np.load(out+'_grid.npy')])
+    else:
+        maps['scalars'] = open_memmap(out+'_scalars.npy', mode='r+')
+
+    return(maps)
+
+# Row templates of the SIR formats. They reproduce, character by character,
+# the str.format specifications '{0}   {1:> 10.4f}  {2:> 8.6e} ...' used
+# originally, so that a whole file is formatted with a single % operation.
+_PRO_ROW = '     %s   % 10.4f  % 8.6e % 8.6e % 8.6e % 8.6e \n'
+_MOD_HEADER = '  % 10.8f      % 10.8f      % 10.8f \n'
+_MOD_ROW8 = ' % 7.4f  % 6.1f % 8.5E % 5.3E % 6.4E % 6.4E % 6.4E % 6.4E'
+_MOD_ROW11 = _MOD_ROW8 + ' % 6.4E % 6.4E % 6.4E'
+
+def resample(models, grid=None, column=0, npoints=None, fill=float('nan')):
+
+    """ 
+    Interpolates a set of models, possibly with different depth grids and
+    numbers of depth points, onto a common grid (log tau, z, ...) in one
+    vectorized pass. Each model is a sequence of depth dependent arrays
+    (scalars, as vmac, ff and stray of readmod, are repeated at every
+    depth); column is the index of the depth scale in that sequence. grid
+    defaults to npoints (by default, the largest number of depth points)
+    evenly spaced points over the range of all the models, in the order of
+    the first model; if all models share the same depth scale, they are
+    only stacked on it. Points of the grid outside the range of a model get
+    fill.
+    Returns the grid and a (nfiles, nparams, npoints) array.
+    Call:
+    grid, cube = st.resample([st.readmod(f) for f in files], column=0)
+    """
+
+    import numpy as np
+
+    nfiles = len(models)
+    nparams = len(models[0])
+    lengths = np.array([np.size(model[column]) for model in models])
+    ndepth = lengths.max()
+
+    # ---- Pack the models in a (nparams, nfiles, ndepth) array, with
+    # increasing depth scale, padded with the last depth point
+    cube = np.empty((nparams, nfiles, ndepth))
+    reverse = np.zeros(nfiles, dtype=bool)
+    for ii, model in enumerate(models):
+        try:
+            block = np.array(model, dtype=float)
+        except ValueError: # scalar entries
+            block = np.array(np.broadcast_arrays(*[np.asarray(x, \
+                                                   dtype=float) for x in model]))
+        reverse[ii] = block[column, 0] > block[column, -1]
+        if reverse[ii]:
+            block = block[:, ::-1]
+        cube[:, ii, 0:lengths[ii]] = block
+        cube[:, ii, lengths[ii]:] = block[:, -1:]
+    X = cube[column]
+
+    if grid is None:
+        if npoints in (None, ndepth) and np.all(lengths == ndepth) and \
+           np.all(X == X[0]) and np.all(reverse == reverse[0]):
+            # common grid already: no interpolation
+            if reverse[0]:
+                cube = cube[:, :, ::-1]
+            return(cube[column, 0, :].copy(), cube.transpose(1, 0, 2))
+        grid = np.linspace(X.min(), X.max(), npoints or ndepth)
+        if reverse[0]:
+            grid = grid[::-1]
+    grid = np.asarray(grid, dtype=float)
+
+    # ---- Linear interpolation of every model at once: the depth scales of
+    # the models are shifted to disjoint ranges so that one searchsorted
+    # finds the interval of every grid point in every model.
+    xmin = X.min()
+    span = max(X.max(), grid.max()) - min(xmin, grid.min()) + 1.
+    offset = np.arange(nfiles)[:, None]*span
+    index = np.searchsorted((X - xmin + offset).ravel(), \
+                            (grid[None, :] - xmin + offset).ravel(), \
+                            side='right').reshape(nfiles, len(grid)) - 1
+    first = np.arange(nfiles)[:, None]*ndepth
+    index = np.clip(index, first, first + np.maximum(lengths[:, None]-2, 0))
+    index = index.ravel()
+    after = np.minimum(index+1, X.size-1)
+    x0 = X.ravel()[index]
+    dx = X.ravel()[after] - x0
+    weight = np.where(dx != 0, (np.tile(grid, nfiles) - x0) / \
+                      np.where(dx != 0, dx, 1.), 0.)
+    Y = cube.reshape(nparams, nfiles*ndepth)
+    out = np.take(Y, index, axis=1)
+    y1 = np.take(Y, after, axis=1)
+    y1 -= out
+    y1 *= weight
+    out += y1
+    out = out.reshape(nparams, nfiles, len(grid))
+
+    # ---- Grid points outside the depth range of each model
+    top = X[np.arange(nfiles), lengths-1]
+    outside = (grid[None, :] < X[:, 0:1]) | (grid[None, :] > top[:, None])
+    out[:, outside] = fill
+
+    return(grid, out.transpose(1, 0, 2))
+
+def _formatblock(rowfmt, columns, nrows):
+
+    """ 
+    Formats nrows rows of the given columns with the row template rowfmt in
+    one operation and returns the resulting string.
+    """
+
+    from numpy import asarray
+
+    ncol = len(columns)
+    values = [None]*(nrows*ncol)
+    for k in range(0, ncol):
+        values[k::ncol] = asarray(columns[k][0:nrows]).tolist()
+
+    return((rowfmt*nrows) % tuple(values))
+
+def _writebuffer(filename, text):
+
+    # Writes the formatted file content with a single write call
+    f = open(filename, "w+")
+    f.write(text)
     f.close()
-    
-        #convert to array
-    tau = array(tau)
-    temp = array(temp)
-    Pe = array(Pe)
-    vmic = array(vmic)
-    B = array(B)
-    vlos = array(vlos)
-    gamma = array(gamma)
-    phi = array(phi)
-
-    z = array(z)
-    rho = array(rho)
-    Pg = array(Pg)
-
-    return(tau, temp, Pe, vmic, B, vlos, gamma, phi, vmac, ff, stray, z, rho, Pg)
+
+def _profiletext(line_ind, wvlen, StkI, StkQ, StkU, StkV):
+
+    # Content of a .per file. The line index is written with format(), as
+    # '{0}'.format() did, so that integer and float indices are preserved.
+    nrows = len(line_ind)
+    line_str = [format(x) for x in line_ind[0:nrows]]
+    return(_formatblock(_PRO_ROW, (line_str, wvlen, StkI, StkQ, StkU, StkV), \
+                        nrows))
+
+def _modeltext(tau, temp, Pe, vmic, B, vlos, gamma, phi, vmac, ff, stray, \
+               z=None, rho=None, Pg=None):
+
+    # Content of a .mod file. As before, a z column without rho and Pg
+    # produces only the header line.
+    text = _MOD_HEADER % (vmac, ff, stray)
+
+    columns = [tau, temp, Pe, vmic, B, vlos, gamma, phi]
+    if z is None:
+        text += _formatblock(_MOD_ROW8 + ' \n', columns, len(tau))
+    elif Pg is not None and rho is not None:
+        text += _formatblock(_MOD_ROW11 + ' \n', columns + [z, rho, Pg], \
+                             len(tau))
+
+    return(text)
 
 def writepro(filename, line_ind, wvlen, StkI, StkQ, StkU, StkV):
     """ 
@@ -147,12 +1279,7 @@ def writepro(filename, line_ind, wvlen, StkI, StkQ, StkU, StkV):
     writepro(filename, line_ind, wvlen, StkI, StkQ, StkU, StkV)
     """
 
-    f = open(filename, "w+")
-
-    for k in range(0, len(line_ind)):
-        f.write('     {0}   {1:> 10.4f}  {2:> 8.6e} {3:> 8.6e} {4:> 8.6e} {5:> 8.6e} \n'.format(line_ind[k], wvlen[k], StkI[k], StkQ[k], StkU[k], StkV[k]))
-
-    f.close()
+    _writebuffer(filename, _profiletext(line_ind, wvlen, StkI, StkQ, StkU, StkV))
 
     return()
 
@@ -164,19 +1291,57 @@ def writemod(filename, tau, temp, Pe, vmic, B, vlos, gamma, phi, vmac, ff, stray
     writemod(filename, tau, temp, Pe, vmic, B, vlos, gamma, phi, vmac, ff, stray, z=z, rho=rho, Pg = Pg)
     """
 
-    f = open(filename, "w+")
-    f.write('  {0:> 10.8f}      {1:> 10.8f}      {2:> 10.8f} \n'.format(vmac, ff, stray))
+    _writebuffer(filename, _modeltext(tau, temp, Pe, vmic, B, vlos, gamma, \
+                                      phi, vmac, ff, stray, z=z, rho=rho, Pg=Pg))
 
-    if z is None:
-        for k in range(0, len(tau)):
-            f.write(' {0:> 7.4f}  {1:> 6.1f} {2:> 8.5E} {3:> 5.3E} {4:> 6.4E} {5:> 6.4E} {6:> 6.4E} {7:> 6.4E} \n'.format(tau[k], temp[k], Pe[k], vmic[k], B[k], vlos[k], gamma[k], phi[k]))
+    return()
 
-    else:
-        if z is not None and Pg is not None and rho is not None:
-            for k in range(0, len(tau)):
-                f.write(' {0:> 7.4f}  {1:> 6.1f} {2:> 8.5E} {3:> 5.3E} {4:> 6.4E} {5:> 6.4E} {6:> 6.4E} {7:> 6.4E} {8:> 6.4E} {9:> 6.4E} {10:> 6.4E} \n'.format(tau[k], temp[k], Pe[k], vmic[k], B[k], vlos[k], gamma[k], phi[k], z[k], rho[k], Pg[k]))
+def _stack(x, nfiles, ndim_file):
 
-    
-    f.close()
+    # Returns x as a sequence with one entry per file. Values with the
+    # dimension of a single file entry (ndim_file) are shared by all files.
+    from numpy import ndim
+
+    if x is None or ndim(x) == ndim_file:
+        return([x]*nfiles)
+    if len(x) != nfiles:
+        raise ValueError('Expected {0} stacked entries, got {1}'.format(\
+            nfiles, len(x)))
+    return(x)
+
+def writepros(filenames, line_ind, wvlen, StkI, StkQ, StkU, StkV):
+    """ 
+    Writes N Stokes profiles at once. StkI, StkQ, StkU, StkV are (N, nwav)
+    arrays; line_ind and wvlen can be (N, nwav) or a single grid shared by
+    all files.
+    Call:
+    writepros(filenames, line_ind, wvlen, StkI, StkQ, StkU, StkV)
+    """
+
+    nfiles = len(filenames)
+    columns = [_stack(x, nfiles, 1) for x in (line_ind, wvlen, StkI, StkQ, \
+                                              StkU, StkV)]
+    for jj in range(0, nfiles):
+        _writebuffer(filenames[jj], _profiletext(*[c[jj] for c in columns]))
+
+    return()
+
+def writemods(filenames, tau, temp, Pe, vmic, B, vlos, gamma, phi, vmac, ff, stray, z=None, rho=None, Pg=None):
+    """ 
+    Writes N atmospheric models at once. The depth dependent variables are
+    (N, ndepth) arrays (tau can be a single grid shared by all models);
+    vmac, ff and stray are scalars or length N sequences.
+    Call:
+    writemods(filenames, tau, temp, Pe, vmic, B, vlos, gamma, phi, vmac, ff, stray, z=z, rho=rho, Pg = Pg)
+    """
+
+    nfiles = len(filenames)
+    columns = [_stack(x, nfiles, 1) for x in (tau, temp, Pe, vmic, B, vlos, \
+                                              gamma, phi)]
+    columns += [_stack(x, nfiles, 0) for x in (vmac, ff, stray)]
+    extra = [_stack(x, nfiles, 1) for x in (z, rho, Pg)]
+    for jj in range(0, nfiles):
+        _writebuffer(filenames[jj], _modeltext(*[c[jj] for c in columns], \
+            z=extra[0][jj], rho=extra[1][jj], Pg=extra[2][jj]))
 
     return()
@@ -0,0 +1,63 @@
+"""
+Statistical summary of many runs (sirplot.aggregate_runs).
+
+Call:
+    python -m pytest tests
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import sirplot as sp
+import sirtools2 as st
+
+
+class AggregateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        st.set_memory_cache(0)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def aggregate(self, names):
+        return(sp.aggregate_runs(names, self.directory+'/', \
+                                 [0]*len(names), [1]*len(names), \
+                                 percentiles=(50,), chunk=2, workers=1))
+
+    def write_models(self, z):
+        # Three 11 column models with the z column z(jj) of model jj
+        names = []
+        tau = np.linspace(1., -4., 40)
+        for jj in range(0, 3):
+            names.append('run{0}'.format(jj))
+            columns = [5000.+1000.*tau] + [np.ones(40)]*6
+            st.writemod(os.path.join(self.directory, names[-1]+'.mod'), \
+                        tau, *(columns + [1., 0.5, 0., z(jj), np.ones(40), \
+                                          np.ones(40)]))
+        return(names)
+
+    def test_zero_z_with_nan_is_not_a_z_scale(self):
+        # zero, with NaN where a model has no value
+        def z(jj):
+            column = np.zeros(40)
+            column[10*jj+5] = np.nan
+            return(column)
+        summary = self.aggregate(self.write_models(z))
+        self.assertEqual(summary['failures'], [])
+        self.assertEqual(summary['nmod'], 3)
+        self.assertFalse(summary['is_z'])
+
+    def test_models_with_z(self):
+        z = lambda jj: 100.*np.linspace(0., 5., 40)
+        self.assertTrue(self.aggregate(self.write_models(z))['is_z'])
+
+if __name__ == '__main__':
+    unittest.main()
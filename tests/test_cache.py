@@ -0,0 +1,122 @@
+"""
+Invalidation of the binary cache of parsed files (sirtools2.set_cache).
+
+Call:
+    python -m pytest tests
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import sirtools2 as st
+
+
+def write_profile(filename, scale=1., nwav=50):
+    wvlen = np.linspace(-500., 500., nwav)
+    line_ind = np.ones(nwav)
+    stokes = [scale*np.exp(-(wvlen/200.)**2)*(k+1) for k in range(0, 4)]
+    st.writepro(filename, line_ind, wvlen, *stokes)
+
+def write_model(filename, scale=1., ndepth=40):
+    tau = np.linspace(1., -4., ndepth)
+    columns = [scale*(5000.+1000.*tau)] + [scale*np.ones(ndepth)]*6
+    st.writemod(filename, tau, *(columns + [1., 0.5, 0.]))
+
+
+class CacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = os.path.join(self.directory, 'cache')
+        st.set_memory_cache(0)
+        st.set_cache(self.cache)
+
+    def tearDown(self):
+        st.set_cache(None)
+        shutil.rmtree(self.directory)
+
+    def entries(self, ext='.npy'):
+        return([name for name in os.listdir(self.cache) \
+                if name.endswith(ext)])
+
+    def test_rewritten_file_is_parsed_again(self):
+        per = os.path.join(self.directory, 'run.per')
+        mod = os.path.join(self.directory, 'run.mod')
+        write_profile(per, 1.)
+        write_model(mod, 1.)
+        first = st.readpro(per).StkI.max(), st.readmod(mod).temp.max()
+        write_profile(per, 2.)
+        write_model(mod, 2.)
+        self.assertAlmostEqual(st.readpro(per).StkI.max(), 2*first[0], 5)
+        self.assertAlmostEqual(st.readmod(mod).temp.max(), 2*first[1], 2)
+
+    def test_changed_size_or_mtime_misses(self):
+        per = os.path.join(self.directory, 'run.per')
+        write_profile(per, 1.)
+        st.readpro(per)
+        self.assertEqual(len(self.entries()), 1)
+        st.readpro(per) # hit: no new entry
+        self.assertEqual(len(self.entries()), 1)
+        stat = os.stat(per)
+        os.utime(per, ns=(stat.st_atime_ns, stat.st_mtime_ns+10**9))
+        st.readpro(per)
+        self.assertEqual(len(self.entries()), 2)
+        with open(per, 'a') as f: # same values, one more byte
+            f.write('\n')
+        st.readpro(per)
+        self.assertEqual(len(self.entries()), 3)
+
+    def test_read_parameters_have_their_own_entries(self):
+        per = os.path.join(self.directory, 'run.per')
+        write_profile(per, nwav=50)
+        whole = st._readblock(per)
+        skipped = st._readblock(per, skiprows=1) # first line as header
+        self.assertEqual(len(self.entries()), 2)
+        self.assertEqual(whole[1].shape[1], 50)
+        self.assertEqual(skipped[1].shape[1], 49)
+        self.assertEqual(len(skipped[0]), 1)
+        self.assertEqual(st._readblock(per, skiprows=1)[1].shape[1], 49)
+
+    def test_damaged_entries_are_parsed_again(self):
+        mod = os.path.join(self.directory, 'run.mod')
+        write_model(mod)
+        expected = np.array(st.readmod(mod).temp)
+        npy = os.path.join(self.cache, self.entries()[0])
+        hdr = npy[:-4]+'.hdr'
+        with open(npy, 'rb') as f:
+            data = f.read()
+        damages = [(npy, data[:len(data)//2]), # partly written block
+                   (npy, b'not a numpy file'),
+                   (hdr, ''),                  # partly written header
+                   (hdr, None)]                # header missing
+        for path, content in damages:
+            if content is None:
+                os.remove(path)
+            else:
+                with open(path, 'wb' if path == npy else 'w') as f:
+                    f.write(content)
+            np.testing.assert_array_equal(st.readmod(mod).temp, expected)
+
+    def test_eviction_keeps_the_cache_under_max_bytes(self):
+        max_bytes = 20*2**10
+        st.set_cache(self.cache, max_bytes=max_bytes)
+        for jj in range(0, 30):
+            per = os.path.join(self.directory, 'run{0}.per'.format(jj))
+            write_profile(per, nwav=200)
+            st.readpro(per)
+            size = sum([os.path.getsize(os.path.join(self.cache, name)) \
+                        for name in self.entries()])
+            self.assertLessEqual(size, max_bytes)
+        self.assertGreater(len(self.entries()), 0)
+        self.assertEqual(len(self.entries()), len(self.entries('.hdr')))
+        self.assertEqual(self.entries('.tmp'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
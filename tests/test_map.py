@@ -0,0 +1,191 @@
+"""
+Raster maps, one file per pixel (sirtools2.mapfiles and readmap).
+
+Call:
+    python -m pytest tests
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+import sirplot as sp
+import sirtools2 as st
+from test_cache import write_profile, write_model
+
+
+def write_map(directory, ext, write, ny=2, nx=3):
+    # Files inv_YYYY_XXXX.ext of a ny x nx map, pixel y, x written by
+    # write(filename, scale) with scale 1+y*nx+x
+    names = []
+    for y in range(0, ny):
+        for x in range(0, nx):
+            names.append(os.path.join(directory, \
+                         'inv_{0:04d}_{1:04d}{2}'.format(y, x, ext)))
+            write(names[-1], 1.+y*nx+x)
+    return(names)
+
+
+class MapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        st.set_memory_cache(0)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_profile_map_is_read_and_resumed(self):
+        write_map(self.directory, '.per', write_profile)
+        out = os.path.join(self.directory, 'cube')
+        maps = st.readmap(self.directory, '.per', out=out)
+        self.assertEqual(maps['failures'], [])
+        self.assertTrue(maps['mask'].all())
+        self.assertEqual(maps['data'].shape, (2, 3, 50, 4))
+        np.testing.assert_allclose(maps['data'][1, 2], \
+                                   6*maps['data'][0, 0], rtol=1e-5)
+
+    def test_interrupted_profile_map_is_resumed(self):
+        write_map(self.directory, '.per', write_profile)
+        out = os.path.join(self.directory, 'cube')
+        cancel = threading.Event()
+        def progress(ndone, ntotal):
+            if ndone > 2: # during the second chunk
+                cancel.set()
+        maps = st.readmap(self.directory, '.per', out=out, chunk=2, \
+                          workers=1, progress=progress, cancel=cancel)
+        self.assertFalse(maps['complete'])
+        self.assertEqual(int(maps['mask'].sum()), 2)
+        del maps
+        again = st.readmap(self.directory, '.per', out=out, chunk=2)
+        self.assertTrue(again['complete'])
+        self.assertEqual(again['failures'], [])
+        self.assertTrue(again['mask'].all())
+        np.testing.assert_allclose(again['data'][1, 2], \
+                                   6*again['data'][0, 0], rtol=1e-5)
+    def test_mapfiles(self):
+        names = write_map(self.directory, '.per', write_profile, 2, 2)
+        os.rename(names[3], names[3]+'.gz') # not opened by mapfiles
+        for name in ('notes.per', 'inv_0001_0001.mod', 'inv_0003.per'):
+            open(os.path.join(self.directory, name), 'w').close()
+        pixels = st.mapfiles(self.directory, '.per')
+        self.assertEqual([(y, x) for y, x, name in pixels], \
+                         [(0, 0), (0, 1), (1, 0), (1, 1)])
+        self.assertEqual(pixels[3][2], names[3]+'.gz')
+        pixels = st.mapfiles(self.directory, '.per', \
+                             pattern=r'inv_(?P<x>\d+)_(?P<y>\d+)$')
+        self.assertEqual(pixels[1][2], names[2]) # x and y swapped
+
+    def test_pixels_with_another_grid_are_not_read(self):
+        names = write_map(self.directory, '.per', write_profile)
+        write_profile(names[4], nwav=40) # fewer points
+        wvlen = np.linspace(-400., 400., 50) # as many points, other values
+        st.writepro(names[5], np.ones(50), wvlen, *([np.ones(50)]*4))
+        maps = st.readmap(self.directory, '.per')
+        failures = dict(maps['failures'])
+        self.assertEqual(sorted(failures), names[4:6])
+        self.assertIn('Different wavelengths', str(failures[names[5]]))
+        self.assertEqual(maps['mask'].tolist(), \
+                         [[True, True, True], [True, False, False]])
+        self.assertTrue(np.isnan(maps['data'][1, 1:]).all())
+        np.testing.assert_allclose(maps['grid'][1], \
+                                   np.linspace(-500., 500., 50), rtol=1e-5)
+
+    def test_model_map(self):
+        write_map(self.directory, '.mod', write_model)
+        maps = st.readmap(self.directory, '.mod', dtype='float32')
+        self.assertEqual(maps['data'].shape, (2, 3, 40, 8))
+        self.assertEqual(maps['data'].dtype, np.float32)
+        self.assertIsNone(maps['grid'])
+        np.testing.assert_allclose(maps['scalars'][1, 2], [1., 0.5, 0.])
+        np.testing.assert_allclose(maps['data'][1, 2, :, 0], \
+                                   np.linspace(1., -4., 40), atol=1e-4)
+        np.testing.assert_allclose(maps['data'][1, 2, :, 1], \
+                                   6*maps['data'][0, 0, :, 1], rtol=1e-4)
+
+    def test_checkpoint_is_written_chunk_by_chunk(self):
+        names = write_map(self.directory, '.mod', write_model)
+        out = os.path.join(self.directory, 'cube')
+        cancel = threading.Event()
+        def progress(ndone, ntotal):
+            if ndone > 4: # during the third chunk
+                cancel.set()
+        st.readmap(self.directory, '.mod', out=out, chunk=2, workers=1, \
+                   progress=progress, cancel=cancel)
+        mask = np.load(out+'_mask.npy')
+        self.assertEqual(mask.tolist(), \
+                         [[True, True, True], [True, False, False]])
+        data = np.load(out+'.npy', mmap_mode='r')
+        self.assertEqual(data.shape, (2, 3, 40, 8))
+        self.assertTrue(np.isnan(data[1, 1:]).all())
+        del data
+        # resumed: only the missing pixels are read
+        done = []
+        maps = st.readmap(self.directory, '.mod', out=out, chunk=2, \
+                          progress=lambda ndone, ntotal: done.append(ndone))
+        self.assertEqual(done[0], 4)
+        self.assertTrue(maps['mask'].all())
+        self.assertIsInstance(maps['data'], np.memmap)
+        # other files: the checkpoint is not used
+        os.remove(names[0])
+        done = []
+        maps = st.readmap(self.directory, '.mod', out=out, chunk=2, \
+                          progress=lambda ndone, ntotal: done.append(ndone))
+        self.assertEqual(done[0], 0)
+        self.assertEqual(maps['mask'].tolist(), \
+                         [[False, True, True], [True, True, True]])
+
+
+class LoadMapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.mapdir = os.path.join(self.directory, 'map')
+        os.mkdir(self.mapdir)
+        self.cache_dir = config.cache_dir
+        st.set_memory_cache(0)
+
+    def tearDown(self):
+        config.cache_dir = self.cache_dir
+        shutil.rmtree(self.directory)
+
+    def test_profile_and_model_map(self):
+        write_map(self.mapdir, '.per', write_profile)
+        write_map(self.mapdir, '.mod', write_model)
+        files = sorted(os.listdir(self.mapdir))
+        config.cache_dir = os.path.join(self.directory, 'cache')
+        maps = sp.load_map(self.mapdir)
+        self.assertEqual(maps['failures'], [])
+        self.assertTrue(maps['per']['mask'].all())
+        self.assertTrue(maps['mod']['mask'].all())
+        self.assertFalse(np.isnan(maps['per']['data']).any())
+        self.assertEqual(len(maps['limits']['stokes_limits']), 4)
+        self.assertEqual(len(maps['limits']['lower_limits']), 11)
+        # the arrays are in the cache, not in the directory of the map
+        self.assertEqual(sorted(os.listdir(self.mapdir)), files)
+        self.assertTrue(len(os.listdir(os.path.join(config.cache_dir, \
+                                                    'maps'))) > 0)
+        runs = sp.pixel_runs(maps, 1, 2)
+        self.assertEqual(runs[1], ['inv_0001_0002'])
+        self.assertEqual(runs[2:], ([1], [1]))
+
+    def test_map_kept_in_memory_without_cache_dir(self):
+        write_map(self.mapdir, '.per', write_profile)
+        files = sorted(os.listdir(self.mapdir))
+        config.cache_dir = ''
+        maps = sp.load_map(self.mapdir)
+        self.assertEqual(maps['failures'], [])
+        self.assertIsNone(maps['mod'])
+        self.assertTrue(maps['per']['mask'].all())
+        self.assertEqual(sorted(os.listdir(self.mapdir)), files)
+
+
+if __name__ == '__main__':
+    unittest.main()
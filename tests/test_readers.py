@@ -0,0 +1,76 @@
+"""
+Arrays returned by the readers of sirtools2 (readpro, readmod, readfiles).
+
+Call:
+    python -m pytest tests
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import sirtools2 as st
+from test_cache import write_profile, write_model
+
+
+class ReadersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        st.set_memory_cache(64*2**20)
+
+    def tearDown(self):
+        st.set_memory_cache(0)
+        shutil.rmtree(self.directory)
+
+    def test_grids_are_writeable_unless_shared(self):
+        names = [os.path.join(self.directory, 'run{0}.per'.format(jj)) \
+                 for jj in range(0, 2)]
+        for name in names:
+            write_profile(name)
+        ngrids = len(st._grids)
+        first, second = [st.readpro(name) for name in names]
+        self.assertEqual(len(st._grids), ngrids) # not interned
+        self.assertTrue(first.wvlen.flags.writeable)
+        self.assertIsNot(first.wvlen, second.wvlen)
+        first.wvlen[0] = 1e6 # the file read again is not changed
+        self.assertNotEqual(st.readpro(names[0]).wvlen[0], 1e6)
+        first, second = [st.readpro(name, share_grids=True) \
+                         for name in names]
+        self.assertIs(first.wvlen, second.wvlen)
+        self.assertFalse(first.line_ind.flags.writeable)
+        (data, error), = st.readfiles(names[:1], workers=1)
+        self.assertTrue(data.wvlen.flags.writeable)
+
+    def test_files_without_rows_are_reported(self):
+        per = os.path.join(self.directory, 'empty.per')
+        mod = os.path.join(self.directory, 'header.mod')
+        open(per, 'w').close()
+        with open(mod, 'w') as f:
+            f.write('  1.0  1.0  0.0\n\n')
+        self.assertRaises(IOError, st.readpro, per)
+        self.assertRaises(IOError, st.readmod, mod)
+        results = st.readfiles([per, mod], workers=1)
+        self.assertEqual([data for data, error in results], [None, None])
+        self.assertTrue(all([isinstance(error, IOError) \
+                             for data, error in results]))
+
+    def test_missing_columns_of_models(self):
+        mod = os.path.join(self.directory, 'run.mod')
+        write_model(mod)
+        model = st.readmod(mod)
+        self.assertFalse(model.has_z)
+        self.assertEqual(model.scaled()[8].sum(), 0.)
+        self.assertEqual(len(model._columns), 11) # not allocated yet
+        model.z[:] = 1.
+        self.assertEqual(model.z.sum(), 40.)
+        self.assertEqual(model.rho.sum() + model.Pg.sum(), 0.)
+        self.assertEqual(len(model), 14)
+        self.assertIs(tuple(model)[11], model.z)
+
+
+if __name__ == '__main__':
+    unittest.main()
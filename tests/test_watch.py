@@ -0,0 +1,53 @@
+"""
+Cycles of running inversions (sirplot.RunWatch and run_cycles).
+
+Call:
+    python -m pytest tests
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import sirplot as sp
+
+
+class CyclesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, names):
+        for name in names:
+            with open(os.path.join(self.directory, name), 'w') as f:
+                f.write('1\n')
+
+    def frames(self, legend_names, cycle_pattern=None):
+        return([(cycle, runs[1]) for cycle, runs in \
+                sp.run_cycles(self.directory+'/', legend_names, \
+                              cycle_pattern)])
+
+    def test_cycles_of_a_run(self):
+        self.write(['run_1.per', 'run_2.per', 'run_10.per'])
+        self.assertEqual(self.frames(['run_1']), \
+                         [(1, ['run_1']), (2, ['run_2']), (10, ['run_10'])])
+
+    def test_map_pixels_are_not_cycles(self):
+        self.write(['pix_0012_0034.per', 'pix_0012_0035.per'])
+        self.assertEqual(self.frames(['pix_0012_0034', 'pix_0012_0035']), \
+                         [(0, ['pix_0012_0034', 'pix_0012_0035'])])
+
+    def test_cycle_pattern_of_the_caller(self):
+        self.write(['run.c1.per', 'run.c2.per'])
+        self.assertEqual(self.frames(['run.c1'], r'\.c(?P<cycle>\d+)'), \
+                         [(1, ['run.c1']), (2, ['run.c2'])])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,11 @@
 import config
 from loader import*
+from plotloader import *
+import sirplot as sp
 
 class VisualizationCanvas(Toplevel):
 
-    def __init__(self, parent, title="Stokes Plots"):
+    def __init__(self, parent, title="Stokes Plots", runs=None, limits=None):
 
         Toplevel.__init__(self, parent)
         self.__parent = parent
@@ -14,233 +16,308 @@ class VisualizationCanvas(Toplevel):
         self.__body = body
         self.initial_focus = self.__body
         body.pack(padx = 5, pady= 5)
+        self.protocol("WM_DELETE_WINDOW", self.__close)
+
+        # Figure shown in the window. It is kept, and updated in place, when
+        # the user plots again or toggles the height scale.
+        self.__model = None
+        self.__data = None
+        self.__worker = None
+        # Files plotted, if not those selected in the main window, and
+        # limits of the figure, if not those of the files (see replot)
+        self.__runs = runs
+        self.__limits = limits
+        self.__watch = None # sirplot.RunWatch of the runs, in watch mode
+
         self.__buttonbox(body)
-        self.__canvas(body)
-        # enter a local event loop, do not return until the window is destroyed
-        self.wait_window(self)
-        
-        
+        self.replot()
+
+
     # -------------------------------------------------------------------
     def __buttonbox(self, body):
-        ''' Add the Close buttons to the canvas.
+        ''' Add the Close buttons, progress bar and Cancel button to the canvas.
         '''
 
         w = Button(body, text="Close", width=10, \
                    command=self.__close)
         w.pack(side=LEFT, padx=5, pady=5)
-        
+        w = Button(body, text="Cycles", width=10, \
+                   command=self.__animate)
+        w.pack(side=LEFT, padx=5, pady=5)
+        self.__cachelabel = Label(body, text='')
+        self.__cachelabel.pack(side=LEFT, padx=5, pady=5)
+
+        self.__progressbar = Progressbar(body, orient=HORIZONTAL, \
+                                         length=200, mode='determinate')
+        self.__cancelbutton = Button(body, text="Cancel", width=10, \
+                                     command=self.__cancel_load)
+
+    # -------------------------------------------------------------------
+    def __cache_status(self):
+        ''' Show the usage of the in-memory store of parsed files.
+        '''
+
+        info = st.memory_cache_info()
+        if info['max_bytes'] > 0:
+            self.__cachelabel.config(text='Cache: {0} files, {1:.1f} MB, '\
+                '{2} hits, {3} misses'.format(info['entries'], \
+                info['nbytes']/2.**20, info['hits'], info['misses']))
+
     # -------------------------------------------------------------------
+    def replot(self, runs=None, now=False, limits=None):
+        ''' Plot the current selection of files and parameters. The files are
+        read (and, the first time, the figure is built) in a loading thread;
+        an existing figure is then updated in place. runs, a tuple
+        (file_path, legend_names, per_mask, mod_mask), replaces the files
+        selected in the main window, as for the pixels of a map window;
+        limits, a dictionary with lower_limits, upper_limits and
+        stokes_limits (see sirplot.load_map), replaces the limits of the
+        files, so that the axes stay the same from one pixel to the next.
+        With now, the files are read in the Tk main thread, which is faster
+        for a few files already in the in-memory store.
+        In watch mode, all the cycles of the selected runs are plotted, and
+        the plot is updated as new cycles are written.
+        '''
 
-    def __canvas(self, body):
-
-        Nfiles = len(config.legend_names)
-        
-        # Variables that will contain the data to plot:
-        Stokes = []
-        Models = []
-        Errors = []
-        ErrorFileMask=[] # Mask variable for error files
-        # Variable that captures if all models contain a z-scale column
-        is_z = True
-        # ---- Read files in list of files
-        for jj in np.arange(0,Nfiles):
-            try: # Read Stokes profiles files
-                line_ind, wvlen, StkI, StkQ, StkU, StkV = \
-                  st.readpro(config.file_path+config.legend_names[jj]+'.per')
-                Stokes.append([StkI, StkQ, StkU, StkV])              
-            except:
-                print('No .per file for ', config.file_path+config.legend_names[jj])
-                          
-            try: # Read Model files 
-                tau, temp, Pe, vmic, B, vlos, gamma, phi, vmac, ff, stray,z, \
-                  rho, Pg = st.readmod(config.file_path+config.legend_names[jj]+'.mod')
-                Models.append([tau,temp/1e3,Pe,vmic/1e5,B/1e3,vlos/1e5,gamma,phi,\
-                                   z/1e3,rho,Pg])
-                
-                # Check if new model contains a z-scale column. Update is_z.
-                is_z = is_z and (np.absolute(z).sum() !=0)
-            except:
-                print('No .mod file for ', config.file_path+config.legend_names[jj])
-                          
-            # If the error button is checked, then read error files
-            if config.checks['err'].get(): 
-                try: # reading error file
-                    tau,temp,Pe,vmic,B,vlos,gamma,phi,vmac,ff,stray,z,rho,Pg=\
-                      st.readmod(config.file_path+\
-                                     config.legend_names[jj]+".err")
-                    Errors.append([tau,temp/1e3,Pe,vmic/1e5,B/1e3,vlos/1e5,\
-                                    gamma,phi,z,rho,Pg])
-                    ErrorFileMask.append(1)
-                except: # corresponding error file does not exist
-                    ErrorFileMask.append(0)
-                    print('No .err file for ', config.file_path+config.legend_names[jj])
-                    
-
-        # Calculate default figure limits
-        model_array = np.array(Models)
-        config.lower_limits = []
-        config.upper_limits = []
-        for jj in range(0,11):
-            #datamin = model_array[:,jj].min()
-            #datamax = model_array[:,jj].max()
-            if len(model_array) == 0:
-                datamin = 0.0
-                datamax = 0.0
-            else:
-                datamin = model_array[:,jj].min()*0.9
-                datamax = model_array[:,jj].max()*1.1
-            if datamin == datamax:
-                datamax = datamin+1
-                datamin -= 1
-            config.lower_limits.append(datamin)
-            config.upper_limits.append(datamax)
-            
-        # Set the toggle to z again, should the user have requested z-scale but not
-        # all models have z columns
-        if config.checks['toggle'].get()==(u'\u03C4'+'  scale') and not(is_z):
+        if runs is not None:
+            self.__runs = runs
+        if limits is not None:
+            self.__limits = limits
+        if self.__runs is not None:
+            file_path, legend_names, per_mask, mod_mask = self.__runs
+        else:
+            file_path, legend_names, per_mask, mod_mask = config.file_path, \
+              config.legend_names, config.per_mask, config.mod_mask
+
+        # ---- Watch mode: the files of the runs found by the watch
+        if config.checks['watch'].get():
+            if self.__watch is None or \
+               self.__watch.selection != (file_path, list(legend_names)):
+                self.__watch = sp.RunWatch(file_path, legend_names)
+                self.after(config.watch_interval, self.__poll_watch, \
+                           self.__watch)
+            if self.__watch.runs is not None:
+                file_path, legend_names, per_mask, mod_mask = \
+                  self.__watch.runs
+        else:
+            self.__watch = None
+
+        self.__start(file_path, legend_names, per_mask, mod_mask, now)
+
+    # -------------------------------------------------------------------
+    def __poll_watch(self, watch):
+        ''' Runs in the Tk main thread every config.watch_interval ms while
+        in watch mode: plots the new or changed files of the runs.
+        '''
+
+        if not self.winfo_exists() or watch is not self.__watch:
+            return
+        if not config.checks['watch'].get():
+            self.__watch = None
+            return
+        if self.__worker is None or not self.__worker.is_alive():
+            runs = watch.poll()
+            if runs is not None:
+                self.__start(*runs)
+        self.after(config.watch_interval, self.__poll_watch, watch)
+
+    # -------------------------------------------------------------------
+    def __start(self, file_path, legend_names, per_mask, mod_mask, \
+                now=False):
+        ''' Read the given runs and plot them (see replot).
+        '''
+
+        if self.__worker is not None and self.__worker.is_alive():
+            self.__cancel.set() # a newer selection replaces this load
+
+        # Snapshot of the selection: the worker thread must not touch Tk
+        self.__selection = {'legend_names': list(legend_names), \
+                            'file_path': file_path, \
+                            'per_mask': list(per_mask), \
+                            'mod_mask': list(mod_mask), \
+                            'stokes_chks': list(config.stokes_chks), \
+                            'model_chks': list(config.model_chks), \
+                            'read_err': config.checks['err'].get(), \
+                            'summary': config.checks['summary'].get(), \
+                            'split_lines': config.checks['lines'].get(), \
+                            'dtype': config.load_dtype, \
+                            'limits': self.__limits, \
+                            'zscale': (config.checks['toggle'].get() == \
+                                       (u'\u03C4'+'  scale'))}
+
+        # State shared with the loading thread
+        self.__cancel = threading.Event()
+        self.__nfiles = [0, 0] # files read, total files
+        self.__result = None   # (data, figure model or None) once loaded
+        self.__error = None    # exception raised while loading, if any
+
+        if now and self.__model is not None:
+            self.__worker = None
+            self.__load(self.__cancel)
+            self.__poll(self.__cancel)
+            return
+
+        self.__progressbar.config(value=0)
+        self.__progressbar.pack(side=LEFT, padx=5, pady=5)
+        self.__cancelbutton.config(state=NORMAL)
+        self.__cancelbutton.pack(side=LEFT, padx=5, pady=5)
+
+        self.__worker = threading.Thread(target=self.__load, \
+                                         args=(self.__cancel,))
+        self.__worker.daemon = True
+        self.__worker.start()
+        self.after(50, self.__poll, self.__cancel)
+
+    # -------------------------------------------------------------------
+    def set_zscale(self, zscale):
+        ''' Switch the model panels between z and log(tau) scales, in place.
+        '''
+
+        if self.__model is None:
+            return
+        self.__selection['zscale'] = zscale
+        self.__model.redraw(self.__model.set_zscale(zscale))
+        self.__check_zscale()
+
+    # -------------------------------------------------------------------
+    def __check_zscale(self):
+        ''' Set the toggle to z again, should the user have requested
+        z-scale but not all models have z columns.
+        '''
+
+        if config.checks['toggle'].get()==(u'\u03C4'+'  scale') and \
+           not(self.__data['is_z']):
             config.checks['toggle'].set('z scale')
 
-        
-        # Number of rows and columns for subplots
-        Nrows = int(np.floor(np.sqrt(config.total_chks+1)))
-        Ncols = int(np.ceil(float(config.total_chks+1)/Nrows))
-        # ---- Create Figure
-        plt.close('all')
-        sir_fig = plt.figure()
-        sir_fig.clear()
-        Nplot = 0
-        
-        # ---- First plot the Stokes parameters
-        for k in range(0,4): 
-            if config.stokes_chks[k]:
-                Nplot = Nplot+1
-                axstks = sir_fig.add_subplot(Nrows, Ncols, Nplot)
-                axstks.set_title(config.AllStokesTitles[k], \
-                                     fontsize=config.figfontsize)
-
-                file_ctr = 0 # Count number of non-existing Stokes files,
-                # so that the filename index jj is consistent for Stokes
-                # variable (could have fewer Stokes files than model files)
-                
-                # ---- Loop through different profile files:
-                for jj in np.arange(0,Nfiles): 
-                    if config.per_mask[jj]:
-                        axstks.plot(Stokes[jj-file_ctr][k], \
-                                        color = config.colorlist[jj], \
-                                        label=config.legend_names[jj],\
-                                        linewidth=0.9)
-                        axstks.set_xlabel(r'$\Delta\lambda$(Arb. units)',\
-                                              fontsize='small')
-                        axstks.tick_params(axis='both', labelsize='small')
-                        #if sys.version_info[0] < 3:
-                        #   plt.locator_params(axis='both', nbins=5)
-
-                    else:
-                        file_ctr = file_ctr + 1
-                handles1, labels1 = axstks.get_legend_handles_labels()
-
-                        
-        # ---- Now plot the atmospheric model parameters                    
-        for k in range(0,7): # Model parameters
-            if config.model_chks[k]:
-                Nplot = Nplot+1
-                axstks = sir_fig.add_subplot(Nrows, Ncols, Nplot)
-                axstks.set_title(config.AllModelTitles[k], \
-                                     fontsize=config.figfontsize)
-                file_ctr = 0
-
-                # ---- Loop through different model files:
-                for jj in np.arange(0,Nfiles):
-                    if config.mod_mask[jj]: # Model file exists, plot model
-
-                        # Plot in z-scale, if column exists and toggle says so
-                        if (config.checks['toggle'].get() == (u'\u03C4'+'  scale')):
-                            
-                            # plot with errorbars:
-                            if config.checks['err'].get() and ErrorFileMask[jj]:
-                                # Some .mod files might not have associated .err files 
-                                tot_err_files = np.sum(np.array(ErrorFileMask[:jj]))
-                                # number of missing error files
-                                missing = int(jj - tot_err_files) 
-                                axstks.errorbar(Models[jj-file_ctr][8], \
-                                                    #Models[jj][k+1], \
-                                                    Models[jj-file_ctr][k+1], \
-                                                    yerr=Errors[jj-file_ctr-missing][k+1],\
-                                                    label=config.legend_names[jj],\
-                                                    color = config.colorlist[jj],\
-                                                    fmt='-',linewidth=0.7)
-                                axstks.set_xlabel('z (Mm)',fontsize='small')
-
-                            else: #plot without errors
-                                axstks.plot(Models[jj-file_ctr][8], \
-                                                Models[jj-file_ctr][k+1], \
-                                                label=config.legend_names[jj],\
-                                                color = config.colorlist[jj], \
-                                                linewidth=0.9)
-                                axstks.set_xlabel('z (Mm)',fontsize='small')
-                 
-                            plt.axis([config.lower_limits[8],\
-                                          config.upper_limits[8],\
-                                          config.lower_limits[k+1],\
-                                          config.upper_limits[k+1]])      
-
-                        else: # Plot in tau-scale (because user request through
-                            # toggle or because z column does not exist)
-                            # plot with errorbars:
-
-                            if config.checks['err'].get() and ErrorFileMask[jj]:
-                                # Some .mod files might not have associated .err files 
-                                tot_err_files = np.sum(np.array(ErrorFileMask[:jj]))
-                                # Number of missing error files
-                                missing = int(jj - tot_err_files)
-                                axstks.errorbar(Models[jj-file_ctr][0], \
-                                                    #Models[jj][k+1], \
-                                                    Models[jj-file_ctr][k+1], \
-                                                    yerr=Errors[jj-file_ctr-missing][k+1],\
-                                                    label=config.legend_names[jj],\
-                                                    color = config.colorlist[jj],\
-                                                    fmt='-',linewidth=0.7)
-                                axstks.set_xlabel(r'log($\tau$)',\
-                                                        fontsize='small')
-                                        
-                            else: #plot without errors
-                                axstks.plot(Models[jj-file_ctr][0], \
-                                                Models[jj-file_ctr][k+1], \
-                                                label=config.legend_names[jj],\
-                                                color = config.colorlist[jj], \
-                                                linewidth=0.9)
-                                axstks.set_xlabel(r'log($\tau$)',\
-                                                      fontsize='small')
-                         
-                            plt.axis([config.lower_limits[0],\
-                                          config.upper_limits[0],\
-                                          config.lower_limits[k+1],\
-                                          config.upper_limits[k+1]])
-                        axstks.tick_params(axis='both', labelsize='small')
-
-                        if sys.version_info[0] < 3:
-                            plt.locator_params(axis='both', nbins=5)
-                        
-                    else:
-                        file_ctr = file_ctr + 1
-
-        handles, labels = axstks.get_legend_handles_labels()
-      
-        # Unify unique handles and lables from the Stokes and Model plots:
-        ind_counter = 0
-        for label in labels1:
-            if label in labels:
-                ind_counter += 1
+    # -------------------------------------------------------------------
+    def __progress(self, ndone, ntotal):
+        ''' Called from the loading thread after each file is read.
+        '''
+
+        self.__nfiles = [ndone, ntotal]
+
+    # -------------------------------------------------------------------
+    def __cancel_load(self):
+        ''' Stop loading. Closes the window if there is nothing to show yet.
+        '''
+
+        self.__cancel.set()
+        self.__cancelbutton.config(state=DISABLED)
+
+    # -------------------------------------------------------------------
+    def __load(self, cancel):
+        ''' Runs in the loading thread: reads the files and, if there is no
+        figure yet, builds it.
+        '''
+
+        selection = self.__selection
+        try:
+            if selection['summary']: # percentile bands of all the runs
+                data = sp.aggregate_runs(selection['legend_names'], \
+                                selection['file_path'], \
+                                selection['per_mask'], selection['mod_mask'],\
+                                workers=config.load_workers, \
+                                processes=config.load_processes, \
+                                progress=self.__progress, cancel=cancel, \
+                                dtype=selection['dtype'])
             else:
-                labels.append(label)
-                handles.append(handles1[ind_counter])
-                ind_counter += 1
+                data = sp.load_runs(selection['legend_names'], \
+                                selection['file_path'], \
+                                selection['per_mask'], selection['mod_mask'],\
+                                read_err=selection['read_err'], \
+                                workers=config.load_workers, \
+                                processes=config.load_processes, \
+                                progress=self.__progress, cancel=cancel, \
+                                dtype=selection['dtype'])
+            if data is not None and selection['limits'] is not None:
+                data.update(selection['limits'])
+            model = None
+            if data is not None and self.__model is None:
+                model = sp.FigureModel()
+                model.update(data, selection['legend_names'], \
+                             selection['stokes_chks'], \
+                             selection['model_chks'], \
+                             read_err=selection['read_err'], \
+                             zscale=selection['zscale'], \
+                             split_lines=selection['split_lines'])
+            result = (data, model)
+            error = None
+        except Exception as exception:
+            result = None
+            error = exception
+        if cancel is self.__cancel: # not replaced by a newer load
+            self.__result = result
+            self.__error = error
+
+    # -------------------------------------------------------------------
+    def __poll(self, cancel):
+        ''' Runs in the Tk main thread: updates the progress bar until the
+        loading thread is done, then shows or updates the figure.
+        '''
+
+        if not self.winfo_exists() or cancel is not self.__cancel:
+            return
+        ndone, ntotal = self.__nfiles
+        if ntotal > 0:
+            self.__progressbar.config(maximum=ntotal, value=ndone)
+        if self.__worker is not None and self.__worker.is_alive():
+            self.after(50, self.__poll, cancel)
+            return
+
+        self.__progressbar.pack_forget()
+        self.__cancelbutton.pack_forget()
+        if self.__cancel.is_set() or self.__error is not None:
+            if self.__error is not None:
+                tkMessageBox.showerror("Plot failed", str(self.__error), \
+                                       parent=self)
+            if self.__model is None:
+                self.__close()
+            return
+
+        data, model = self.__result
+        self.__data = data
+        config.lower_limits = data['lower_limits']
+        config.upper_limits = data['upper_limits']
+        if self.__model is None:
+            self.__model = model
+            self.__show(model.figure)
+        else:
+            selection = self.__selection
+            self.__model.redraw(self.__model.update(data, \
+                                selection['legend_names'], \
+                                selection['stokes_chks'], \
+                                selection['model_chks'], \
+                                read_err=selection['read_err'], \
+                                zscale=selection['zscale'], \
+                                split_lines=selection['split_lines']))
+        self.__check_zscale()
+        self.__report_failures(data['failures'])
+        self.__cache_status()
+
+    # -------------------------------------------------------------------
+    def __animate(self):
+        ''' Open an animation of the cycles of the runs plotted (see
+        animation.py), with frames of the size of this figure.
+        '''
 
-        plt.tight_layout()
-        # make the legend
-        plt.figlegend(handles, labels, bbox_to_anchor=[0.95, 0.2],\
-                          loc = 'lower right', ncol=1, \
-                          labelspacing=0.1,fontsize=8 )
+        if self.__model is None:
+            return
+        if self.__selection['summary']:
+            tkMessageBox.showinfo("No animation", "The cycles are animated "\
+                                  "for the runs, not for their summary", \
+                                  parent=self)
+            return
+        from animation import AnimationCanvas
+        sir_fig = self.__model.figure
+        AnimationCanvas(self, dict(self.__selection), \
+                        tuple(sir_fig.get_size_inches()), sir_fig.dpi, \
+                        title='Cycles: '+', '.join(\
+                        self.__selection['legend_names'][:3]))
+
+    # -------------------------------------------------------------------
+    def __show(self, sir_fig):
+        ''' Attach the figure to a Tk canvas in this window.
+        '''
 
         canvas = FigureCanvasTkAgg(sir_fig, self)
 
@@ -252,14 +329,27 @@ class VisualizationCanvas(Toplevel):
 
         toolbar.update()
         canvas._tkcanvas.pack(side=TOP, fill=BOTH, expand=True)
-    
+
+    # -------------------------------------------------------------------
+    def __report_failures(self, failures):
+        ''' Tell the user which files could not be read, and why.
+        '''
+
+        if len(failures) == 0:
+            return
+        lines = []
+        for filename, error in failures:
+            lines.append('{0}: {1}'.format(filename.rpartition('/')[2], error))
+        if len(lines) > 15:
+            lines = lines[:15] + ['... and {0} more'.format(len(lines)-15)]
+        tkMessageBox.showwarning("Files not read", '\n'.join(lines), \
+                                 parent=self)
 
     def __close(self, event=None):
         ''' Method that handles the window closing.
         '''
 
-        # put focus back to the parent window
-        plt.close('all')
+        # stop the loading thread, put focus back to the parent window
+        self.__cancel.set()
         self.__parent.focus_set()
         self.destroy()
-